@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+from scipy import sparse
+
+# Artifacts are written here together with a manifest of the fingerprints of
+# the inputs they were built from. Set VAST_CACHE_DIR to an empty string to
+# disable the on-disk cache.
+cache_dir = os.environ.get('VAST_CACHE_DIR', './data/cache/')
+manifest_name = 'manifest.json'
+
+_manifest = None
+# Held while the manifest is read, changed or written; save() writes it
+# while holding the lock already
+_manifest_lock = threading.RLock()
+
+
+def enabled():
+    return bool(cache_dir)
+
+def manifest_path():
+    return os.path.join(cache_dir, manifest_name)
+
+def get_manifest():
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            try:
+                with open(manifest_path(), 'r') as file:
+                    _manifest = json.load(file)
+            except (OSError, ValueError):
+                _manifest = {}
+            _manifest.setdefault('artifacts', {})
+            _manifest.setdefault('files', {})
+        return _manifest
+
+def write_manifest():
+    if not enabled():
+        return
+    with _manifest_lock:
+        # Entries are replaced, never changed in place, so copies of the two
+        # tables are a consistent snapshot
+        manifest = get_manifest()
+        snapshot = {**manifest, 'artifacts': dict(manifest['artifacts']), 'files': dict(manifest['files'])}
+        _atomic_write(manifest_path(), lambda path: _dump_json(snapshot, path))
+
+
+# Fingerprints
+def file_fingerprint(path):
+    # Content hashes are remembered by (size, mtime) so unchanged files are
+    # not rehashed on every boot
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    with _manifest_lock:
+        files = get_manifest()['files']
+        known = files.get(key)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+    with _manifest_lock:
+        get_manifest()['files'][key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+    return sha256
+
+def file_stat(path):
+    # Size and modification time, a cheap way to tell that a file changed
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def folder_fingerprint(folder, suffix=''):
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(suffix):
+            digest.update(name.encode('utf-8'))
+            digest.update(file_fingerprint(os.path.join(folder, name)).encode('ascii'))
+    return digest.hexdigest()
+
+def value_fingerprint(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# Loading and saving
+def load(name, fingerprints):
+    # Returns (True, value) if a cached copy built from the same inputs exists
+    if not enabled():
+        return False, None
+    entry = get_manifest()['artifacts'].get(name)
+    if not entry or entry['inputs'] != fingerprints:
+        return False, None
+    try:
+        return True, _read_value(entry['value'])
+    except (OSError, ValueError, KeyError):
+        return False, None
+
+def save(name, value, fingerprints):
+    if not enabled():
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    described = _write_value(name, value)
+    with _manifest_lock:
+        get_manifest()['artifacts'][name] = {'inputs': fingerprints, 'value': described}
+        write_manifest()
+
+def _write_value(name, value):
+    # DataFrames and Series go to Parquet, sparse matrices to .npz, tuples are
+    # stored element-wise and everything else is written as JSON
+    if isinstance(value, tuple):
+        return {'kind': 'tuple', 'items': [_write_value(f'{name}.{i}', item) for i, item in enumerate(value)]}
+    if isinstance(value, pd.Series):
+        file = name + '.parquet'
+        _atomic_write(os.path.join(cache_dir, file), value.to_frame('value').to_parquet)
+        return {'kind': 'series', 'file': file, 'name': value.name}
+    if isinstance(value, pd.DataFrame):
+        file = name + '.parquet'
+        _atomic_write(os.path.join(cache_dir, file), value.to_parquet)
+        return {'kind': 'frame', 'file': file}
+    if sparse.issparse(value):
+        file = name + '.npz'
+        _atomic_write(os.path.join(cache_dir, file), lambda path: _dump_sparse(value, path))
+        return {'kind': 'sparse', 'file': file}
+    file = name + '.json'
+    _atomic_write(os.path.join(cache_dir, file), lambda path: _dump_json(value, path))
+    return {'kind': 'json', 'file': file}
+
+def _read_value(described):
+    kind = described['kind']
+    if kind == 'tuple':
+        return tuple(_read_value(item) for item in described['items'])
+    path = os.path.join(cache_dir, described['file'])
+    if kind == 'series':
+        series = pd.read_parquet(path)['value']
+        series.name = described['name']
+        return series
+    if kind == 'frame':
+        return pd.read_parquet(path)
+    if kind == 'sparse':
+        return sparse.load_npz(path).tocsr()
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def _dump_json(value, path):
+    with open(path, 'w') as file:
+        json.dump(value, file)
+
+def _dump_sparse(value, path):
+    # Through a file object, save_npz would add .npz to the temporary name
+    with open(path, 'wb') as file:
+        sparse.save_npz(file, value)
+
+def _atomic_write(path, writer):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    writer(tmp_path)
+    os.replace(tmp_path, path)
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import artifact_store
+
+# Derived data is built lazily on first use and then kept for the lifetime of
+# the process. Builders are zero argument functions that call get() for the
+# artifacts they depend on. Artifacts registered with an inputs function are
+# also persisted by artifact_store and reused while the fingerprints returned
+# by that function stay the same. Intermediate artifacts are registered with
+# warm=False so they are neither warmed up nor needed for readiness.
+builders = {}
+input_fingerprints = {}
+warm_artifacts = []
+artifacts = {}
+artifact_status = {}
+
+_registry_lock = threading.Lock()
+_build_locks = {}
+
+
+def register(name, builder, inputs=None, warm=True):
+    with _registry_lock:
+        builders[name] = builder
+        input_fingerprints[name] = inputs
+        if warm:
+            warm_artifacts.append(name)
+        _build_locks[name] = threading.Lock()
+        artifact_status[name] = {'state': 'pending', 'seconds': None, 'error': None, 'source': None}
+
+def get(name):
+    if name in artifacts:
+        return artifacts[name]
+    with _build_locks[name]:
+        # Another thread may have finished the build while we were waiting
+        if name in artifacts:
+            return artifacts[name]
+        artifact_status[name] = {'state': 'building', 'seconds': None, 'error': None, 'source': None}
+        start = time.perf_counter()
+        try:
+            value, source = _load_or_build(name)
+        except Exception as e:
+            artifact_status[name] = {'state': 'failed', 'seconds': time.perf_counter() - start, 'error': repr(e), 'source': None}
+            raise
+        artifacts[name] = value
+        artifact_status[name] = {'state': 'ready', 'seconds': time.perf_counter() - start, 'error': None, 'source': source}
+        return value
+
+def _load_or_build(name):
+    inputs = input_fingerprints[name]
+    if inputs is None:
+        return builders[name](), 'built'
+    fingerprints = inputs()
+    hit, value = artifact_store.load(name, fingerprints)
+    if hit:
+        return value, 'cache'
+    value = builders[name]()
+    artifact_store.save(name, value, fingerprints)
+    return value, 'built'
+
+def publish(values):
+    # Swap in new values for several artifacts at once. The dict is replaced
+    # rather than updated, so readers see either every old value or every new
+    # one. Persisted artifacts are saved with the fingerprints of the inputs
+    # they now reflect.
+    global artifacts
+    names = sorted(values)
+    locks = [_build_locks[name] for name in names]
+    for lock in locks:
+        lock.acquire()
+    try:
+        snapshot = dict(artifacts)
+        snapshot.update(values)
+        artifacts = snapshot
+        for name in names:
+            artifact_status[name] = {'state': 'ready', 'seconds': None, 'error': None, 'source': 'refresh'}
+    finally:
+        for lock in reversed(locks):
+            lock.release()
+    for name in names:
+        inputs = input_fingerprints[name]
+        if inputs is not None and artifact_store.enabled():
+            artifact_store.save(name, values[name], inputs())
+
+def is_ready():
+    return all(artifact_status[name]['state'] == 'ready' for name in warm_artifacts)
+
+def status():
+    return {'ready': is_ready(), 'artifacts': {name: dict(s) for name, s in artifact_status.items()}}
+
+def warm_up(names=None, on_done=None):
+    for name in names or list(warm_artifacts):
+        try:
+            get(name)
+        except Exception:
+            # The failure is recorded in artifact_status and reported by /ready
+            pass
+    if on_done is not None:
+        on_done()
+
+def start_background_warm_up(names=None, on_done=None):
+    thread = threading.Thread(target=warm_up, args=(names, on_done), name='artifact-warm-up', daemon=True)
+    thread.start()
+    return thread
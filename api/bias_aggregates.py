@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import metrics
+import pipeline
+
+# Bias counts rolled up by publication, entity and algorithm, so the front end
+# can draw bias heatmaps without downloading the enriched links. Every
+# article's bias dict becomes a row of a sparse (article x bias type) matrix
+# holding the number of passages cited for each bias. A rollup multiplies it
+# with a (group x article) incidence matrix taken from the links of the
+# whole graph: each article counts once for every group it has links in,
+# whatever the number of those links.
+#   publication  the suffix of the link's _raw_source (see
+#                pipeline.article_publication)
+#   entity       the source and target of the link
+#   algorithm    the link's _algorithm
+rollups = ('publication', 'entity', 'algorithm')
+
+
+def passage_count(value):
+    # Bias dicts map a bias type to the passages showing it
+    if isinstance(value, list):
+        return len(value)
+    return 1 if value else 0
+
+def bias_matrix(biases, bias_types):
+    # (articles, matrix) with one row per article with a bias dict
+    articles = sorted(article for article, bias in biases.items() if isinstance(bias, dict))
+    columns = {bias: j for j, bias in enumerate(bias_types)}
+    rows, cols, counts = [], [], []
+    for i, article in enumerate(articles):
+        for bias, value in biases[article].items():
+            count = passage_count(value)
+            if bias in columns and count:
+                rows.append(i)
+                cols.append(columns[bias])
+                counts.append(count)
+    matrix = sparse.csr_matrix(
+        (np.array(counts, dtype=np.int64), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+        shape=(len(articles), len(bias_types))
+    )
+    return articles, matrix
+
+def rollup(groups, article_rows, matrix):
+    # Summed bias counts of the articles of each group, groups sorted
+    pairs = pd.DataFrame({'group': groups, 'article': article_rows})
+    pairs = pairs[pairs['group'].notna() & (pairs['article'] >= 0)].drop_duplicates()
+    codes, index = pd.factorize(pairs['group'], sort=True)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int64), (codes, pairs['article'].to_numpy())), shape=(len(index), matrix.shape[0])
+    )
+    return {
+        'index': [str(group) for group in index],
+        'articles': np.bincount(codes, minlength=len(index)).tolist(),
+        'counts': (incidence @ matrix).toarray().tolist()
+    }
+
+@metrics.stage('bias_aggregation')
+def build_summary(store, biases, bias_types):
+    articles, matrix = bias_matrix(biases, bias_types)
+    links = store.links
+    article_rows = pd.Index(articles).get_indexer(links['_articleid'].astype(object))
+    publications = pipeline.article_publication(links['_raw_source'].astype(object))
+    entities = store.node_index.to_numpy(object)
+    source = links['source'].to_numpy()
+    target = links['target'].to_numpy()
+    endpoint_ids = np.concatenate((
+        np.where(source >= 0, entities[np.maximum(source, 0)], None),
+        np.where(target >= 0, entities[np.maximum(target, 0)], None)
+    ))
+    return {
+        'bias_types': list(bias_types),
+        'total': {'articles': len(articles), 'counts': np.asarray(matrix.sum(axis=0)).ravel().tolist()},
+        'publication': rollup(publications.to_numpy(object), article_rows, matrix),
+        'entity': rollup(endpoint_ids, np.concatenate((article_rows, article_rows)), matrix),
+        'algorithm': rollup(links['_algorithm'].astype(object).to_numpy(object), article_rows, matrix)
+    }
+
+def summary_content(summary, by=None):
+    # The summary with only the requested rollups
+    return {key: value for key, value in summary.items() if key not in rollups or not by or key in by}
@@ -1,20 +1,22 @@
-import json
 import pandas as pd
-import networkx as nx
 import os
-from groq import Groq
 from dotenv import load_dotenv
+import bias_extraction
+import bias_store
+import graph_store
+import ingest
+import metrics
 
 load_dotenv()
 
-client = Groq(
-    api_key = os.environ.get("GROQ_API_KEY")
-)
-
-data = {}
-data_path = './data/mc1.json'
+# The same graph file as the evaluation pipeline, see graph_store.graph_path
+data_path = graph_store.graph_path
 articles_base_path = './data/articles/'
-bias_base_path = './data/bias/'
+
+# How link endpoints are matched against the selected node ids. 'substring'
+# keeps the original behaviour (the endpoint is contained in a node id),
+# 'exact' requires the ids to be equal.
+link_match = os.environ.get('VAST_LINK_MATCH', 'substring')
 
 bias_types = [
     "Confirmation Bias", "Anchoring Bias", "Availability Bias", "Hindsight Bias",
@@ -30,68 +32,25 @@ bias_types = [
 
 graph = {'nodes': [], 'links': [], 'graph': {}}
 
-with open(data_path) as file: 
-    data = json.load(file)
-
-print(type(data))
-keys_list = list(data.keys())
-print(keys_list)
-
-directed = data['directed']
-multigraph = data['multigraph']
-graph = data['graph']
-nodes = data['nodes']
-links = data['links']
-
-print(directed)
-print(multigraph)
-print(graph)
-print(len(nodes))
-print(len(links))
-print(nodes[0])
-print(links[0])
+# The knowledge graph is only loaded when first needed, so importing this
+# module is cheap. It is the very store the evaluation pipeline uses.
+def get_store(): 
+    return graph_store.load_store(data_path)
 
 # For each link, add the corresponding data from the original source
 def add_source_data_to_links(links_df): 
-    # Add original data to link
+    # Articles without a bias file yet are extracted in the background (see
+    # bias_extraction.py), their links have no bias until a refresh
+    bias_extraction.schedule(links_df['_articleid'])
+    # Add original data to link, looking each article up once in the bias store
     data_df = links_df
-    data_df['bias_dict'] = data_df.apply(lambda x: get_source_bias(x['_articleid']), axis=1)
+    data_df['bias_dict'] = bias_store.biases_for(data_df['_articleid'])
     #print(data_df['bias_dict'])
     return data_df
 
 def get_source_bias(articleid): 
-    
-    bias_path = bias_base_path + str(articleid) + ".json"
-    print(articleid)
-    if os.path.isfile(bias_path): 
-        # Read existing bias file
-        with open(bias_path, 'r') as file:
-            bias = "".join(line.rstrip() for line in file)
-            json_bias = json.loads(bias)
-            return json_bias
-    else: # bias file does not exist
-        prompt = get_prompt()
-        
-        article_content = get_article_content(articleid)
-        
-        chat_completion = client.chat.completions.create(
-            messages = [
-                {
-                    "role": "user",
-                    "content": str(prompt + "\n" + article_content),
-                }
-            ],
-            model="llama-3.3-70b-versatile"
-        )
-        
-        response = chat_completion.choices[0].message.content
-        json_response = json.loads(response)
-        
-        with open(bias_path, 'w') as file: 
-            json.dump(json_response, file)
-            
-        return json_response 
-        #return False
+    # Bias dict of the article, or False if its bias extraction failed
+    return bias_store.get_bias(articleid)
 
 def get_prompt(): 
     prompt_path = "api/prompt.txt"
@@ -103,22 +62,24 @@ def links_to_df(links):
     df = pd.DataFrame(links)
     return df
 
-def get_article_content(articleid): 
-    article_path = articles_base_path + str(articleid) + '.txt'
-    
-    try: 
-        with open(article_path, 'r') as file:
-            data = "".join(line.rstrip() for line in file)
-            return data
-    except: 
+def get_article_content(articleid):
+    # The article text as ingested, empty when the article is missing
+    try:
+        return ingest.read_article(articles_base_path + str(articleid) + '.txt')
+    except (OSError, UnicodeDecodeError):
         return ''
 
 def clean_links(link_df): 
-    # Turn each kind of bias into its own column
+    # Turn each kind of bias into its own column, reading every link's bias
+    # dict once instead of once per bias type
+    missing = [None] * len(bias_types)
+    rows = [
+        [bias_dict.get(bias) for bias in bias_types] if type(bias_dict) != bool else missing
+        for bias_dict in link_df['bias_dict']
+    ]
+    columns = pd.DataFrame(rows, index=link_df.index, columns=bias_types, dtype=object)
     for bias in bias_types:
-        link_df[bias] = link_df.apply(lambda x: 
-            x['bias_dict'].get(bias) if (type(x['bias_dict']) != bool) else None, 
-            axis=1)
+        link_df[bias] = columns[bias]
         
     # eliminate unnecessary columns
     # link_cleaned = link_df.loc[:, link_df.columns != 'bias_dict']
@@ -126,21 +87,51 @@ def clean_links(link_df):
     # link_cleaned = link_cleaned.loc[:, link_df.columns != 'filtered_target']
     return link_df
 
+def endpoint_filter(endpoints, node_ids, match=None): 
+    # Which endpoints belong to the selected nodes, using a hashed index of
+    # the node ids instead of scanning every id for every link
+    match = match or link_match
+    node_index = pd.Index(node_ids)
+    if match == 'exact':
+        return endpoints.isin(node_index)
+    # An id can't contain the separator, so a substring of the joined ids is
+    # always a substring of one of them. Each distinct endpoint is checked once.
+    joined = '\x00'.join(str(node_id) for node_id in node_ids)
+    contained = {
+        endpoint: isinstance(endpoint, str) and '\x00' not in endpoint and endpoint in joined
+        for endpoint in endpoints.dropna().unique()
+    }
+    return endpoints.astype(object).map(contained).eq(True)
+
+@metrics.stage('filter_links')
 def get_filtered_links(num_nodes): 
-    links_df = links_to_df(links)
+    links_df = get_store().links_frame()
     node_list = get_node_data(num_nodes)
     node_ids = get_node_ids(node_list)
-    links_df['filtered_source'] = links_df.apply(lambda x: any(x['source'] in y for y in node_ids), axis=1)
-    links_df['filtered_target'] = links_df.apply(lambda x: any(x['target'] in y for y in node_ids), axis=1)
+    links_df['filtered_source'] = endpoint_filter(links_df['source'], node_ids)
+    links_df['filtered_target'] = endpoint_filter(links_df['target'], node_ids)
     return links_df[(links_df['filtered_source']) & (links_df['filtered_target'])]
 
 def get_link_data(num_nodes): 
     link_df = get_filtered_links(num_nodes)
-    #print(link_df)
-    link_df = add_source_data_to_links(link_df) 
+    with metrics.stage('bias_enrichment'): 
+        link_df = add_source_data_to_links(link_df) 
+        link_df = clean_links(link_df)
+    return link_df.to_dict(orient='records')
+
+def refresh_link_biases(links, article_ids): 
+    # Copy of the link records with the biases of the given articles read
+    # again, the other records are shared
+    article_ids = set(article_ids)
+    positions = [i for i, link in enumerate(links) if link.get('_articleid') in article_ids]
+    if not positions: 
+        return links
+    link_df = pd.DataFrame([links[i] for i in positions])
+    link_df['bias_dict'] = bias_store.biases_for(link_df['_articleid'])
     link_df = clean_links(link_df)
-    links = link_df.to_dict(orient='records')
-    print(link_df)
+    links = list(links)
+    for i, link in zip(positions, link_df.to_dict(orient='records')): 
+        links[i] = link
     return links
 
 def get_node_ids(nodes): 
@@ -150,12 +141,15 @@ def get_node_ids(nodes):
     return ids
 
 def get_node_data(num_nodes): 
-    return nodes[0:num_nodes]
+    return get_store().node_records(num_nodes)
 
 def get_graph_data(num_nodes): 
     return {'nodes': get_node_data(num_nodes), 'links': get_link_data(num_nodes)}
 
 def load_graph(num_nodes): 
     global graph
-    graph = {'nodes': get_node_data(num_nodes), 'links': get_link_data(num_nodes), 'graph': get_graph_data(num_nodes)}
+    # Build the links once and share them between 'links' and 'graph'
+    nodes = get_node_data(num_nodes)
+    links = get_link_data(num_nodes)
+    graph = {'nodes': nodes, 'links': links, 'graph': {'nodes': nodes, 'links': links}}
     return graph
@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from groq import AsyncGroq
+
+import bias_detection
+import bias_store
+import metrics
+
+# Bias extraction job: asks the LLM for the biases of every article that does
+# not have a data/bias/<articleid>.json file yet. Requests run concurrently,
+# are rate limited and retried with exponential backoff. Each result is
+# written atomically as soon as it arrives, so an interrupted run can simply
+# be started again and only the missing articles are requested.
+# The client honours GROQ_BASE_URL, which is how it is pointed at a local
+# stub server instead of Groq.
+# The server never waits for it: requests only read the stored biases and
+# hand the missing articles to schedule(), which runs the job in a background
+# thread. Articles whose extraction failed are not requested again for
+# failure_ttl seconds.
+bias_model = "llama-3.3-70b-versatile"
+extraction_concurrency = int(os.environ.get('VAST_BIAS_CONCURRENCY', '4'))
+# Requests per minute, 0 means unlimited
+extraction_rate_limit = float(os.environ.get('VAST_BIAS_RATE_LIMIT', '30'))
+extraction_retries = int(os.environ.get('VAST_BIAS_RETRIES', '5'))
+# Seconds before the first retry, doubled for every further one
+extraction_backoff = float(os.environ.get('VAST_BIAS_BACKOFF', '1'))
+# Set VAST_BIAS_BACKGROUND=0 to only extract biases with the command below
+background_extraction = os.environ.get('VAST_BIAS_BACKGROUND', '1') == '1'
+failure_ttl = float(os.environ.get('VAST_BIAS_FAILURE_TTL', '3600'))
+
+logger = logging.getLogger('vast.bias_extraction')
+
+# Article id -> (time of the failure, error) of the failed extractions
+_failed = {}
+# Articles waiting for the background job, in order
+_queue = {}
+_queue_lock = threading.Lock()
+_worker = None
+# Called after a background run wrote bias files
+listeners = []
+
+
+def _reset_after_fork():
+    # A forked child (the workers of serve.py) has no copy of the parent's
+    # background thread, and the lock may have been held by it. The queued
+    # articles are scheduled again by the next request that needs them.
+    global _queue, _queue_lock, _worker
+    _queue = {}
+    _queue_lock = threading.Lock()
+    _worker = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def bias_path(articleid):
+    return bias_store.bias_file(articleid)
+
+def recently_failed(articleid):
+    failure = _failed.get(articleid)
+    return failure is not None and time.monotonic() - failure[0] < failure_ttl
+
+def pending_article_ids(article_ids, retry_failed=True):
+    # Each article only needs to be requested once, however many links cite it
+    unique_ids = dict.fromkeys(articleid for articleid in article_ids if isinstance(articleid, str) and articleid)
+    return [
+        articleid for articleid in unique_ids
+        if not os.path.isfile(bias_path(articleid)) and (retry_failed or not recently_failed(articleid))
+    ]
+
+def record_failure(articleid, error, stats):
+    stats['failed'][articleid] = error
+    _failed[articleid] = (time.monotonic(), error)
+    metrics.inc('vast_bias_extraction_failures_total')
+    logger.warning("Bias extraction failed for %s: %s", articleid, error)
+
+def write_bias(articleid, bias):
+    # Readers see either no file or a complete one
+    path = bias_path(articleid)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'w') as file:
+            json.dump(bias, file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class RateLimiter:
+    """Spaces out request starts so at most `per_minute` begin every minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def request_bias(client, prompt, articleid):
+    article_content = bias_detection.get_article_content(articleid)
+    chat_completion = await client.chat.completions.create(
+        messages = [
+            {
+                "role": "user",
+                "content": str(prompt + "\n" + article_content),
+            }
+        ],
+        model=bias_model
+    )
+    response = chat_completion.choices[0].message.content
+    # A response that is not valid JSON raises here and is retried
+    return json.loads(response)
+
+async def extract_one(client, prompt, articleid, semaphore, limiter, retries, stats):
+    async with semaphore:
+        for attempt in range(retries + 1):
+            await limiter.wait()
+            stats['requests'] += 1
+            start = time.perf_counter()
+            try:
+                bias = await request_bias(client, prompt, articleid)
+            except Exception as e:
+                metrics.observe('vast_llm_request_seconds', time.perf_counter() - start, outcome='error')
+                if attempt == retries:
+                    record_failure(articleid, repr(e), stats)
+                    return
+                stats['retries'] += 1
+                # Exponential backoff with jitter
+                await asyncio.sleep(min(60.0, extraction_backoff * 2 ** attempt) * (0.5 + random.random() / 2))
+                continue
+            metrics.observe('vast_llm_request_seconds', time.perf_counter() - start, outcome='ok')
+            try:
+                write_bias(articleid, bias)
+            except (OSError, TypeError, ValueError) as e:
+                record_failure(articleid, repr(e), stats)
+                return
+            _failed.pop(articleid, None)
+            stats['written'] += 1
+            return
+
+async def extract_biases(article_ids, concurrency=None, rate_limit=None, retries=None, client=None, retry_failed=True):
+    concurrency = concurrency or extraction_concurrency
+    rate_limit = extraction_rate_limit if rate_limit is None else rate_limit
+    retries = extraction_retries if retries is None else retries
+    pending = pending_article_ids(article_ids, retry_failed)
+    stats = {'pending': len(pending), 'requests': 0, 'retries': 0, 'written': 0, 'failed': {}}
+    if not pending:
+        return stats
+
+    try:
+        client = client or AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"), max_retries=0)
+    except Exception as e:
+        # No API key: every pending article fails without a request
+        for articleid in pending:
+            record_failure(articleid, repr(e), stats)
+        return stats
+    prompt = bias_detection.get_prompt()
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate_limit)
+    await asyncio.gather(*(
+        extract_one(client, prompt, articleid, semaphore, limiter, retries, stats)
+        for articleid in pending
+    ))
+    return stats
+
+def run_extraction(article_ids, concurrency=None, rate_limit=None, retries=None, retry_failed=True):
+    return asyncio.run(extract_biases(article_ids, concurrency, rate_limit, retries, retry_failed=retry_failed))
+
+
+# Background extraction for the server
+def schedule(article_ids):
+    # Queue the articles without a bias file or a recent failure, returns the
+    # number of newly queued ones
+    global _worker
+    if not background_extraction:
+        return 0
+    pending = pending_article_ids(article_ids, retry_failed=False)
+    with _queue_lock:
+        new = [articleid for articleid in pending if articleid not in _queue]
+        _queue.update(dict.fromkeys(new))
+        if _queue and _worker is None:
+            _worker = threading.Thread(target=_work, name='bias-extraction', daemon=True)
+            _worker.start()
+    return len(new)
+
+def _work():
+    global _worker
+    while True:
+        with _queue_lock:
+            batch = list(_queue)
+            if not batch:
+                _worker = None
+                return
+        try:
+            stats = run_extraction(batch, retry_failed=False)
+        except Exception as e:
+            stats = {'written': 0, 'failed': {}}
+            for articleid in batch:
+                record_failure(articleid, repr(e), stats)
+        with _queue_lock:
+            for articleid in batch:
+                _queue.pop(articleid, None)
+        if stats['written']:
+            for listener in listeners:
+                try:
+                    listener()
+                except Exception:
+                    logger.exception("Bias extraction listener failed")
+
+def wait(timeout=None):
+    # Until the background job has finished, False on timeout
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        with _queue_lock:
+            worker = _worker
+        if worker is None:
+            return True
+        worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if deadline is not None and time.monotonic() >= deadline:
+            with _queue_lock:
+                return _worker is None
+
+
+# Run from the repository root: python api/bias_extraction.py
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract article biases for every article cited in mc1.json")
+    parser.add_argument('--concurrency', type=int, default=extraction_concurrency)
+    parser.add_argument('--rate-limit', type=float, default=extraction_rate_limit, help="requests per minute, 0 for no limit")
+    parser.add_argument('--retries', type=int, default=extraction_retries)
+    args = parser.parse_args()
+
+    article_ids = bias_detection.get_store().links['_articleid'].astype(object)
+    stats = run_extraction(article_ids, args.concurrency, args.rate_limit, args.retries)
+    print(json.dumps(stats, indent=2))
@@ -0,0 +1,211 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# In-memory store of the per-article bias dicts, served from a bounded LRU
+# keyed by article id so an article cited by many links is only parsed once.
+# The bias files, and the consolidated JSONL file written by consolidate(),
+# are read in one bulk pass that fills the LRU up to its capacity. Every line
+# of the consolidated file is indexed by its byte offset, so an entry that
+# didn't fit or was evicted is read back with one seek.
+bias_cache_size = int(os.environ.get('VAST_BIAS_CACHE_SIZE', '100000'))
+bias_base_path = './data/bias/'
+consolidated_path = './data/bias.jsonl'
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_loaded = False
+# Article id -> byte offset of its line in the consolidated file
+_offsets = {}
+_consolidated_mtime = None
+counters = {'hits': 0, 'misses': 0, 'loaded': 0, 'evictions': 0}
+
+
+def _put(articleid, bias):
+    # Caller holds _lock
+    _cache[articleid] = bias
+    _cache.move_to_end(articleid)
+    while len(_cache) > bias_cache_size:
+        _cache.popitem(last=False)
+        counters['evictions'] += 1
+
+def _read_file(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def bias_file(articleid):
+    return bias_base_path + str(articleid) + ".json"
+
+def _consolidated_entries(path):
+    # (offset, article id, bias) of every line, one line in memory at a time
+    with open(path, 'rb') as file:
+        offset = 0
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                yield offset, entry['articleid'], entry['bias']
+            offset += len(line)
+
+def _read_consolidated(articleid):
+    offset = _offsets.get(articleid)
+    if offset is None:
+        return None
+    try:
+        with open(consolidated_path, 'rb') as file:
+            file.seek(offset)
+            entry = json.loads(file.readline())
+    except (OSError, ValueError):
+        # Replaced since it was indexed
+        return None
+    return entry['bias'] if isinstance(entry, dict) and entry.get('articleid') == articleid else None
+
+def _newer_file(articleid):
+    # The bias file of an article, when it takes precedence over the
+    # consolidated entry: files written after the consolidated file win
+    path = bias_file(articleid)
+    if not os.path.isfile(path):
+        return None
+    if articleid in _offsets and os.stat(path).st_mtime_ns <= _consolidated_mtime:
+        return None
+    return path
+
+def bulk_load():
+    global _loaded, _offsets, _consolidated_mtime
+    offsets = {}
+    mtime = None
+    with _lock:
+        _cache.clear()
+    loaded = 0
+
+    def insert(articleid, bias):
+        # Caller holds _lock. Entries past the capacity are only indexed.
+        nonlocal loaded
+        if articleid in _cache or len(_cache) < bias_cache_size:
+            _cache[articleid] = bias
+            loaded += 1
+
+    if os.path.isfile(consolidated_path):
+        mtime = os.stat(consolidated_path).st_mtime_ns
+        for offset, articleid, bias in _consolidated_entries(consolidated_path):
+            offsets[articleid] = offset
+            with _lock:
+                insert(articleid, bias)
+
+    if os.path.isdir(bias_base_path):
+        for entry in os.scandir(bias_base_path):
+            if not entry.name.endswith('.json'):
+                continue
+            articleid = entry.name[:-len('.json')]
+            # Files written after the consolidated file take precedence
+            if articleid in offsets and entry.stat().st_mtime_ns <= mtime:
+                continue
+            with _lock:
+                if articleid not in _cache and len(_cache) >= bias_cache_size:
+                    continue
+            bias = _read_file(entry.path)
+            with _lock:
+                insert(articleid, bias)
+
+    with _lock:
+        _offsets = offsets
+        _consolidated_mtime = mtime
+        counters['loaded'] += loaded
+        _loaded = True
+    return loaded
+
+def ensure_loaded():
+    if not _loaded:
+        bulk_load()
+
+def read_bias(articleid):
+    # The stored bias dict of an article, or None, without the LRU
+    path = _newer_file(articleid)
+    if path is not None:
+        return _read_file(path)
+    bias = _read_consolidated(articleid)
+    if bias is not None:
+        return bias
+    path = bias_file(articleid)
+    return _read_file(path) if os.path.isfile(path) else None
+
+def get_bias(articleid):
+    # The bias dict of an article, or False when there is none
+    ensure_loaded()
+    articleid = str(articleid)
+    with _lock:
+        if articleid in _cache:
+            counters['hits'] += 1
+            _cache.move_to_end(articleid)
+            return _cache[articleid]
+        counters['misses'] += 1
+    # Not cached: it didn't fit, was evicted, or was written after the bulk load
+    bias = read_bias(articleid)
+    if bias is None:
+        return False
+    with _lock:
+        _put(articleid, bias)
+    return bias
+
+def biases_for(article_ids):
+    # Look up every distinct article once and map the result onto the links
+    article_ids = pd.Series(article_ids).astype(object)
+    unique_ids = article_ids.dropna().unique()
+    lookup = pd.Series({articleid: get_bias(articleid) for articleid in unique_ids}, dtype=object)
+    biases = article_ids.map(lookup)
+    return biases.where(biases.notna(), False)
+
+def all_biases():
+    # Every article's bias dict by article id. Entries the LRU doesn't hold
+    # are read from the files without being cached.
+    ensure_loaded()
+    with _lock:
+        biases = dict(_cache)
+    articleids = list(_offsets)
+    if os.path.isdir(bias_base_path):
+        articleids += [name[:-len('.json')] for name in os.listdir(bias_base_path) if name.endswith('.json')]
+    for articleid in dict.fromkeys(articleids):
+        if articleid not in biases:
+            bias = read_bias(articleid)
+            if bias is not None:
+                biases[articleid] = bias
+    return biases
+
+def invalidate(articleid=None):
+    # Forget one article, or everything (the next lookup reloads in bulk)
+    global _loaded
+    with _lock:
+        if articleid is None:
+            _cache.clear()
+            _offsets.clear()
+            _loaded = False
+        else:
+            _cache.pop(str(articleid), None)
+
+def stats():
+    with _lock:
+        return {'size': len(_cache), 'capacity': bias_cache_size, 'indexed': len(_offsets), **counters}
+
+def consolidate(path=None):
+    # Write every bias file into one JSONL file for faster bulk loads
+    path = path or consolidated_path
+    folder = bias_base_path
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    count = 0
+    with open(tmp_path, 'w') as out:
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.json'):
+                bias = _read_file(os.path.join(folder, name))
+                out.write(json.dumps({'articleid': name[:-len('.json')], 'bias': bias}) + '\n')
+                count += 1
+    os.replace(tmp_path, path)
+    # The offsets of the previous file are no longer valid
+    invalidate()
+    return count
+
+
+# Run from the repository root: python api/bias_store.py
+if __name__ == "__main__":
+    print(f"Consolidated {consolidate()} bias files into {consolidated_path}")
@@ -0,0 +1,15 @@
+import json
+import os
+import sys
+sys.path.append(os.path.abspath("./api/"))
+import artifacts
+import index
+
+# Precompute the cached artifacts so the API can load them straight away.
+# Only the artifacts whose inputs changed since the last run are rebuilt.
+# Run from the repository root: python api/build_artifacts.py
+if __name__ == "__main__":
+    artifacts.warm_up()
+    status = artifacts.status()
+    print(json.dumps(status, indent=2))
+    sys.exit(0 if status['ready'] else 1)
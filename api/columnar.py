@@ -0,0 +1,83 @@
+import pandas as pd
+import pyarrow as pa
+
+import bias_detection
+
+# Arrow IPC encoding of the graph served by /graph, /nodes and /links, for
+# clients that ask for it (Accept: application/vnd.apache.arrow.stream or
+# format=arrow). Nodes and links are each one record batch; /graph sends the
+# nodes stream followed by the links stream in the same body, which
+# apache-arrow's RecordBatchReader.readAll() reads as two tables.
+#
+# Repeated strings are dictionary encoded, and link endpoints are int32
+# indices into a dictionary that starts with the node ids in node table order,
+# so for endpoints that are nodes the index is the node's row. The per-bias
+# columns added by clean_links are left out, they are lookups into bias_dict,
+# which is sent as a map from bias type to phrases.
+media_type = 'application/vnd.apache.arrow.stream'
+dictionary_columns = ('type', '_algorithm', '_raw_source')
+endpoint_type = pa.dictionary(pa.int32(), pa.string())
+bias_dict_type = pa.map_(pa.string(), pa.list_(pa.dictionary(pa.int32(), pa.string())))
+
+
+def wants_arrow(request, format=None):
+    return format == 'arrow' or media_type in request.headers.get('accept', '')
+
+def encode_strings(table):
+    # The named columns, and any other string column with mostly repeated values
+    columns = []
+    for field, column in zip(table.schema, table.columns):
+        if pa.types.is_string(field.type) and (
+            field.name in dictionary_columns or column.null_count + 2 * len(column.unique()) <= len(column)
+        ):
+            column = column.dictionary_encode()
+        columns.append(column)
+    return pa.table(columns, names=table.column_names)
+
+def nodes_table(nodes):
+    if not nodes:
+        return pa.table({'id': pa.array([], type=pa.string())})
+    return encode_strings(pa.Table.from_pandas(pd.DataFrame(nodes), preserve_index=False))
+
+def endpoints_array(endpoints, ids):
+    return pa.DictionaryArray.from_arrays(pa.array(ids.get_indexer(endpoints), type=pa.int32()), pa.array(ids, type=pa.string()))
+
+def links_table(links, node_ids):
+    link_df = pd.DataFrame(links)
+    if link_df.empty:
+        return pa.table({'source': pa.array([], type=endpoint_type), 'target': pa.array([], type=endpoint_type)})
+    bias_dicts = link_df.pop('bias_dict') if 'bias_dict' in link_df else None
+    link_df = link_df.drop(columns=[bias for bias in bias_detection.bias_types if bias in link_df])
+    ids = pd.Index(node_ids, dtype=object)
+    endpoints = pd.Index(pd.concat([link_df['source'], link_df['target']]).unique(), dtype=object)
+    ids = ids.append(endpoints[~endpoints.isin(ids)])
+    source = endpoints_array(link_df.pop('source'), ids)
+    target = endpoints_array(link_df.pop('target'), ids)
+
+    table = encode_strings(pa.Table.from_pandas(link_df, preserve_index=False))
+    table = table.add_column(0, 'source', source).add_column(1, 'target', target)
+    if bias_dicts is not None:
+        # Links without biases have bias_dict False, they become nulls
+        items = [list(value.items()) if isinstance(value, dict) else None for value in bias_dicts]
+        table = table.append_column('bias_dict', pa.array(items, type=bias_dict_type))
+    return table
+
+def graph_tables(graph):
+    node_ids = [node['id'] for node in graph['nodes']]
+    return nodes_table(graph['nodes']), links_table(graph['links'], node_ids)
+
+def write_streams(tables):
+    # One IPC stream per table, one after the other
+    sink = pa.BufferOutputStream()
+    for table in tables:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def read_streams(body):
+    # The tables written by write_streams
+    source = pa.BufferReader(body)
+    tables = []
+    while source.tell() < source.size():
+        tables.append(pa.ipc.open_stream(source).read_all())
+    return tables
@@ -0,0 +1,171 @@
+import os
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import metrics
+import pipeline
+
+# Sparse (article x term) counts of the ingested articles, so other keyword
+# tables can be evaluated without reading the texts again. The first columns
+# are the keywords of pipeline.all_keywords() with the counts of the keyword
+# scan, which keeps the numbers of the current tables identical to the
+# published ones (substring or whole word matches, see pipeline.keyword_match).
+# The remaining columns are every word n-gram of the corpus of up to
+# ngram_max words, counted as whole word matches.
+# A table is evaluated in one match mode: 'scan' reads the keyword scan and
+# only knows the pipeline keywords, 'word' looks every keyword up as an
+# n-gram, the pipeline keywords included.
+ngram_max = int(os.environ.get('VAST_NGRAM_MAX', '3'))
+token_pattern = re.compile(r'[a-z0-9]+')
+
+
+def normalize_term(term):
+    # The n-gram a keyword is looked up as, 'Eco-Friendly' is 'eco friendly'
+    return ' '.join(token_pattern.findall(term.lower()))
+
+def text_ngrams(text, n_max=None):
+    tokens = token_pattern.findall(text.lower())
+    counts = Counter(tokens)
+    for n in range(2, (n_max or ngram_max) + 1):
+        counts.update(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return counts
+
+def article_rows(files, articles_content, article_scans, keywords, ngrams):
+    # Counts of the given articles, new n-grams are added to ngrams
+    keyword_counts = np.array(
+        [[article_scans[file][kw] for kw in keywords] for file in files], dtype=np.int32
+    ).reshape(len(files), len(keywords))
+    rows, columns, counts = [], [], []
+    for row, file in enumerate(files):
+        for ngram, count in text_ngrams(articles_content[file]).items():
+            rows.append(row)
+            columns.append(ngrams.setdefault(ngram, len(ngrams)))
+            counts.append(count)
+    ngram_counts = sparse.csr_matrix(
+        (np.array(counts, dtype=np.int32), (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64))),
+        shape=(len(files), len(ngrams))
+    )
+    return sparse.hstack([sparse.csr_matrix(keyword_counts), ngram_counts], format='csr', dtype=np.int32)
+
+@metrics.stage('doc_terms')
+def build_doc_terms(articles_content, article_scans):
+    # (matrix, index), the index holds the article of every row and the term
+    # of every column. Rows follow the order of article_scans like the ground
+    # truth records do.
+    files = list(article_scans)
+    keywords = pipeline.all_keywords()
+    ngrams = {}
+    matrix = article_rows(files, articles_content, article_scans, keywords, ngrams)
+    return matrix, {'files': files, 'keywords': keywords, 'ngrams': list(ngrams)}
+
+@metrics.stage('doc_terms_update')
+def update_doc_terms(doc_terms, articles_content, article_scans, changed):
+    # build_doc_terms after the changed articles were rescanned (or removed
+    # from article_scans), counting only those. The other rows are reused;
+    # n-grams new to the corpus get new columns at the end and the columns of
+    # n-grams that no longer occur are kept, empty, so the column order can
+    # differ from a full build but every lookup gives the same counts.
+    matrix, index = doc_terms
+    files = list(article_scans)
+    ngrams = {ngram: i for i, ngram in enumerate(index['ngrams'])}
+    previous = {file: row for row, file in enumerate(index['files'])}
+    rescanned = [file for file in files if file in changed or file not in previous]
+    kept = [file for file in files if file not in rescanned]
+    new_rows = article_rows(rescanned, articles_content, article_scans, index['keywords'], ngrams)
+    kept_rows = matrix[[previous[file] for file in kept]]
+    kept_rows.resize(len(kept), new_rows.shape[1])
+    # Back in the order of article_scans
+    position = {file: i for i, file in enumerate(kept + rescanned)}
+    stacked = sparse.vstack([kept_rows, new_rows], format='csr', dtype=np.int32)
+    matrix = stacked[[position[file] for file in files]]
+    return matrix, {'files': files, 'keywords': index['keywords'], 'ngrams': list(ngrams)}
+
+def term_columns(index):
+    # Column of every keyword and n-gram, for looking keywords up
+    offset = len(index['keywords'])
+    return {
+        'keywords': {kw: i for i, kw in enumerate(index['keywords'])},
+        'ngrams': {ngram: offset + i for i, ngram in enumerate(index['ngrams'])}
+    }
+
+def keyword_column(columns, keyword, match='scan'):
+    if match == 'scan':
+        return columns['keywords'].get(keyword.lower())
+    return columns['ngrams'].get(normalize_term(keyword))
+
+def unscanned_keywords(columns, edge_keywords):
+    # Keywords the 'scan' mode can't count
+    return list(dict.fromkeys(
+        keyword for keywords in edge_keywords.values() for keyword in keywords
+        if keyword.lower() not in columns['keywords']
+    ))
+
+
+# Evaluation of a keyword table
+def keyword_matrix(columns, num_terms, edge_keywords, match='scan'):
+    # (term x edge type) number of times each term is listed for each type,
+    # and the keywords that occur in no article
+    rows, types, unknown = [], [], []
+    for j, keywords in enumerate(edge_keywords.values()):
+        for keyword in keywords:
+            column = keyword_column(columns, keyword, match)
+            if column is None:
+                unknown.append(keyword)
+                continue
+            rows.append(column)
+            types.append(j)
+    # Repeated (term, type) entries are summed, like a keyword listed twice
+    # is counted twice by pipeline.ground_truth_records
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (np.array(rows, dtype=np.int64), np.array(types, dtype=np.int64))),
+        shape=(num_terms, len(edge_keywords))
+    )
+    return matrix, list(dict.fromkeys(unknown))
+
+def truth_counts(doc_terms, columns, edge_keywords, edge_types, match='scan'):
+    # Ground truth keyword counts as an (article x edge type) array, with the
+    # articles of pipeline.ground_truth_records: those matching any keyword
+    matrix, index = doc_terms
+    keywords, unknown = keyword_matrix(columns, matrix.shape[1], edge_keywords, match)
+    counts = (matrix @ keywords).toarray()
+    keep = counts.sum(axis=1) > 0
+    positions = {edge_type: j for j, edge_type in enumerate(edge_keywords)}
+    actual = np.zeros((int(keep.sum()), len(edge_types)), dtype=np.int64)
+    for i, edge_type in enumerate(edge_types):
+        if edge_type in positions:
+            actual[:, i] = counts[keep, positions[edge_type]]
+    files = [file for file, kept in zip(index['files'], keep) if kept]
+    return files, actual, unknown
+
+def publication_matrix(files, publications):
+    # (article x publication) indicator of the publication each article's
+    # ground truth is compared with
+    position = publications.get_indexer(pipeline.article_publication(pd.Series(files, dtype=object)))
+    rows = np.flatnonzero(position >= 0)
+    return sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (rows, position[rows])), shape=(len(files), len(publications))
+    )
+
+def evaluate(doc_terms, columns, counts, edge_types, edge_keywords, algorithms=('ShadGPT', 'BassLine'), match='scan'):
+    # Confusion frames of every algorithm for another edge_keywords table.
+    # counts are the pipeline.publication_counts of the edges, with the
+    # edge_types as columns.
+    files, actual, unknown = truth_counts(doc_terms, columns, edge_keywords, edge_types, match)
+    confusion = {}
+    for algorithm in algorithms:
+        if algorithm in counts.index.get_level_values(0):
+            algorithm_counts = counts.xs(algorithm, level=0)
+        else:
+            algorithm_counts = pd.DataFrame(0, index=pd.Index([]), columns=edge_types, dtype='int64')
+        predicted = publication_matrix(files, algorithm_counts.index) @ algorithm_counts.to_numpy('int64')
+        totals = {
+            'TP': np.minimum(actual, predicted).sum(axis=0),
+            'FP': np.maximum(0, predicted - actual).sum(axis=0),
+            'FN': np.maximum(0, actual - predicted).sum(axis=0)
+        }
+        confusion[algorithm] = pipeline.confusion_frame(totals, edge_types)
+    return confusion, unknown
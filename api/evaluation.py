@@ -0,0 +1,149 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.abspath("./api/"))
+
+import pandas as pd
+
+import graph_store
+import ingest
+import pipeline
+
+# Evaluation of extracted knowledge graphs against the keyword ground truth
+# of the articles, outside the API. The articles are scanned once
+# (load_corpus) and every graph snapshot, an mc1.json or the output of one
+# extraction run in the same format, is then evaluated against those scans:
+# confusion counts and FP rates per edge type and the Sankey flows, for each
+# algorithm found in the snapshot. The batch mode fans the snapshots out over
+# a process pool, each worker receiving the scans once, and writes one
+# Parquet report in long format, one row per
+#   (snapshot, algorithm, 'confusion', edge type) with tp, fp, fn, fp_rate
+#   (snapshot, algorithm, 'sankey', sentiment, edge type) with total, tp, fp
+# Run from the repository root:
+#   python api/evaluation.py runs/*/mc1.json --out report.parquet --workers 4
+report_columns = [
+    'snapshot', 'algorithm', 'table', 'sentiment', 'edge_type', 'description',
+    'total', 'tp', 'fp', 'fn', 'fp_rate'
+]
+
+_corpus = None
+
+
+def load_corpus(folder=pipeline.articles_folder, workers=None):
+    # The keyword scans of the articles, everything the evaluation needs
+    ingested = ingest.ingest_articles(folder, workers=workers)
+    return {
+        'ground_truth': pd.DataFrame(ingested['source_truth']),
+        'sentiments': pipeline.article_sentiments(ingested['article_scans'])
+    }
+
+def evaluate_edges(corpus, edges_df, edge_types=None, algorithms=None):
+    # Confusion frames and FP rates by algorithm, and the Sankey flows of all
+    # of them, for the edges of one graph
+    if edge_types is None:
+        edge_types = list(edges_df['type'].unique())
+    if algorithms is None:
+        algorithms = list(edges_df['_algorithm'].dropna().unique())
+    confusion = pipeline.confusion_by_algorithm(corpus['ground_truth'], edges_df, algorithms, edge_types)
+    return {
+        'edge_types': list(edge_types),
+        'confusion': confusion,
+        'fp_rates': {algorithm: pipeline.compute_fp_rates(conf_df) for algorithm, conf_df in confusion.items()},
+        'sankey': pipeline.build_sankey(corpus['sentiments'], corpus['ground_truth'], edges_df, edge_types, tuple(algorithms))
+    }
+
+def evaluate_snapshot(corpus, path, algorithms=None):
+    store = graph_store.read_graph_file(path)
+    return evaluate_edges(corpus, store.edges_frame(), store.edge_types, algorithms)
+
+def report_frame(snapshot, results):
+    # The results of one snapshot in the long format of the report. Sankey
+    # flows only name their edge type by its description.
+    types_by_description = pd.Series({description: edge_type for edge_type, description in pipeline.edge_type_descriptions.items()})
+    frames = []
+    for algorithm, conf_df in results['confusion'].items():
+        frames.append(pd.DataFrame({
+            'algorithm': algorithm,
+            'table': 'confusion',
+            'edge_type': results['edge_types'],
+            'description': conf_df.index.to_numpy(object),
+            'total': (conf_df['TP'] + conf_df['FP']).to_numpy(),
+            'tp': conf_df['TP'].to_numpy(),
+            'fp': conf_df['FP'].to_numpy(),
+            'fn': conf_df['FN'].to_numpy(),
+            'fp_rate': results['fp_rates'][algorithm].to_numpy()
+        }))
+    # The Sankey flows are per article, the report sums them per flow
+    sankey = results['sankey'].groupby(['algorithm', 'sentiment', 'edge_type'], sort=False, as_index=False)[
+        ['total_count', 'tp_count', 'fp_count']
+    ].sum()
+    frames.append(pd.DataFrame({
+        'algorithm': sankey['algorithm'].to_numpy(object),
+        'table': 'sankey',
+        'sentiment': sankey['sentiment'].to_numpy(object),
+        'edge_type': types_by_description.reindex(sankey['edge_type']).to_numpy(object),
+        'description': sankey['edge_type'].to_numpy(object),
+        'total': sankey['total_count'].to_numpy(),
+        'tp': sankey['tp_count'].to_numpy(),
+        'fp': sankey['fp_count'].to_numpy(),
+        'fp_rate': (sankey['fp_count'] / sankey['total_count']).to_numpy()
+    }))
+    report = pd.concat(frames, ignore_index=True)
+    report['snapshot'] = snapshot
+    return report.reindex(columns=report_columns).astype({
+        'total': 'int64', 'tp': 'int64', 'fp': 'int64', 'fn': 'Int64', 'fp_rate': 'float64'
+    })
+
+
+# Batch mode
+def _init_worker(corpus):
+    global _corpus
+    _corpus = corpus
+
+def _evaluate_task(path, algorithms):
+    start = time.perf_counter()
+    report = report_frame(path, evaluate_snapshot(_corpus, path, algorithms))
+    return report, time.perf_counter() - start
+
+def evaluate_snapshots(paths, corpus, algorithms=None, workers=None):
+    # Yields (path, report frame, seconds) as the snapshots are evaluated
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        _init_worker(corpus)
+        for path in paths:
+            yield (path, *_evaluate_task(path, algorithms))
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(corpus,)) as pool:
+        futures = [pool.submit(_evaluate_task, path, algorithms) for path in paths]
+        for path, future in zip(paths, futures):
+            yield (path, *future.result())
+
+def write_report(report, path):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    report.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate knowledge graph snapshots against the article ground truth")
+    parser.add_argument('snapshots', nargs='+', help="mc1.json files or extraction outputs in the same format")
+    parser.add_argument('--out', default='evaluation.parquet', help="Parquet report to write")
+    parser.add_argument('--articles', default=pipeline.articles_folder, help="folder of the article .txt files")
+    parser.add_argument('--algorithms', nargs='+', help="only these algorithms, by default every one found")
+    parser.add_argument('--workers', type=int, default=0, help="processes, by default one per CPU")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    corpus = load_corpus(args.articles)
+    print(f"Scanned {len(corpus['sentiments'])} articles in {time.perf_counter() - start:.2f}s")
+    reports = []
+    for path, report, seconds in evaluate_snapshots(args.snapshots, corpus, args.algorithms, args.workers):
+        reports.append(report)
+        totals = report[report['table'] == 'confusion'].groupby('algorithm')[['tp', 'fp', 'fn']].sum()
+        for algorithm, row in totals.iterrows():
+            fp_rate = row['fp'] / (row['tp'] + row['fp']) if row['tp'] + row['fp'] else 0.0
+            print(f"{path}  {algorithm:<12} TP {row['tp']:>7} FP {row['fp']:>7} FN {row['fn']:>7} FP rate {fp_rate:.3f}  ({seconds:.2f}s)")
+    write_report(pd.concat(reports, ignore_index=True), args.out)
+    print(f"Wrote {args.out} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,249 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import metrics
+
+# Centrality and communities of the knowledge graph, or of the edges of some
+# algorithms and edge types, for ranking suspicious entities. The edges of the
+# graph store are turned into a SciPy sparse adjacency of the nodes they
+# touch, and every metric is computed with sparse matrix products:
+#   degree       in, out and total number of edges, as networkx counts them
+#   pagerank     power iteration, like networkx.pagerank
+#   betweenness  Brandes' algorithm from betweenness_samples sources at once,
+#                like networkx.betweenness_centrality(k=...); exact when the
+#                graph has no more nodes than that
+#   community    label propagation over the undirected graph
+# Results are kept in an LRU keyed by the (algorithms, edge types) filter and
+# reused while the graph store is the very same object.
+analytics_cache_size = int(os.environ.get('VAST_ANALYTICS_CACHE_SIZE', '32'))
+betweenness_samples = int(os.environ.get('VAST_BETWEENNESS_SAMPLES', '64'))
+pagerank_alpha = 0.85
+pagerank_tolerance = 1.0e-6
+max_iterations = 100
+node_metrics = ('degree', 'in_degree', 'out_degree', 'pagerank', 'betweenness')
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def normalize_filter(algorithms=None, edge_types=None):
+    # Order and duplicates don't change the result
+    return tuple(sorted(set(algorithms or ()))), tuple(sorted(set(edge_types or ())))
+
+def adjacency(edges_df, algorithms=(), edge_types=()):
+    # (codes, matrix): the store codes of the nodes the selected edges touch,
+    # and the number of edges from each of them to each other
+    mask = (edges_df['source'] >= 0) & (edges_df['target'] >= 0)
+    if algorithms:
+        mask &= edges_df['_algorithm'].isin(algorithms)
+    if edge_types:
+        mask &= edges_df['type'].isin(edge_types)
+    source = edges_df['source'].to_numpy()[mask.to_numpy()]
+    target = edges_df['target'].to_numpy()[mask.to_numpy()]
+    codes, endpoints = np.unique(np.concatenate((source, target)), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(source)), (endpoints[:len(source)], endpoints[len(source):])), shape=(len(codes), len(codes))
+    )
+    matrix.sum_duplicates()
+    return codes, matrix
+
+def pagerank(matrix, alpha=pagerank_alpha, tolerance=pagerank_tolerance):
+    # Rank flows along the edges in proportion to their count, the rank of
+    # nodes without outgoing edges is spread over every node
+    n = matrix.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    out_weight = np.asarray(matrix.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    transition = sparse.diags(np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)) @ matrix
+    transition_t = transition.T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iterations):
+        previous = rank
+        rank = alpha * (transition_t @ rank + previous[dangling].sum() / n) + (1 - alpha) / n
+        if np.abs(rank - previous).sum() < n * tolerance:
+            break
+    return rank
+
+def betweenness(matrix, samples=None, seed=0):
+    # Share of the shortest paths between pairs of nodes that pass through
+    # each node, edges counted once whatever their number. All sources are
+    # searched together: row v, column s of each (nodes x sources) array is
+    # node v in the search from source s.
+    n = matrix.shape[0]
+    samples = betweenness_samples if samples is None else samples
+    if n < 3:
+        return np.zeros(n)
+    linked = (matrix > 0).astype(np.float64).tocsr()
+    linked_t = linked.T.tocsr()
+    if samples >= n:
+        sources = np.arange(n)
+    else:
+        sources = np.sort(np.random.default_rng(seed).choice(n, samples, replace=False))
+    columns = np.arange(len(sources))
+
+    # Breadth first search, counting the shortest paths to every node
+    depth = np.full((n, len(sources)), -1, dtype=np.int64)
+    paths = np.zeros((n, len(sources)))
+    depth[sources, columns] = 0
+    paths[sources, columns] = 1.0
+    frontier = paths.copy()
+    level = 0
+    while frontier.any():
+        level += 1
+        reached = linked_t @ frontier
+        reached[depth >= 0] = 0
+        new = reached > 0
+        depth[new] = level
+        paths[new] = reached[new]
+        frontier = np.where(new, paths, 0.0)
+
+    # Dependencies, from the deepest level back to the sources
+    dependency = np.zeros((n, len(sources)))
+    for current in range(level - 2, 0, -1):
+        children = np.where(depth == current + 1, (1 + dependency) / np.where(paths > 0, paths, 1), 0.0)
+        at_level = depth == current
+        dependency[at_level] += (paths * (linked @ children))[at_level]
+    dependency[sources, columns] = 0
+    scale = 1.0 / ((n - 1) * (n - 2))
+    if len(sources) < n:
+        scale *= n / len(sources)
+    return dependency.sum(axis=1) * scale
+
+def communities(matrix, seed=0):
+    # Community of every node by label propagation: each node takes the label
+    # with the most edges among its neighbours (and itself), half of the
+    # nodes at a time so labels don't oscillate. Numbered by size.
+    n = matrix.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    undirected = (matrix + matrix.T + sparse.identity(n, format='csr')).tocsr()
+    labels = np.arange(n)
+    rng = np.random.default_rng(seed)
+    for _ in range(max_iterations):
+        changed = False
+        for half in np.array_split(rng.permutation(n), 2):
+            votes = undirected[half] @ sparse.csr_matrix((np.ones(n), (np.arange(n), labels)), shape=(n, n))
+            # Ties go to the lowest label
+            votes.sort_indices()
+            chosen = np.asarray(votes.argmax(axis=1)).ravel()
+            changed |= bool((chosen != labels[half]).any())
+            labels[half] = chosen
+        if not changed:
+            break
+    _, labels, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    by_size = np.argsort(-sizes, kind='stable')
+    return np.argsort(by_size, kind='stable')[labels]
+
+def modularity(matrix, labels):
+    # Newman modularity of the communities on the undirected graph
+    undirected = matrix + matrix.T
+    total = undirected.sum()
+    if total == 0:
+        return 0.0
+    coo = undirected.tocoo()
+    inside = coo.data[labels[coo.row] == labels[coo.col]].sum()
+    strength = np.bincount(labels, np.asarray(undirected.sum(axis=1)).ravel())
+    return float(inside / total - ((strength / total) ** 2).sum())
+
+@metrics.stage('graph_analytics')
+def build_analytics(store, algorithms=(), edge_types=()):
+    codes, matrix = adjacency(store.edges_frame(), algorithms, edge_types)
+    out_degree = np.asarray(matrix.sum(axis=1)).ravel().astype(np.int64)
+    in_degree = np.asarray(matrix.sum(axis=0)).ravel().astype(np.int64)
+    node_types = store.nodes.drop_duplicates('id').set_index('id')['type'] if 'type' in store.nodes else pd.Series(dtype=object)
+    ids = store.node_index[codes]
+    labels = communities(matrix)
+    frame = pd.DataFrame({
+        'id': ids.to_numpy(object),
+        'type': node_types.reindex(ids).to_numpy(object),
+        'degree': in_degree + out_degree,
+        'in_degree': in_degree,
+        'out_degree': out_degree,
+        'pagerank': pagerank(matrix),
+        'betweenness': betweenness(matrix),
+        'community': labels
+    })
+    return {
+        'store': store,
+        'nodes': frame,
+        'edges': int(matrix.sum()),
+        'communities': int(labels.max()) + 1 if len(labels) else 0,
+        'modularity': modularity(matrix, labels)
+    }
+
+def get_analytics(store, algorithms=(), edge_types=()):
+    key = normalize_filter(algorithms, edge_types)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry['store'] is store:
+            counters['hits'] += 1
+            _cache.move_to_end(key)
+            return entry
+        counters['misses'] += 1
+    # Computed outside the lock so a slow filter doesn't block cached ones
+    entry = build_analytics(store, *key)
+    with _lock:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > analytics_cache_size:
+            _cache.popitem(last=False)
+            counters['evictions'] += 1
+    return entry
+
+def evict():
+    with _lock:
+        evicted = len(_cache)
+        _cache.clear()
+        counters['evictions'] += evicted
+    return evicted
+
+def stats():
+    with _lock:
+        return {'size': len(_cache), 'capacity': analytics_cache_size, **counters}
+
+
+def node_records(frame):
+    records = frame.to_dict(orient='records')
+    for record in records:
+        if not isinstance(record['type'], str):
+            del record['type']
+    return records
+
+def ranking(entry, metric, top=20):
+    # The top nodes by one metric, with every metric of each
+    frame = entry['nodes'].sort_values([metric, 'id'], ascending=[False, True], kind='stable')
+    return {
+        'metric': metric,
+        'nodes': len(entry['nodes']),
+        'edges': entry['edges'],
+        'ranking': node_records(frame.iloc[0:top])
+    }
+
+def community_summary(entry, top=20, members=10):
+    # The largest communities with their size and most central members
+    frame = entry['nodes']
+    result = []
+    for community, group in frame.groupby('community', sort=True):
+        if community >= top:
+            break
+        central = group.sort_values(['pagerank', 'id'], ascending=[False, True], kind='stable').iloc[0:members]
+        result.append({
+            'community': int(community),
+            'size': len(group),
+            'types': group['type'].value_counts().to_dict(),
+            'members': node_records(central[['id', 'type', 'degree', 'pagerank', 'betweenness']])
+        })
+    return {
+        'nodes': len(frame),
+        'edges': entry['edges'],
+        'count': entry['communities'],
+        'modularity': entry['modularity'],
+        'communities': result
+    }
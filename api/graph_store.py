@@ -0,0 +1,357 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import artifact_store
+import json_stream
+import metrics
+
+# The knowledge graph file read by every module (the evaluation pipeline, the
+# bias enrichment, the subgraphs), so the process holds a single store
+graph_path = os.environ.get('VAST_GRAPH_PATH', './api/mc1.json')
+
+# Columns with few distinct values are stored as categoricals
+categorical_columns = ['type', '_algorithm', '_raw_source', '_articleid']
+
+# Binary snapshots of parsed graph files are kept in the artifact cache and
+# memory-mapped by later boots. Bump the version when the layout changes.
+snapshot_folder = 'graph_store'
+snapshot_version = 1
+
+logger = logging.getLogger('vast.graph_store')
+
+
+class GraphStore:
+    """Compact, shared representation of the knowledge graph.
+
+    Node ids are interned into integer codes (in the order NetworkX would add
+    them), links keep their endpoints as int32 codes and the low cardinality
+    columns as categoricals. Links are stored grouped by _algorithm so every
+    algorithm subset is a contiguous slice of one table, i.e. a view.
+    """
+
+    def __init__(self, graph_attrs, nodes, links):
+        self.directed = graph_attrs.get('directed', True)
+        self.multigraph = graph_attrs.get('multigraph', True)
+        self.graph = graph_attrs.get('graph', {})
+        self.nodes = nodes.reset_index(drop=True)
+
+        # Declared nodes first, then link endpoints that are not declared
+        links = links.reset_index(drop=True)
+        source_codes, target_codes, endpoint_ids = _endpoint_codes(links['source'], links['target'])
+        endpoints = np.column_stack((source_codes, target_codes)).ravel()
+        first_seen = pd.unique(endpoints[endpoints >= 0])
+        node_ids = pd.unique(np.concatenate((self.nodes['id'].to_numpy(object), endpoint_ids.to_numpy(object)[first_seen])))
+        self.node_index = pd.Index(node_ids)
+
+        node_codes = self.node_index.get_indexer(endpoint_ids)
+        links['source'] = np.where(source_codes >= 0, node_codes[source_codes], -1).astype('int32')
+        links['target'] = np.where(target_codes >= 0, node_codes[target_codes], -1).astype('int32')
+        for column in categorical_columns:
+            if column in links:
+                links[column] = links[column].astype('category')
+
+        self.edge_types = self._edge_type_order(links)
+        self.has_duplicate_edges = len(self._unique_edges(links)) != len(links)
+
+        # Group the links by algorithm, remembering how to restore file order
+        algorithm_codes = links['_algorithm'].cat.codes.to_numpy() if '_algorithm' in links else np.zeros(len(links), 'int8')
+        order = np.argsort(algorithm_codes, kind='stable')
+        self._set_links(links.iloc[order].reset_index(drop=True), np.argsort(order, kind='stable'))
+
+    def _set_links(self, links, file_order):
+        self.links = links
+        self.file_order = file_order
+        self.algorithm_slices = {}
+        if '_algorithm' in links:
+            sorted_codes = links['_algorithm'].cat.codes.to_numpy()
+            for code, algorithm in enumerate(links['_algorithm'].cat.categories):
+                start, stop = np.searchsorted(sorted_codes, [code, code + 1])
+                self.algorithm_slices[algorithm] = slice(int(start), int(stop))
+
+    @classmethod
+    def from_graph_data(cls, graph_data):
+        return cls(graph_data, pd.DataFrame(graph_data['nodes']), pd.DataFrame(graph_data['links']))
+
+    @classmethod
+    def from_snapshot(cls, meta, nodes, node_ids, links, file_order):
+        store = cls.__new__(cls)
+        store.directed = meta['directed']
+        store.multigraph = meta['multigraph']
+        store.graph = meta['graph']
+        store.nodes = nodes
+        store.node_index = pd.Index(node_ids)
+        store.edge_types = meta['edge_types']
+        store.has_duplicate_edges = meta['has_duplicate_edges']
+        store._set_links(links, file_order)
+        return store
+
+    def _unique_edges(self, links):
+        # NetworkX merges links with the same (source, target, key), the last
+        # value of each attribute in file order wins
+        if 'key' not in links:
+            return links
+        keyed = links['key'].notna()
+        if not links[keyed].duplicated(['source', 'target', 'key']).any():
+            return links
+        merged = links[keyed].groupby(['source', 'target', 'key'], sort=False, observed=True).last().reset_index()
+        merged.index = links[keyed].drop_duplicates(['source', 'target', 'key']).index
+        return pd.concat([merged, links[~keyed]]).sort_index()[links.columns]
+
+    def _edge_type_order(self, links):
+        # Edge types in the order NetworkX's edge iteration first meets them:
+        # by source node, then by first link to each target, then by key
+        edges = self._unique_edges(links)
+        if edges.empty:
+            return []
+        pair_order = edges.groupby(['source', 'target'], sort=False).ngroup().to_numpy()
+        order = np.lexsort((np.arange(len(edges)), pair_order, edges['source'].to_numpy()))
+        return list(pd.unique(edges['type'].to_numpy(object)[order]))
+
+    def number_of_nodes(self):
+        return len(self.node_index)
+
+    def number_of_edges(self):
+        return len(self.edges_frame())
+
+    def node_records(self, limit=None):
+        # Declared nodes as dicts, without the attributes a node doesn't have
+        return node_records(self.nodes if limit is None else self.nodes.iloc[0:limit])
+
+    def algorithm_edges(self, algorithm):
+        # Links of one algorithm, a slice of the shared table
+        return self.links.iloc[self.algorithm_slices.get(algorithm, slice(0, 0))]
+
+    def edges_frame(self):
+        # Edges as NetworkX sees them, endpoints as integer codes. Without
+        # duplicate links this is the shared table itself.
+        if not self.has_duplicate_edges:
+            return self.links
+        return self._unique_edges(self.links.iloc[self.file_order].reset_index(drop=True))
+
+    def links_frame(self):
+        # Links in file order with their endpoint ids, as in mc1.json
+        links = self.links.iloc[self.file_order].reset_index(drop=True)
+        return self._with_endpoint_ids(links)
+
+    def link_rows(self, positions):
+        # The rows of links_frame() at the given positions, without building
+        # the others
+        links = self.links.iloc[self.file_order[positions]].set_axis(pd.Index(positions, dtype='int64'))
+        return self._with_endpoint_ids(links)
+
+    def _with_endpoint_ids(self, links):
+        links['source'] = pd.Categorical.from_codes(links['source'], categories=self.node_index)
+        links['target'] = pd.Categorical.from_codes(links['target'], categories=self.node_index)
+        return links
+
+    def memory_usage(self):
+        return {
+            'nodes': int(self.nodes.memory_usage(deep=True).sum()),
+            'node_index': int(self.node_index.memory_usage(deep=True)),
+            'links': int(self.links.memory_usage(deep=True).sum()),
+            'file_order': int(self.file_order.nbytes)
+        }
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+def node_records(nodes):
+    # Rows of a node frame as dicts, without the attributes a node doesn't have
+    return [
+        {key: value for key, value in record.items() if not _is_missing(value)}
+        for record in nodes.to_dict(orient='records')
+    ]
+
+def _endpoint_codes(source, target):
+    # Codes of both endpoint columns into one table of ids
+    codes, ids = pd.factorize(np.concatenate((source.to_numpy(object), target.to_numpy(object))))
+    return codes[0:len(source)], codes[len(source):], pd.Index(ids, dtype=object)
+
+
+class ColumnBuilder:
+    """Turns a stream of records into a DataFrame a batch at a time.
+
+    Only one batch of record dicts is alive at once. String columns are
+    stored as categoricals within a batch, so repeated values share one
+    object once the batches are concatenated. The result has the columns and
+    dtypes pd.DataFrame(records) would give, with `categorical` columns as
+    categoricals.
+    """
+
+    def __init__(self, categorical=(), batch_size=10000):
+        self.categorical = set(categorical)
+        self.batch_size = batch_size
+        self.batch = []
+        self.frames = []
+
+    def append(self, record):
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        start = sum(len(frame) for frame in self.frames)
+        frame = pd.DataFrame(self.batch, index=pd.RangeIndex(start, start + len(self.batch)))
+        self.batch = []
+        for column in frame.columns:
+            # Columns with missing values are left alone, a categorical would
+            # turn None into NaN
+            if frame[column].dtype == object and not frame[column].isna().any():
+                try:
+                    frame[column] = frame[column].astype('category')
+                except TypeError:
+                    # Unhashable values such as lists stay objects
+                    pass
+        self.frames.append(frame)
+
+    def frame(self):
+        if self.batch or not self.frames:
+            self._flush()
+        # Column by column, a column missing from a batch is NaN there
+        length = sum(len(frame) for frame in self.frames)
+        data = {}
+        for column in dict.fromkeys(column for frame in self.frames for column in frame.columns):
+            parts = [frame[column] for frame in self.frames if column in frame]
+            series = pd.concat(parts) if len(parts) > 1 else parts[0]
+            data[column] = series if len(series) == length else series.reindex(pd.RangeIndex(length))
+        frame = pd.DataFrame(data, index=pd.RangeIndex(length))
+        self.frames = []
+        for column in frame.columns:
+            if isinstance(frame[column].dtype, pd.CategoricalDtype) and column not in self.categorical:
+                frame[column] = frame[column].astype(object)
+            elif column in self.categorical:
+                frame[column] = frame[column].astype('category')
+        return frame
+
+
+def read_graph_file(path):
+    # Streams the nodes and links of a node-link JSON file into columns,
+    # without building the document tree
+    graph_attrs = {}
+    nodes = ColumnBuilder()
+    links = ColumnBuilder(categorical_columns)
+    with open(path, 'r') as file:
+        for key, value in json_stream.iter_object_arrays(file, ('nodes', 'links')):
+            if key == 'nodes':
+                nodes.append(value)
+            elif key == 'links':
+                links.append(value)
+            else:
+                graph_attrs[key] = value
+    return GraphStore(graph_attrs, nodes.frame(), links.frame())
+
+
+# Binary snapshots
+def snapshot_path(path, fingerprint):
+    # One snapshot folder per graph file and content, None without a cache
+    if not artifact_store.enabled():
+        return None
+    file_key = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[0:12]
+    return os.path.join(artifact_store.cache_dir, snapshot_folder, f'{file_key}-{fingerprint}')
+
+def _write_table(frame, path):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if any(pa.types.is_nested(field.type) for field in table.schema):
+        # Lists and dicts wouldn't come back as the same Python values
+        raise TypeError("nested values can't be stored in a snapshot")
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+def _read_table(path):
+    # Memory-mapped, primitive columns without nulls are not copied
+    return pa.ipc.open_file(pa.memory_map(path)).read_all().to_pandas(split_blocks=True)
+
+def write_snapshot(store, folder):
+    tmp_folder = f'{folder}.{os.getpid()}.tmp'
+    os.makedirs(tmp_folder, exist_ok=True)
+    try:
+        _write_table(store.links.assign(file_order=store.file_order), os.path.join(tmp_folder, 'links.arrow'))
+        _write_table(store.nodes, os.path.join(tmp_folder, 'nodes.arrow'))
+        _write_table(pd.DataFrame({'id': store.node_index.to_numpy(object)}), os.path.join(tmp_folder, 'node_ids.arrow'))
+        meta = {
+            'version': snapshot_version,
+            'directed': store.directed,
+            'multigraph': store.multigraph,
+            'graph': store.graph,
+            'edge_types': store.edge_types,
+            'has_duplicate_edges': store.has_duplicate_edges
+        }
+        with open(os.path.join(tmp_folder, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(tmp_folder, folder)
+    finally:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+
+def read_snapshot(folder):
+    with open(os.path.join(folder, 'meta.json'), 'r') as file:
+        meta = json.load(file)
+    if meta.get('version') != snapshot_version:
+        raise ValueError(f"Snapshot version {meta.get('version')} is not {snapshot_version}")
+    links = _read_table(os.path.join(folder, 'links.arrow'))
+    file_order = links.pop('file_order').to_numpy()
+    nodes = _read_table(os.path.join(folder, 'nodes.arrow'))
+    node_ids = _read_table(os.path.join(folder, 'node_ids.arrow'))['id'].to_numpy(object)
+    return GraphStore.from_snapshot(meta, nodes, node_ids, links, file_order)
+
+@metrics.stage('load_graph')
+def open_store(path, fingerprint):
+    # The snapshot of this file content if there is one, otherwise the file
+    # is streamed and a snapshot is written for the next boot
+    folder = snapshot_path(path, fingerprint)
+    if folder and os.path.isdir(folder):
+        try:
+            return read_snapshot(folder)
+        except (OSError, ValueError, KeyError, pa.ArrowException) as e:
+            logger.warning("Ignoring graph snapshot %s: %r", folder, e)
+    store = read_graph_file(path)
+    if folder:
+        try:
+            parent = os.path.dirname(folder)
+            os.makedirs(parent, exist_ok=True)
+            # Snapshots of earlier contents of the same file are not needed
+            file_key = os.path.basename(folder).split('-')[0]
+            for name in os.listdir(parent):
+                if name.startswith(file_key + '-') and not name.endswith('.tmp'):
+                    shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+            write_snapshot(store, folder)
+            # Remember the file hash so the next boot only needs a stat
+            artifact_store.write_manifest()
+        except (OSError, TypeError, ValueError, pa.ArrowException) as e:
+            logger.warning("Graph snapshot not written: %r", e)
+    return store
+
+
+# The store of the current content of each graph file, shared by every
+# module. Stores are keyed by the content hash, so files with the same
+# content share one store, and a file that changed is loaded again on the
+# next call; stores no file has anymore are dropped.
+_stores = {}
+_fingerprints = {}
+_lock = threading.Lock()
+
+def load_store(path=None):
+    path = path or graph_path
+    fingerprint = artifact_store.file_fingerprint(path)
+    with _lock:
+        store = _stores.get(fingerprint)
+        if store is None:
+            store = _stores[fingerprint] = open_store(path, fingerprint)
+        _fingerprints[os.path.abspath(path)] = fingerprint
+        for stale in set(_stores) - set(_fingerprints.values()):
+            del _stores[stale]
+        return store
+
+def held_stores():
+    # The stores currently shared, by content hash
+    with _lock:
+        return dict(_stores)
@@ -1,251 +1,410 @@
-from fastapi import FastAPI
-import networkx as nx
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional
 import json
-import pandas as pd
 import os
+import time
+import pandas as pd
 import sys
-import os
 sys.path.append(os.path.abspath("./api/"))
+import artifacts
+import artifact_store
+import bias_aggregates
+import bias_detection
+import bias_extraction
+import bias_store
+import columnar
+import doc_terms
+import graph_analytics
+import ingest
+import layout
+import metrics
+import pipeline
+import refresh
+import responses
+import subgraph
+import text_index
 from bias_detection import load_graph
 import uvicorn
 
 
 app = FastAPI()
 
-# Define edge_type_descriptions at the top
-edge_type_descriptions = {
-    'Event.Invest': 'Investments (e.g., funding or capital deals)',
-    'Event.Aid': 'Aid/Support (e.g., relief or assistance efforts)',
-    'Event.Transaction': 'Transactions (e.g., trades or payments)',
-    'Event.Fishing.SustainableFishing': 'Sustainable Fishing (e.g., eco-friendly fishing)',
-    'Event.Fishing': 'Fishing Activities (e.g., general fishing events)',
-    'Event.Fishing.OverFishing': 'Overfishing (e.g., excessive or illegal fishing)',
-    'Event.Convicted': 'Convictions (e.g., legal guilty verdicts)',
-    'Event.Applaud': 'Praises (e.g., commendations or honors)',
-    'Event.CertificateIssued': 'Certificates Issued (e.g., permits or licenses)',
-    'Event.Criticize': 'Criticisms (e.g., blame or denunciations)',
-    'Event.Owns.PartiallyOwns': 'Ownership (e.g., stakes or shares)',
-    'Event.Communication.Conference': 'Conferences (e.g., meetings or summits)',
-    'Event.CertificateIssued.Summons': 'Summons Issued (e.g., legal notices or citations)'
-}
-
-# Step 1 & Step 2: Load the graph and process edges
-with open('./api/mc1.json', 'r') as f:
-    graph_data = json.load(f)
-G = nx.node_link_graph(graph_data, directed=True, multigraph=True, edges="links")
-print(f"Nodes: {G.number_of_nodes()}")
-print(f"Edges: {G.number_of_edges()}")
-nodes = [{'id': n, **G.nodes[n]} for n in G.nodes()]
-edges = [{'source': u, 'target': v, 'key': k, **d} for u, v, k, d in G.edges(keys=True, data=True)]
-edges_df = pd.DataFrame(edges)
-shadgpt_edges = edges_df[edges_df['_algorithm'] == 'ShadGPT'].copy()
-bassline_edges = edges_df[edges_df['_algorithm'] == 'BassLine'].copy()
-
-# Step 3: Load articles
-articles_folder = './api/articles'
-article_files = [f for f in os.listdir(articles_folder) if f.endswith('.txt')]
-articles_content = {}
-for file in article_files:
-    with open(os.path.join(articles_folder, file), 'r', encoding='utf-8') as f:
-        articles_content[file] = f.read()
-
-source_mapping = {file: file for file in article_files}
-
-# Step 4: Define edge keywords and process articles for ground truth
-edge_keywords = {
-    'Event.Aid': ['aid', 'help', 'support', 'assistance', 'relief'],
-    'Event.Fishing': ['fish', 'fishing', 'catch', 'harvest', 'net'],
-    'Event.Transaction': ['deal', 'trade', 'payment', 'transaction', 'sold', 'bought'],
-    'Event.Fishing.OverFishing': ['overfish', 'illegal fishing', 'excessive', 'quota exceeded', 'unsustainable'],
-    'Event.Fishing.SustainableFishing': ['sustainable', 'eco-friendly', 'responsible fishing', 'green fishing'],
-    'Event.Convicted': ['convict', 'guilty', 'caught', 'sentenced', 'fined'],
-    'Event.Applaud': ['applaud', 'praise', 'commend', 'honor', 'celebrate'],
-    'Event.CertificateIssued': ['certificate', 'issued', 'permit', 'license', 'approved'],
-    'Event.Criticize': ['criticize', 'condemn', 'blame', 'denounce', 'fault'],
-    'Event.Owns.PartiallyOwns': ['owns', 'stake', 'share', 'partially owns', 'controls'],
-    'Event.Communication.Conference': ['conference', 'meeting', 'summit', 'discussion', 'talks'],
-    'Event.Invest': ['invest', 'funding', 'capital', 'backing', 'financed'],
-    'Event.CertificateIssued.Summons': ['summons', 'citation', 'notice', 'violation', 'order']
-}
-
-source_truth = []
-for source, file in source_mapping.items():
-    text = articles_content[file].lower()
-    edge_counts = {}
-    for edge_type, keywords in edge_keywords.items():
-        count = sum(text.count(kw) for kw in keywords)
-        if count > 0:
-            edge_counts[edge_type] = count
-    if edge_counts:
-        source_truth.append({
-            'source': source,
-            'filename': file,
-            'edge_types': edge_counts
-        })
-
-source_df = pd.DataFrame(source_truth)
-
-# Step 5: Calculate confusion matrices
-edge_types = edges_df['type'].unique()
-shadgpt_confusion = {et: {'TP': 0, 'FP': 0, 'FN': 0} for et in edge_types}
-bassline_confusion = {et: {'TP': 0, 'FP': 0, 'FN': 0} for et in edge_types}
-
-for _, row in source_df.iterrows():
-    source = row['source']
-    source_part = source.split('__')[-1].replace('.txt', '')
-    truth_edges = row['edge_types']
-    shadgpt_source_edges = shadgpt_edges[shadgpt_edges['_raw_source'] == source_part]['type'].value_counts()
-    bassline_source_edges = bassline_edges[bassline_edges['_raw_source'] == source_part]['type'].value_counts()
-    
-    for et in edge_types:
-        truth_count = truth_edges.get(et, 0)
-        shadgpt_count = shadgpt_source_edges.get(et, 0)
-        bassline_count = bassline_source_edges.get(et, 0)
-        
-        shadgpt_confusion[et]['TP'] += min(truth_count, shadgpt_count)
-        shadgpt_confusion[et]['FP'] += max(0, shadgpt_count - truth_count)
-        shadgpt_confusion[et]['FN'] += max(0, truth_count - shadgpt_count)
-        
-        bassline_confusion[et]['TP'] += min(truth_count, bassline_count)
-        bassline_confusion[et]['FP'] += max(0, bassline_count - truth_count)
-        bassline_confusion[et]['FN'] += max(0, truth_count - bassline_count)
-
-shadgpt_conf_df = pd.DataFrame(shadgpt_confusion).T
-bassline_conf_df = pd.DataFrame(bassline_confusion).T
-
-# Fill NaN values with 0 to ensure JSON serialization
-shadgpt_conf_df = shadgpt_conf_df.fillna(0)
-bassline_conf_df = bassline_conf_df.fillna(0)
-
-# Map the indices
-shadgpt_conf_df.index = shadgpt_conf_df.index.map(edge_type_descriptions)
-bassline_conf_df.index = bassline_conf_df.index.map(edge_type_descriptions)
-
-# Print the DataFrames to debug
-print("ShadGPT Confusion DataFrame:")
-print(shadgpt_conf_df)
-print("BassLine Confusion DataFrame:")
-print(bassline_conf_df)
-
-# Step 6: Sentiment inference
-def infer_sentiment(text):
-    pos_words = ['praise', 'sustainable', 'approved', 'commend', 'honor', 'success', 'benefit', 'great', 'positive']
-    neg_words = ['illegal', 'guilty', 'condemn', 'overfish', 'violation', 'fined', 'criticize', 'blame', 'disaster', 'fail', 'caught', 'unsustainable', 'excessive', 'quota']
-    neutral_words = ['report', 'discuss', 'meeting', 'conference', 'update', 'event']
-    text = text.lower()
-    pos_count = sum(1 for w in pos_words if w in text)
-    neg_count = sum(1 for w in neg_words if w in text)
-    neu_count = sum(1 for w in neutral_words if w in text)
-    if neg_count > pos_count and neg_count > neu_count:
-        return 'Negative'
-    elif pos_count > neg_count and pos_count > neu_count:
-        return 'Positive'
-    return 'Neutral'
-
-# Step 7: Prepare Sankey data
-sankey_data = []
-sentiment_counts = {'Positive': 0, 'Negative': 0, 'Neutral': 0}
-for file in source_mapping.values():
-    text = articles_content[file]
-    sentiment = infer_sentiment(text)
-    sentiment_counts[sentiment] += 1
-    source_part = file.split('__')[-1].replace('.txt', '')
-    shadgpt_edges_source = shadgpt_edges[shadgpt_edges['_raw_source'].isin([source_part, file])]['type'].value_counts()
-    bassline_edges_source = bassline_edges[bassline_edges['_raw_source'].isin([source_part, file])]['type'].value_counts()
-    truth_edges = source_df[source_df['source'] == file]['edge_types'].iloc[0] if file in source_df['source'].values else {}
-    
-    for et in edge_types:
-        shadgpt_count = shadgpt_edges_source.get(et, 0)
-        bassline_count = bassline_edges_source.get(et, 0)
-        truth_count = truth_edges.get(et, 0)
-        shadgpt_tp = min(truth_count, shadgpt_count)
-        shadgpt_fp = max(0, shadgpt_count - truth_count)
-        bassline_tp = min(truth_count, bassline_count)
-        bassline_fp = max(0, bassline_count - truth_count)
-        
-        if shadgpt_count > 0:
-            sankey_data.append({
-                'sentiment': sentiment,
-                'edge_type': et,
-                'algorithm': 'ShadGPT',
-                'total_count': shadgpt_count,
-                'tp_count': shadgpt_tp,
-                'fp_count': shadgpt_fp
-            })
-        if bassline_count > 0:
-            sankey_data.append({
-                'sentiment': sentiment,
-                'edge_type': et,
-                'algorithm': 'BassLine',
-                'total_count': bassline_count,
-                'tp_count': bassline_tp,
-                'fp_count': bassline_fp
-            })
-
-sankey_df = pd.DataFrame(sankey_data)
-
-# Step 8: Map event types to descriptions for sankey_df
-sankey_df['edge_type'] = sankey_df['edge_type'].map(edge_type_descriptions)
-
-# Step 9: Calculate FP rates with NaN handling
-shadgpt_fp_rate = (shadgpt_conf_df['FP'] / (shadgpt_conf_df['TP'] + shadgpt_conf_df['FP'])).fillna(0)
-bassline_fp_rate = (bassline_conf_df['FP'] / (bassline_conf_df['TP'] + bassline_conf_df['FP'])).fillna(0)
-
-# Print FP rates to debug
-print("ShadGPT FP Rates:")
-print(shadgpt_fp_rate)
-print("BassLine FP Rates:")
-print(bassline_fp_rate)
+num_nodes = 100
+
+# Every derived artifact is built on first use (or by the background warm up
+# started below) and cached once per process, so the server binds its port
+# without waiting for the pipeline.
+def build_ingest():
+    return ingest.ingest_articles()
+
+def build_confusion():
+    store = artifacts.get('graph_store')
+    return pipeline.compute_confusion(artifacts.get('ground_truth'), store.edges_frame(), store.edge_types)
+
+def build_fp_rates():
+    shadgpt_conf_df, bassline_conf_df = artifacts.get('confusion')
+    return pipeline.compute_fp_rates(shadgpt_conf_df), pipeline.compute_fp_rates(bassline_conf_df)
+
+def build_doc_terms():
+    ingested = artifacts.get('ingest')
+    return doc_terms.build_doc_terms(ingested['articles_content'], ingested['article_scans'])
+
+def build_publication_counts():
+    store = artifacts.get('graph_store')
+    return pipeline.publication_counts(store.edges_frame(), store.edge_types)
+
+def build_sankey():
+    store = artifacts.get('graph_store')
+    return pipeline.build_sankey(artifacts.get('sentiments'), artifacts.get('ground_truth'), store.edges_frame(), store.edge_types)
+
+# Fingerprints of everything the cached artifacts are derived from
+def pipeline_inputs():
+    return {
+        'graph': artifact_store.file_fingerprint(pipeline.graph_path),
+        'articles': artifact_store.folder_fingerprint(pipeline.articles_folder, '.txt'),
+        'keywords': artifact_store.value_fingerprint(pipeline.keyword_tables())
+    }
+
+def graph_inputs():
+    return {
+        'graph': artifact_store.file_fingerprint(bias_detection.data_path),
+        'articles': artifact_store.folder_fingerprint(bias_detection.articles_base_path, '.txt'),
+        'bias': artifact_store.folder_fingerprint(bias_store.bias_base_path, '.json'),
+        'num_nodes': num_nodes,
+        'link_match': bias_detection.link_match
+    }
+
+def bias_inputs():
+    inputs = {
+        'graph': artifact_store.file_fingerprint(bias_detection.data_path),
+        'bias': artifact_store.folder_fingerprint(bias_store.bias_base_path, '.json'),
+        'bias_types': bias_detection.bias_types
+    }
+    if os.path.isfile(bias_store.consolidated_path):
+        inputs['consolidated'] = artifact_store.file_fingerprint(bias_store.consolidated_path)
+    return inputs
+
+def build_bias_summary():
+    return bias_aggregates.build_summary(bias_detection.get_store(), bias_store.all_biases(), bias_detection.bias_types)
+
+artifacts.register('graph_store', pipeline.load_graph_store, warm=False)
+artifacts.register('ingest', build_ingest, warm=False)
+artifacts.register('article_scans', lambda: artifacts.get('ingest')['article_scans'], warm=False)
+artifacts.register('ground_truth', lambda: pd.DataFrame(artifacts.get('ingest')['source_truth']), warm=False)
+artifacts.register('sentiments', lambda: pipeline.article_sentiments(artifacts.get('article_scans')), warm=False)
+artifacts.register('confusion', build_confusion, inputs=pipeline_inputs)
+artifacts.register('fp_rates', build_fp_rates, inputs=pipeline_inputs)
+artifacts.register('sankey', build_sankey, inputs=pipeline_inputs)
+artifacts.register('sankey_top', lambda: pipeline.top_sankey_records(artifacts.get('sankey')))
+artifacts.register('doc_terms', build_doc_terms, inputs=pipeline_inputs)
+artifacts.register('term_columns', lambda: doc_terms.term_columns(artifacts.get('doc_terms')[1]), warm=False)
+artifacts.register('publication_counts', build_publication_counts, warm=False)
+artifacts.register('text_index', lambda: text_index.build_text_index(artifacts.get('ingest')['article_postings']), inputs=pipeline_inputs)
+artifacts.register('text_lookup', lambda: text_index.lookup_table(artifacts.get('text_index')))
+artifacts.register('graph', lambda: load_graph(num_nodes), inputs=graph_inputs)
+artifacts.register('bias_summary', build_bias_summary, inputs=bias_inputs)
+
+
+# Bias files written by the background extraction are picked up like any
+# other changed file
+bias_extraction.listeners.append(refresh.request_refresh)
+
+metrics.register_cache('bias', bias_store.stats)
+metrics.register_cache('subgraph', subgraph.stats)
+metrics.register_cache('layout', layout.stats)
+metrics.register_cache('analytics', graph_analytics.stats)
+metrics.register_cache('response', responses.stats)
+
+def print_startup_report():
+    # One JSON line with the time and memory taken by each pipeline stage
+    print(json.dumps({'startup_report': {**metrics.report(), 'artifacts': artifacts.status()}}))
+
+@app.on_event("startup")
+def warm_up_artifacts():
+    refresh.record_baseline()
+    # Set VAST_WARM_UP=0 to only build artifacts when they are first requested
+    if os.environ.get("VAST_WARM_UP", "1") != "0":
+        artifacts.start_background_warm_up(on_done=print_startup_report)
+    # Set VAST_WATCH=1 to refresh the artifacts whenever an input file changes
+    if os.environ.get("VAST_WATCH", "0") == "1":
+        refresh.start_watcher()
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Labelled with the route, not the URL, so query strings and unknown
+    # paths don't add series
+    route = request.scope.get('route')
+    endpoint = route.path if route is not None else 'unmatched'
+    metrics.observe('vast_request_seconds', time.perf_counter() - start, endpoint=endpoint, method=request.method)
+    metrics.inc('vast_requests_total', endpoint=endpoint, method=request.method, status=str(response.status_code))
+    return response
 
 # API Endpoints
-@app.get("/confusion")
-async def get_confusion():
+@app.get("/ready")
+def get_ready():
+    status = {**artifacts.status(), 'process': refresh.process_info()}
+    return JSONResponse(status, status_code=200 if status['ready'] else 503)
+
+# The read-only endpoints below serve bodies encoded once per data version,
+# see responses.py
+def confusion_content(confusion):
+    shadgpt_conf_df, bassline_conf_df = confusion
     return {
         "shadgpt_confusion": shadgpt_conf_df.to_dict(),
         "bassline_confusion": bassline_conf_df.to_dict()
     }
 
-@app.get("/fp_rates")
-async def get_fp_rates():
+def fp_rates_content(fp_rates):
+    shadgpt_fp_rate, bassline_fp_rate = fp_rates
     return {
         "shadgpt_fp_rate": shadgpt_fp_rate.to_dict(),
         "bassline_fp_rate": bassline_fp_rate.to_dict()
     }
 
-@app.get("/sankey")
-async def get_sankey():
-    top_edges = sankey_df.groupby('edge_type')['fp_count'].sum().nlargest(5).index
-    sankey_df_top = sankey_df[sankey_df['edge_type'].isin(top_edges)]
-    return sankey_df_top.to_dict(orient="records")
-
+@app.get("/confusion")
+def get_confusion(request: Request):
+    return responses.cached_response(request, 'confusion', artifacts.get('confusion'), confusion_content)
 
+@app.get("/fp_rates")
+def get_fp_rates(request: Request):
+    return responses.cached_response(request, 'fp_rates', artifacts.get('fp_rates'), fp_rates_content)
 
-num_nodes = 100
+@app.get("/sankey")
+def get_sankey(request: Request, top: int = Query(5, ge=0)):
+    # Flows of the `top` edge types with the most false positives
+    sankey_top = artifacts.get('sankey_top')
+    top = min(top, len(sankey_top) - 1)
+    return responses.cached_response(request, ('sankey', top), sankey_top, lambda tables: tables[top])
+
+# What-if evaluation of another keyword table against the precomputed
+# document-term counts, see doc_terms.py. Every keyword of a request is
+# matched the same way: with match 'scan' (the default, giving the published
+# numbers for the current table) only the pipeline keywords can be used,
+# with 'word' any keyword is counted as whole words. Edge types must be
+# edge types of the graph. Keywords that occur in no article are listed in
+# unknown_keywords.
+class EvaluateRequest(BaseModel):
+    edge_keywords: Dict[str, List[str]]
+    match: Literal['scan', 'word'] = 'scan'
+
+@app.post("/evaluate")
+def post_evaluate(body: EvaluateRequest):
+    store = artifacts.get('graph_store')
+    columns = artifacts.get('term_columns')
+    unknown_types = [edge_type for edge_type in body.edge_keywords if edge_type not in store.edge_types]
+    if unknown_types:
+        raise HTTPException(status_code=422, detail=f"Unknown edge types: {', '.join(unknown_types)}")
+    if body.match == 'scan':
+        unscanned = doc_terms.unscanned_keywords(columns, body.edge_keywords)
+        if unscanned:
+            raise HTTPException(
+                status_code=422, detail=f"Not in the keyword scan, use match 'word': {', '.join(unscanned)}"
+            )
+    confusion, unknown = doc_terms.evaluate(
+        artifacts.get('doc_terms'), columns, artifacts.get('publication_counts'),
+        store.edge_types, body.edge_keywords, match=body.match
+    )
+    confusion = (confusion['ShadGPT'], confusion['BassLine'])
+    fp_rates = tuple(pipeline.compute_fp_rates(conf_df) for conf_df in confusion)
+    return responses.json_response({
+        **confusion_content(confusion),
+        **fp_rates_content(fp_rates),
+        "unknown_keywords": unknown
+    })
+
+# Passages behind the counts, see text_index.py. edge_type is a type or its
+# description, as shown by /confusion.
+edge_types_by_description = {description: edge_type for edge_type, description in pipeline.edge_type_descriptions.items()}
+
+@app.get("/evidence")
+def get_evidence(
+    edge_type: str,
+    source: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=1000),
+    snippets: int = Query(3, ge=0, le=100)
+):
+    edge_type = edge_types_by_description.get(edge_type, edge_type)
+    if edge_type not in pipeline.edge_keywords:
+        raise HTTPException(status_code=404, detail=f"No keywords for edge type {edge_type}")
+    return responses.json_response(text_index.evidence(artifacts.get('text_lookup'), edge_type, source, limit, snippets))
+
+@app.get("/search")
+def get_search(
+    q: str,
+    limit: int = Query(20, ge=1, le=1000),
+    snippets: int = Query(3, ge=0, le=100)
+):
+    try:
+        result = text_index.search(artifacts.get('text_lookup'), q, limit, snippets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return responses.json_response(result)
 
-graph = load_graph(num_nodes)
 
 @app.get("/api")
 def hello_world():
     return {"message": "Hello World", "api": "Python"}
 
 
+# Query parameters shared by /links, /nodes and /graph. Without any of them
+# the first num_nodes nodes are returned, as before.
+def subgraph_params(
+    limit: int = num_nodes,
+    node_type: Optional[List[str]] = Query(None),
+    type: Optional[List[str]] = Query(None),
+    algorithm: Optional[List[str]] = Query(None),
+    source: Optional[List[str]] = Query(None),
+    seed: Optional[str] = None,
+    hops: int = 1
+):
+    return subgraph.normalize_params(limit, node_type, type, algorithm, source, seed, hops)
+
+default_subgraph_params = subgraph.normalize_params(num_nodes)
+
+def load_subgraph(params):
+    if params == default_subgraph_params:
+        return artifacts.get('graph')['graph']
+    return subgraph.get_subgraph(params)
+
+# /graph and /nodes give every node x and y, a starting layout computed once
+# per subgraph (see layout.py) that the force graph can render straight away
+def load_layout(params):
+    return layout.get_layout(params, load_subgraph(params))
+
+# /links and /nodes can also be read a page at a time (page_size, then the
+# returned next_cursor) or streamed as NDJSON (format=ndjson or an Accept:
+# application/x-ndjson header, from cursor and up to page_size if given).
+# Both read the rows from the store chunk by chunk.
+def page_params(
+    cursor: Optional[str] = None,
+    page_size: Optional[int] = Query(None, ge=1, le=100000),
+    format: Optional[str] = None
+):
+    return {'cursor': cursor, 'page_size': page_size, 'format': format}
+
+# /graph, /nodes and /links are also served as Arrow IPC, see columnar.py
+def arrow_response(request, kind, params):
+    tables = {
+        'graph': columnar.graph_tables,
+        'nodes': lambda graph: [columnar.nodes_table(graph['nodes'])],
+        'links': lambda graph: [columnar.links_table(graph['links'], [node['id'] for node in graph['nodes']])]
+    }
+    graph = load_subgraph(params) if kind == 'links' else load_layout(params)['graph']
+    return responses.cached_response(
+        request, (kind, 'arrow', params), graph, tables[kind],
+        encoder=columnar.write_streams, media_type=columnar.media_type
+    )
+
+def with_positions(kind, params, records):
+    # Positions come from the node selection alone (see layout.py), and are
+    # only computed once the first record is needed
+    if kind == 'links':
+        return records
+    return positioned(params, records)
+
+def positioned(params, records):
+    positions = None
+    for record in records:
+        if positions is None:
+            positions = layout.get_positions(params)
+        yield {**record, **dict(zip(('x', 'y'), positions.get(record['id'], (None, None))))}
+
+def subgraph_rows(request, kind, params, paging):
+    if columnar.wants_arrow(request, paging['format']):
+        if paging['cursor'] or paging['page_size']:
+            raise HTTPException(status_code=400, detail="Pages are only served as JSON or NDJSON")
+        return arrow_response(request, kind, params)
+    try:
+        after = subgraph.decode_cursor(paging['cursor']) if paging['cursor'] else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if responses.wants_ndjson(request, paging['format']):
+        rows = (record for _, record in subgraph.iter_records(kind, params, after, paging['page_size']))
+        return responses.ndjson_response(with_positions(kind, params, rows))
+    if paging['cursor'] or paging['page_size']:
+        result = subgraph.page(kind, params, after, paging['page_size'])
+        result['items'] = list(with_positions(kind, params, result['items']))
+        return responses.json_response(result)
+    graph = load_subgraph(params) if kind == 'links' else load_layout(params)['graph']
+    return responses.cached_response(request, (kind, params), graph, lambda graph: graph[kind])
+
 @app.get('/links')
-def get_links(): 
-    global graph
-    return graph['links']
+def get_links(request: Request, params=Depends(subgraph_params), paging=Depends(page_params)):
+    return subgraph_rows(request, 'links', params, paging)
 
 @app.get('/nodes')
-def get_nodes():
-    global graph
-    return graph['nodes']
+def get_nodes(request: Request, params=Depends(subgraph_params), paging=Depends(page_params)):
+    return subgraph_rows(request, 'nodes', params, paging)
 
 @app.get('/graph')
-def get_graph(): 
-    global graph
-    return graph['graph']
-    
+def get_graph(request: Request, params=Depends(subgraph_params), format: Optional[str] = None):
+    if columnar.wants_arrow(request, format):
+        return arrow_response(request, 'graph', params)
+    return responses.cached_response(request, ('graph', params), load_layout(params)['graph'], lambda graph: graph)
+
+@app.get('/graph/cache')
+def get_graph_cache():
+    return {**subgraph.stats(), 'layouts': layout.stats(), 'analytics': graph_analytics.stats(), 'responses': responses.stats()}
+
+@app.delete('/graph/cache')
+def evict_graph_cache():
+    return {'evicted': subgraph.evict(), 'layouts_evicted': layout.evict(), 'analytics_evicted': graph_analytics.evict()}
+
+# Bias passage counts by publication, entity and algorithm, see
+# bias_aggregates.py. by picks some of the rollups, all of them by default.
+@app.get('/bias/summary')
+def get_bias_summary(request: Request, by: Optional[List[str]] = Query(None)):
+    by = tuple(sorted(set(by or ())))
+    unknown = [rollup for rollup in by if rollup not in bias_aggregates.rollups]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(bias_aggregates.rollups)}")
+    return responses.cached_response(
+        request, ('bias_summary', by), artifacts.get('bias_summary'),
+        lambda summary: bias_aggregates.summary_content(summary, by)
+    )
+
+# Centrality rankings and communities of the graph, or of the edges of some
+# algorithms and edge types, see graph_analytics.py
+def load_analytics(algorithm: Optional[List[str]] = Query(None), type: Optional[List[str]] = Query(None)):
+    return graph_analytics.get_analytics(bias_detection.get_store(), algorithm, type)
+
+@app.get('/analytics/rank')
+def get_analytics_rank(
+    analytics=Depends(load_analytics),
+    metric: str = 'pagerank',
+    top: int = Query(20, ge=1, le=100000)
+):
+    if metric not in graph_analytics.node_metrics:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(graph_analytics.node_metrics)}")
+    return responses.json_response(graph_analytics.ranking(analytics, metric, top))
+
+@app.get('/analytics/communities')
+def get_analytics_communities(
+    analytics=Depends(load_analytics),
+    top: int = Query(20, ge=0),
+    members: int = Query(10, ge=0)
+):
+    return responses.json_response(graph_analytics.community_summary(analytics, top, members))
+
+@app.get('/metrics')
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+@app.get('/metrics/report')
+def get_metrics_report():
+    return {**metrics.report(), 'artifacts': artifacts.status()}
+
+# Picks up new or changed articles, bias files and edges without a restart.
+# Under serve.py the refresh is only scheduled (202), see refresh.py.
+@app.post('/refresh')
+def post_refresh():
+    summary = refresh.request_refresh()
+    return JSONResponse(summary, status_code=202 if summary.get('scheduled') else 200)
+
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
-from api.bias_detection import get_link_data, get_node_data, load_graph
-
@@ -0,0 +1,95 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import artifact_store
+import metrics
+import pipeline
+import text_index
+
+# Number of worker processes and how many articles each task handles. The
+# pool is only started when there is more than one chunk of articles, small
+# corpora are read in-process because forking costs more than it saves.
+ingest_workers = int(os.environ.get('VAST_INGEST_WORKERS', '0')) or os.cpu_count() or 1
+ingest_chunk_size = int(os.environ.get('VAST_INGEST_CHUNK_SIZE', '500'))
+
+
+def list_articles(folder=pipeline.articles_folder):
+    return [f for f in os.listdir(folder) if f.endswith('.txt')]
+
+def read_article(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def ingest_chunk(folder, files):
+    # Read and scan a chunk of articles, timing both stages. The scan also
+    # records where the keywords and words are, for the text index.
+    read_seconds = 0.0
+    scan_seconds = 0.0
+    results = []
+    for file in files:
+        start = time.perf_counter()
+        path = os.path.join(folder, file)
+        stat = artifact_store.file_stat(path)
+        content = read_article(path)
+        scanned = time.perf_counter()
+        keyword_matches = pipeline.scan_matches(content)
+        keyword_counts = pipeline.match_counts(keyword_matches)
+        postings = text_index.article_postings(content, keyword_matches)
+        read_seconds += scanned - start
+        scan_seconds += time.perf_counter() - scanned
+        results.append((file, content, keyword_counts, postings, stat))
+    return results, read_seconds, scan_seconds
+
+@metrics.stage('ingest_articles')
+def ingest_articles(folder=pipeline.articles_folder, workers=None, chunk_size=None, files=None):
+    # Reads every article of the folder, or only the given files
+    workers = workers or ingest_workers
+    chunk_size = chunk_size or ingest_chunk_size
+    start = time.perf_counter()
+    files = list_articles(folder) if files is None else list(files)
+    list_seconds = time.perf_counter() - start
+
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    pool_workers = min(workers, len(chunks))
+    if pool_workers > 1:
+        with ProcessPoolExecutor(max_workers=pool_workers) as pool:
+            chunk_results = list(pool.map(ingest_chunk, [folder] * len(chunks), chunks))
+    else:
+        chunk_results = [ingest_chunk(folder, chunk) for chunk in chunks]
+
+    articles_content = {}
+    article_scans = {}
+    article_postings = {}
+    article_stats = {}
+    read_seconds = 0.0
+    scan_seconds = 0.0
+    for results, chunk_read_seconds, chunk_scan_seconds in chunk_results:
+        for file, content, keyword_counts, postings, stat in results:
+            articles_content[file] = content
+            article_scans[file] = keyword_counts
+            article_postings[file] = postings
+            article_stats[file] = stat
+        read_seconds += chunk_read_seconds
+        scan_seconds += chunk_scan_seconds
+
+    truth_start = time.perf_counter()
+    source_truth = pipeline.ground_truth_records(article_scans)
+    truth_seconds = time.perf_counter() - truth_start
+    return {
+        'articles_content': articles_content,
+        'article_scans': article_scans,
+        'article_postings': article_postings,
+        'source_truth': source_truth,
+        'article_stats': article_stats,
+        # read and scan are summed over all workers, total is wall time
+        'timings': {
+            'articles': len(files),
+            'workers': max(pool_workers, 1),
+            'list_seconds': list_seconds,
+            'read_seconds': read_seconds,
+            'scan_seconds': scan_seconds,
+            'ground_truth_seconds': truth_seconds,
+            'total_seconds': time.perf_counter() - start
+        }
+    }
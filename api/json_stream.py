@@ -0,0 +1,101 @@
+import json
+import re
+
+# Incremental reader for large JSON documents. The file is read in blocks and
+# only one value is decoded at a time, so the elements of a big top-level
+# array can be consumed one by one without building the whole document tree.
+block_size = 1 << 20
+whitespace = ' \t\n\r'
+delimiters = whitespace + ',:]}'
+
+_decoder = json.JSONDecoder()
+_scan = _decoder.scan_once
+_skip_whitespace = re.compile(r'[ \t\n\r]*').match
+
+
+class JSONStream:
+    """Tokenizer over a text file that decodes one JSON value at a time."""
+
+    def __init__(self, file, block_size=block_size):
+        self.file = file
+        self.block_size = block_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Drop the consumed text and read the next block
+        if self.eof:
+            return False
+        block = self.file.read(self.block_size)
+        self.buffer = self.buffer[self.pos:] + block
+        self.pos = 0
+        self.eof = not block
+        return bool(block)
+
+    def peek(self):
+        # Next non whitespace character, '' at the end of the file
+        while True:
+            self.pos = _skip_whitespace(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} at offset {self.pos}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        # Decodes the next value. A value that isn't followed by a delimiter
+        # may have been cut short at the end of the buffer (a number split
+        # between two blocks), so more text is read before accepting it.
+        self.peek()
+        while True:
+            try:
+                value, end = _scan(self.buffer, self.pos)
+            except (StopIteration, json.JSONDecodeError):
+                if not self._fill():
+                    raise json.JSONDecodeError("Expecting value", self.buffer, self.pos) from None
+                continue
+            if (end == len(self.buffer) or self.buffer[end] not in delimiters) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        # Keys of an object, the caller reads each value before the next key
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def elements(self):
+        # Elements of an array, decoded one at a time
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_object_arrays(file, array_keys):
+    # Yields (key, element) for every element of the top-level arrays named in
+    # array_keys and (key, value) for the other top-level members
+    stream = JSONStream(file)
+    for key in stream.items():
+        if key in array_keys and stream.peek() == '[':
+            for element in stream.elements():
+                yield key, element
+        else:
+            yield key, stream.value()
@@ -0,0 +1,86 @@
+import re
+
+
+class KeywordScanner:
+    """Counts many keywords with a single pass over a text.
+
+    The keywords are compiled into one trie shaped regular expression, so each
+    position of the text is only looked at once no matter how many keywords
+    there are. By default the counts match str.count(keyword) for every
+    keyword (non-overlapping substring matches). With word_boundary=True only
+    whole word matches are counted.
+    """
+
+    def __init__(self, keywords, word_boundary=False):
+        self.keywords = list(dict.fromkeys(kw for kw in keywords if kw))
+        self.word_boundary = word_boundary
+        pattern = _trie_pattern(self.keywords)
+        if word_boundary:
+            pattern = r'\b' + pattern
+        self._pattern = re.compile(pattern)
+        # The regex finds the longest keyword starting at a position, every
+        # other keyword starting there is a prefix of it. Only keywords whose
+        # occurrences can overlap each other (like 'aa') need the overlap check.
+        self._prefixes = {
+            longest: tuple(
+                (kw, len(kw), _can_overlap(kw))
+                for kw in sorted(self.keywords, key=len) if longest.startswith(kw)
+            )
+            for longest in self.keywords
+        }
+
+    def count(self, text):
+        counts = dict.fromkeys(self.keywords, 0)
+        for keyword, _ in self.matches(text):
+            counts[keyword] += 1
+        return counts
+
+    def matches(self, text):
+        # (keyword, start) of every occurrence that count() counts, in order
+        # of the start offset
+        last_end = {}
+        text_length = len(text)
+        word_boundary = self.word_boundary
+        prefixes = self._prefixes
+        search = self._pattern.search
+        match = search(text)
+        while match:
+            start = match.start()
+            for keyword, length, can_overlap in prefixes[match.group()]:
+                end = start + length
+                if word_boundary and end < text_length and _is_word_char(text[end]):
+                    continue
+                if can_overlap:
+                    # str.count does not count overlapping occurrences
+                    if last_end.get(keyword, 0) > start:
+                        continue
+                    last_end[keyword] = end
+                yield keyword, start
+            match = search(text, start + 1)
+
+
+def _can_overlap(keyword):
+    return any(keyword[:i] == keyword[-i:] for i in range(1, len(keyword)))
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+def _trie_pattern(keywords):
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return _node_pattern(trie) if trie else '(?!)'
+
+def _node_pattern(node):
+    branches = [re.escape(char) + _node_pattern(child) for char, child in sorted(node.items()) if char != '']
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    # A keyword ends here, so the rest is optional (and greedy, which makes
+    # the regex prefer the longest keyword)
+    if '' in node:
+        return '(?:' + pattern + ')?'
+    return pattern
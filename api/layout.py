@@ -0,0 +1,170 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import bias_detection
+import subgraph
+
+# Node positions for the force graph, computed on the server once per
+# subgraph so the browser can draw the graph straight away and only refine
+# it. The layout is Fruchterman-Reingold (the force model of networkx's
+# spring_layout) over NumPy arrays: attraction along the edges, weighted by
+# the number of links between two nodes, and repulsion between all pairs of
+# nodes (see dense_limit for large graphs), computed a block of rows at a time
+# to bound memory. The initial positions
+# come from a fixed seed, so the same subgraph always gets the same layout.
+# Positions only depend on the selected nodes and the endpoints of the links
+# between them, so they are computed from subgraph.select_links, without the
+# bias enrichment, and kept in an LRU keyed by the subgraph parameters while
+# the graph store is the very same object. Pages and streams of /nodes only
+# need these. The layouts of whole subgraphs (/graph, /nodes) add them to the
+# enriched nodes and are kept in a second LRU, reused while the subgraph is
+# the very same object.
+layout_cache_size = int(os.environ.get('VAST_LAYOUT_CACHE_SIZE', '32'))
+layout_iterations = int(os.environ.get('VAST_LAYOUT_ITERATIONS', '50'))
+# Positions are centered on 0 and fit in [-layout_scale, layout_scale]
+layout_scale = 500.0
+block_size = 1024
+# Above this many nodes the repulsion between all pairs is too slow, and each
+# node is repelled by the centroids of a grid_size x grid_size grid instead
+dense_limit = int(os.environ.get('VAST_LAYOUT_DENSE_LIMIT', '2000'))
+grid_size = 24
+
+_cache = OrderedDict()
+_positions = OrderedDict()
+_lock = threading.Lock()
+counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def edge_arrays(node_ids, links):
+    # Node positions of the link endpoints and the number of links per pair.
+    # Links whose endpoints aren't nodes (substring matches) are left out.
+    index = pd.Index(node_ids)
+    link_df = pd.DataFrame(links, columns=['source', 'target'])
+    source = index.get_indexer(link_df['source'])
+    target = index.get_indexer(link_df['target'])
+    keep = (source >= 0) & (target >= 0) & (source != target)
+    pairs = pd.DataFrame({'a': np.minimum(source, target)[keep], 'b': np.maximum(source, target)[keep]})
+    weights = pairs.groupby(['a', 'b']).size()
+    return (
+        weights.index.get_level_values('a').to_numpy(),
+        weights.index.get_level_values('b').to_numpy(),
+        weights.to_numpy(dtype=float)
+    )
+
+def cell_repulsion(pos, k):
+    # Repulsion from the centroids of a grid of cells, each weighted by the
+    # number of nodes it holds, in place of every other node
+    lowest = pos.min(axis=0)
+    span = max((pos.max(axis=0) - lowest).max(), 1e-9)
+    ij = np.minimum(((pos - lowest) / span * grid_size).astype(int), grid_size - 1)
+    cell = ij[:, 0] * grid_size + ij[:, 1]
+    mass = np.bincount(cell, minlength=grid_size * grid_size)
+    occupied = mass > 0
+    centers_x = np.bincount(cell, pos[:, 0], minlength=grid_size * grid_size)[occupied] / mass[occupied]
+    centers_y = np.bincount(cell, pos[:, 1], minlength=grid_size * grid_size)[occupied] / mass[occupied]
+    mass = mass[occupied]
+    displacement = np.empty_like(pos)
+    for start in range(0, len(pos), block_size):
+        stop = start + block_size
+        dx = pos[start:stop, 0, None] - centers_x[None, :]
+        dy = pos[start:stop, 1, None] - centers_y[None, :]
+        factor = (k * k) * mass / np.maximum(dx * dx + dy * dy, k * k)
+        displacement[start:stop, 0] = (dx * factor).sum(axis=1)
+        displacement[start:stop, 1] = (dy * factor).sum(axis=1)
+    return displacement
+
+def pair_repulsion(pos, k):
+    # k^2 / distance between every pair of nodes, along the unit vector
+    displacement = np.empty_like(pos)
+    for start in range(0, len(pos), block_size):
+        stop = start + block_size
+        dx = pos[start:stop, 0, None] - pos[None, :, 0]
+        dy = pos[start:stop, 1, None] - pos[None, :, 1]
+        factor = (k * k) / np.maximum(dx * dx + dy * dy, 1e-6)
+        displacement[start:stop, 0] = (dx * factor).sum(axis=1)
+        displacement[start:stop, 1] = (dy * factor).sum(axis=1)
+    return displacement
+
+def fit(pos):
+    # Centered on 0 and scaled to layout_scale
+    pos = pos - pos.mean(axis=0)
+    extent = np.abs(pos).max()
+    return pos * (layout_scale / extent) if extent > 0 else pos
+
+def compute_layout(num_nodes, source, target, weight, iterations=None, seed=0):
+    # Returns an (num_nodes, 2) array of positions
+    if num_nodes < 2:
+        return np.zeros((num_nodes, 2))
+    iterations = layout_iterations if iterations is None else iterations
+    pos = np.random.default_rng(seed).random((num_nodes, 2))
+    k = np.sqrt(1.0 / num_nodes)
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    repulsion = pair_repulsion if num_nodes <= dense_limit else cell_repulsion
+    for _ in range(iterations):
+        displacement = repulsion(pos, k)
+        delta = pos[source] - pos[target]
+        distance = np.sqrt((delta ** 2).sum(axis=1))
+        force = delta * (distance * weight / k)[:, None]
+        for axis in range(2):
+            displacement[:, axis] -= np.bincount(source, force[:, axis], minlength=num_nodes)
+            displacement[:, axis] += np.bincount(target, force[:, axis], minlength=num_nodes)
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=1)), 0.01)
+        pos += displacement * (temperature / length)[:, None]
+        temperature -= cooling
+    return fit(pos)
+
+def _cached(cache, key, valid, build):
+    # LRU lookup shared by the positions and the layouts
+    with _lock:
+        entry = cache.get(key)
+        if entry is not None and valid(entry):
+            counters['hits'] += 1
+            cache.move_to_end(key)
+            return entry
+        counters['misses'] += 1
+    # Computed outside the lock so a large layout doesn't block cached ones
+    entry = build()
+    with _lock:
+        cache[key] = entry
+        cache.move_to_end(key)
+        while len(cache) > layout_cache_size:
+            cache.popitem(last=False)
+            counters['evictions'] += 1
+    return entry
+
+def build_positions(store, params):
+    nodes, links_df = subgraph.select_links(params)
+    node_ids = list(nodes['id'])
+    pos = compute_layout(len(node_ids), *edge_arrays(node_ids, links_df)).round(2)
+    return {'store': store, 'positions': {node_id: (float(x), float(y)) for node_id, (x, y) in zip(node_ids, pos)}}
+
+def get_positions(params):
+    # Position of every node selected by params, by node id
+    store = bias_detection.get_store()
+    return _cached(_positions, params, lambda entry: entry['store'] is store, lambda: build_positions(store, params))['positions']
+
+def build_layout(graph, positions):
+    nodes = [{**node, **dict(zip(('x', 'y'), positions.get(node['id'], (None, None))))} for node in graph['nodes']]
+    return {'source': graph, 'positions': positions, 'graph': {'nodes': nodes, 'links': graph['links']}}
+
+def get_layout(params, graph):
+    # The layout of the subgraph selected by params. graph is the current
+    # subgraph, a cached layout of any other object is stale.
+    return _cached(_cache, params, lambda entry: entry['source'] is graph, lambda: build_layout(graph, get_positions(params)))
+
+def evict():
+    with _lock:
+        evicted = len(_cache) + len(_positions)
+        _cache.clear()
+        _positions.clear()
+        counters['evictions'] += evicted
+    return evicted
+
+def stats():
+    with _lock:
+        return {'size': len(_cache), 'positions': len(_positions), 'capacity': layout_cache_size, **counters}
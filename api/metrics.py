@@ -0,0 +1,164 @@
+import functools
+import os
+import resource
+import threading
+import time
+
+# Process metrics, served in the Prometheus text format by /metrics and
+# summarized by report(). Counters, gauges and histograms are kept in dicts
+# keyed by metric name and label values. Pipeline stages are timed with
+# stage(), which also records the change in resident memory over the stage.
+# That is the memory of the whole process, so it is only meaningful for
+# stages that don't overlap with other work, like the warm up.
+latency_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+descriptions = {
+    'vast_stage_seconds': ('histogram', "Wall time of a pipeline stage"),
+    'vast_stage_memory_delta_bytes': ('gauge', "Change in resident memory over the last run of a stage"),
+    'vast_request_seconds': ('histogram', "Request latency by endpoint, until the response starts"),
+    'vast_requests_total': ('counter', "Requests by endpoint and status"),
+    'vast_llm_request_seconds': ('histogram', "Latency of the LLM bias extraction calls"),
+    'vast_bias_extraction_failures_total': ('counter', "Articles whose bias extraction failed after every retry"),
+    'vast_cache_hits_total': ('counter', "Cache hits"),
+    'vast_cache_misses_total': ('counter', "Cache misses"),
+    'vast_cache_evictions_total': ('counter', "Cache evictions"),
+    'vast_cache_entries': ('gauge', "Entries held by a cache"),
+    'vast_graph_nodes': ('gauge', "Nodes of the knowledge graph"),
+    'vast_graph_edges': ('gauge', "Edges of the knowledge graph"),
+    'vast_process_resident_bytes': ('gauge', "Resident memory of the process")
+}
+
+_lock = threading.Lock()
+counters = {}
+gauges = {}
+histograms = {}
+# Functions called at every scrape, returning (name, labels, value) samples
+collectors = []
+started = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        counters[key] = counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        gauges[_key(name, labels)] = value
+
+def observe(name, value, buckets=latency_buckets, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+def resident_bytes():
+    # Current resident memory from /proc, or the peak where there is no /proc
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class stage:
+    """Times a pipeline stage, as a context manager or a decorator."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            # A new instance per call, calls may overlap in several threads
+            with stage(self.name):
+                return function(*args, **kwargs)
+        return timed
+
+    def __enter__(self):
+        self.memory = resident_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe('vast_stage_seconds', time.perf_counter() - self.start, stage=self.name)
+        set_gauge('vast_stage_memory_delta_bytes', resident_bytes() - self.memory, stage=self.name)
+        return False
+
+
+def register_cache(cache, stats):
+    # stats() returns the counters dict of a cache module
+    def collect():
+        values = stats()
+        return [
+            ('vast_cache_hits_total', {'cache': cache}, values.get('hits', 0)),
+            ('vast_cache_misses_total', {'cache': cache}, values.get('misses', 0)),
+            ('vast_cache_evictions_total', {'cache': cache}, values.get('evictions', 0)),
+            ('vast_cache_entries', {'cache': cache}, values.get('size', 0))
+        ]
+    collectors.append(collect)
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+    # Every metric in the Prometheus text exposition format
+    set_gauge('vast_process_resident_bytes', resident_bytes())
+    samples = {}
+    with _lock:
+        for (name, labels), value in list(counters.items()) + list(gauges.items()):
+            samples.setdefault(name, []).append(f'{name}{_labels(labels)} {_number(value)}')
+        for (name, labels), histogram in histograms.items():
+            lines = samples.setdefault(name, [])
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(histogram["sum"])}')
+            lines.append(f'{name}_count{_labels(labels)} {histogram["count"]}')
+    for collect in collectors:
+        for name, labels, value in collect():
+            samples.setdefault(name, []).append(f'{name}{_labels(sorted(labels.items()))} {_number(value)}')
+
+    output = []
+    for name in sorted(samples):
+        kind, description = descriptions.get(name, ('untyped', name))
+        output.append(f'# HELP {name} {description}')
+        output.append(f'# TYPE {name} {kind}')
+        output.extend(samples[name])
+    return '\n'.join(output) + '\n'
+
+def report():
+    # Stage timings and graph size as a dict, for the startup report
+    with _lock:
+        stages = {
+            dict(labels)['stage']: {
+                'runs': histogram['count'],
+                'seconds': round(histogram['sum'], 6),
+                'memory_delta_bytes': gauges.get(('vast_stage_memory_delta_bytes', labels))
+            }
+            for (name, labels), histogram in histograms.items() if name == 'vast_stage_seconds'
+        }
+        graph = {name: value for (name, labels), value in gauges.items() if name.startswith('vast_graph_')}
+    return {
+        'uptime_seconds': round(time.time() - started, 3),
+        'resident_bytes': resident_bytes(),
+        'graph': graph,
+        'stages': stages
+    }
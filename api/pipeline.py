@@ -0,0 +1,312 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import graph_store
+import metrics
+from keyword_scanner import KeywordScanner
+
+graph_path = graph_store.graph_path
+articles_folder = './api/articles'
+
+# 'substring' counts keywords the way str.count does, which is what all the
+# published numbers are based on. 'word' only counts whole word matches.
+keyword_match = os.environ.get('VAST_KEYWORD_MATCH', 'substring')
+
+# Simplyfying the description to show in the graph
+edge_type_descriptions = {
+    'Event.Invest': 'Investments (e.g., funding or capital deals)',
+    'Event.Aid': 'Aid/Support (e.g., relief or assistance efforts)',
+    'Event.Transaction': 'Transactions (e.g., trades or payments)',
+    'Event.Fishing.SustainableFishing': 'Sustainable Fishing (e.g., eco-friendly fishing)',
+    'Event.Fishing': 'Fishing Activities (e.g., general fishing events)',
+    'Event.Fishing.OverFishing': 'Overfishing (e.g., excessive or illegal fishing)',
+    'Event.Convicted': 'Convictions (e.g., legal guilty verdicts)',
+    'Event.Applaud': 'Praises (e.g., commendations or honors)',
+    'Event.CertificateIssued': 'Certificates Issued (e.g., permits or licenses)',
+    'Event.Criticize': 'Criticisms (e.g., blame or denunciations)',
+    'Event.Owns.PartiallyOwns': 'Ownership (e.g., stakes or shares)',
+    'Event.Communication.Conference': 'Conferences (e.g., meetings or summits)',
+    'Event.CertificateIssued.Summons': 'Summons Issued (e.g., legal notices or citations)'
+}
+
+# Keywords used to find the ground truth edge types of an article
+edge_keywords = {
+    'Event.Aid': ['aid', 'help', 'support', 'assistance', 'relief'],
+    'Event.Fishing': ['fish', 'fishing', 'catch', 'harvest', 'net'],
+    'Event.Transaction': ['deal', 'trade', 'payment', 'transaction', 'sold', 'bought'],
+    'Event.Fishing.OverFishing': ['overfish', 'illegal fishing', 'excessive', 'quota exceeded', 'unsustainable'],
+    'Event.Fishing.SustainableFishing': ['sustainable', 'eco-friendly', 'responsible fishing', 'green fishing'],
+    'Event.Convicted': ['convict', 'guilty', 'caught', 'sentenced', 'fined'],
+    'Event.Applaud': ['applaud', 'praise', 'commend', 'honor', 'celebrate'],
+    'Event.CertificateIssued': ['certificate', 'issued', 'permit', 'license', 'approved'],
+    'Event.Criticize': ['criticize', 'condemn', 'blame', 'denounce', 'fault'],
+    'Event.Owns.PartiallyOwns': ['owns', 'stake', 'share', 'partially owns', 'controls'],
+    'Event.Communication.Conference': ['conference', 'meeting', 'summit', 'discussion', 'talks'],
+    'Event.Invest': ['invest', 'funding', 'capital', 'backing', 'financed'],
+    'Event.CertificateIssued.Summons': ['summons', 'citation', 'notice', 'violation', 'order']
+}
+
+
+# Sentiment words used to label each article for the Sankey chart
+pos_words = ['praise', 'sustainable', 'approved', 'commend', 'honor', 'success', 'benefit', 'great', 'positive']
+neg_words = ['illegal', 'guilty', 'condemn', 'overfish', 'violation', 'fined', 'criticize', 'blame', 'disaster', 'fail', 'caught', 'unsustainable', 'excessive', 'quota']
+neutral_words = ['report', 'discuss', 'meeting', 'conference', 'update', 'event']
+
+
+def keyword_tables():
+    # Everything the keyword based steps depend on, used to fingerprint them
+    return {
+        'edge_keywords': edge_keywords,
+        'pos_words': pos_words,
+        'neg_words': neg_words,
+        'neutral_words': neutral_words,
+        'keyword_match': keyword_match
+    }
+
+def all_keywords():
+    keywords = [kw for kws in edge_keywords.values() for kw in kws]
+    return list(dict.fromkeys(keywords + pos_words + neg_words + neutral_words))
+
+@lru_cache(maxsize=None)
+def build_keyword_scanner(keywords, word_boundary=False):
+    return KeywordScanner(keywords, word_boundary=word_boundary)
+
+def keyword_scanner():
+    return build_keyword_scanner(tuple(all_keywords()), keyword_match == 'word')
+
+
+# Step 1 & Step 2: Load the graph and process edges
+def load_graph_store(path=graph_path):
+    store = graph_store.load_store(path)
+    metrics.set_gauge('vast_graph_nodes', store.number_of_nodes())
+    metrics.set_gauge('vast_graph_edges', store.number_of_edges())
+    return store
+
+def split_algorithms(edges_df):
+    shadgpt_edges = edges_df[edges_df['_algorithm'] == 'ShadGPT']
+    bassline_edges = edges_df[edges_df['_algorithm'] == 'BassLine']
+    return shadgpt_edges, bassline_edges
+
+
+# Step 3: Load articles
+def load_articles(folder=articles_folder):
+    article_files = [f for f in os.listdir(folder) if f.endswith('.txt')]
+    articles_content = {}
+    for file in article_files:
+        with open(os.path.join(folder, file), 'r', encoding='utf-8') as f:
+            articles_content[file] = f.read()
+    return articles_content
+
+
+# Step 4: Process articles for ground truth
+def scan_text(text):
+    # Counts of every edge and sentiment keyword, read in a single pass
+    return keyword_scanner().count(text.lower())
+
+def scan_matches(text):
+    # (keyword, offset) of every keyword occurrence scan_text counts
+    return list(keyword_scanner().matches(text.lower()))
+
+def match_counts(keyword_matches):
+    counts = dict.fromkeys(keyword_scanner().keywords, 0)
+    for keyword, _ in keyword_matches:
+        counts[keyword] += 1
+    return counts
+
+def scan_articles(articles_content):
+    return {file: scan_text(content) for file, content in articles_content.items()}
+
+@metrics.stage('ground_truth')
+def ground_truth_records(article_scans):
+    source_truth = []
+    for file, keyword_counts in article_scans.items():
+        edge_counts = {}
+        for edge_type, keywords in edge_keywords.items():
+            count = sum(keyword_counts[kw] for kw in keywords)
+            if count > 0:
+                edge_counts[edge_type] = count
+        if edge_counts:
+            source_truth.append({
+                'source': file,
+                'filename': file,
+                'edge_types': edge_counts
+            })
+    return source_truth
+
+def ground_truth_from_scans(article_scans):
+    return pd.DataFrame(ground_truth_records(article_scans))
+
+def compute_ground_truth(articles_content):
+    return ground_truth_from_scans(scan_articles(articles_content))
+
+
+# Step 5: Calculate confusion matrices
+def article_publication(files):
+    # Articles are named <entity>__<n>__<m>__<publication>.txt and are compared
+    # against the edges whose _raw_source is that publication
+    return files.str.split('__').str[-1].str.replace('.txt', '', regex=False)
+
+def truth_matrix(source_df, edge_types):
+    # Ground truth keyword counts as an (article x edge type) frame
+    if source_df.empty:
+        return pd.DataFrame(0, index=pd.Index([], name='source'), columns=edge_types)
+    truth = pd.DataFrame(list(source_df['edge_types']), index=source_df['source'])
+    return truth.reindex(columns=edge_types).fillna(0).astype('int64')
+
+def edge_counts(edges_df, keys=('_algorithm', '_raw_source')):
+    # Number of extracted edges per (algorithm, source, edge type) in one pass
+    return edges_df.groupby(list(keys) + ['type'], observed=True).size()
+
+def publication_counts(edges_df, edge_types):
+    # Edge counts as an ((algorithm, publication) x edge type) frame
+    counts = edge_counts(edges_df).unstack('type', fill_value=0)
+    return counts.reindex(columns=edge_types, fill_value=0)
+
+def article_confusion(truth, counts, algorithms):
+    # TP, FP and FN of every (article, edge type) for each algorithm, as
+    # frames shaped like the truth matrix
+    publications = article_publication(truth.index.to_series())
+    actual = truth.to_numpy('int64')
+    article_conf = {}
+    for algorithm in algorithms:
+        # Edge counts of every article's publication, aligned with the truth rows
+        if algorithm in counts.index.get_level_values(0):
+            algorithm_counts = counts.xs(algorithm, level=0)
+        else:
+            algorithm_counts = pd.DataFrame(0, index=[], columns=truth.columns, dtype='int64')
+        predicted = algorithm_counts.reindex(index=publications, columns=truth.columns, fill_value=0).to_numpy('int64')
+        article_conf[algorithm] = {
+            'TP': pd.DataFrame(np.minimum(actual, predicted), index=truth.index, columns=truth.columns),
+            'FP': pd.DataFrame(np.maximum(0, predicted - actual), index=truth.index, columns=truth.columns),
+            'FN': pd.DataFrame(np.maximum(0, actual - predicted), index=truth.index, columns=truth.columns)
+        }
+    return article_conf
+
+def confusion_frame(totals, edge_types):
+    # Summed TP, FP and FN counts indexed by the edge type descriptions
+    conf_df = pd.DataFrame({metric: totals[metric] for metric in ('TP', 'FP', 'FN')}, index=edge_types)
+    # Map the indices
+    conf_df.index = conf_df.index.map(edge_type_descriptions)
+    return conf_df
+
+def confusion_by_algorithm(source_df, edges_df, algorithms=None, edge_types=None):
+    if edge_types is None:
+        edge_types = list(edges_df['type'].unique())
+    if algorithms is None:
+        algorithms = edges_df['_algorithm'].dropna().unique()
+    truth = truth_matrix(source_df, edge_types)
+    article_conf = article_confusion(truth, publication_counts(edges_df, edge_types), algorithms)
+    return {
+        algorithm: confusion_frame({metric: frame.to_numpy('int64').sum(axis=0) for metric, frame in frames.items()}, edge_types)
+        for algorithm, frames in article_conf.items()
+    }
+
+@metrics.stage('confusion')
+def compute_confusion(source_df, edges_df, edge_types=None):
+    confusion = confusion_by_algorithm(source_df, edges_df, ['ShadGPT', 'BassLine'], edge_types)
+    return confusion['ShadGPT'], confusion['BassLine']
+
+
+# Step 6: Sentiment inference
+def sentiment_from_counts(keyword_counts):
+    pos_count = sum(1 for w in pos_words if keyword_counts[w])
+    neg_count = sum(1 for w in neg_words if keyword_counts[w])
+    neu_count = sum(1 for w in neutral_words if keyword_counts[w])
+    if neg_count > pos_count and neg_count > neu_count:
+        return 'Negative'
+    elif pos_count > neg_count and pos_count > neu_count:
+        return 'Positive'
+    return 'Neutral'
+
+def infer_sentiment(text):
+    return sentiment_from_counts(scan_text(text))
+
+@metrics.stage('sentiment')
+def article_sentiments(article_scans):
+    return {file: sentiment_from_counts(keyword_counts) for file, keyword_counts in article_scans.items()}
+
+
+# Step 7: Prepare Sankey data
+def sankey_flows(sentiments, truth, counts, edge_types, algorithms=('ShadGPT', 'BassLine')):
+    # One flow per (article sentiment, edge type, algorithm) with edges, in
+    # article order, then edge type order, then algorithm order. The article
+    # file of each flow is kept in the 'article' column.
+    files = pd.Series(list(sentiments), dtype=object)
+
+    # An article is matched with the edges whose _raw_source is either its
+    # publication or its file name
+    article_sources = pd.concat([
+        pd.DataFrame({'article': files.index, '_raw_source': article_publication(files)}),
+        pd.DataFrame({'article': files.index, '_raw_source': files})
+    ]).drop_duplicates()
+    counts = counts.rename('total_count').reset_index()
+    counts = counts[counts['_algorithm'].isin(algorithms)].astype({'_algorithm': object, '_raw_source': object, 'type': object})
+    flows = article_sources.merge(counts, on='_raw_source')
+    flows = flows.groupby(['article', '_algorithm', 'type'], sort=False)['total_count'].sum().reset_index()
+
+    type_order = {et: i for i, et in enumerate(edge_types)}
+    algorithm_order = {algorithm: i for i, algorithm in enumerate(algorithms)}
+    flows['type_order'] = flows['type'].map(type_order)
+    flows = flows[flows['type_order'].notna() & (flows['total_count'] > 0)]
+    flows = flows.astype({'type_order': 'int64'})
+    flows = flows.iloc[np.lexsort((
+        flows['_algorithm'].map(algorithm_order).to_numpy(),
+        flows['type_order'].to_numpy(),
+        flows['article'].to_numpy()
+    ))]
+
+    # Ground truth counts of every article, the first row wins like a lookup
+    truth = truth[~truth.index.duplicated()].reindex(files, fill_value=0).to_numpy('int64')
+    total = flows['total_count'].to_numpy('int64')
+    truth_count = truth[flows['article'].to_numpy(), flows['type_order'].to_numpy()] if len(truth) else np.zeros_like(total)
+
+    sankey_df = pd.DataFrame({
+        'article': files.to_numpy(object)[flows['article'].to_numpy()],
+        'sentiment': files.map(sentiments).to_numpy(object)[flows['article'].to_numpy()],
+        'edge_type': flows['type'].to_numpy(object),
+        'algorithm': flows['_algorithm'].to_numpy(object),
+        'total_count': total,
+        'tp_count': np.minimum(truth_count, total),
+        'fp_count': np.maximum(0, total - truth_count)
+    })
+
+    # Step 8: Map event types to descriptions for sankey_df
+    sankey_df['edge_type'] = sankey_df['edge_type'].map(edge_type_descriptions)
+    return sankey_df
+
+@metrics.stage('sankey')
+def build_sankey(sentiments, source_df, edges_df, edge_types=None, algorithms=('ShadGPT', 'BassLine')):
+    if edge_types is None:
+        edge_types = list(edges_df['type'].unique())
+    truth = truth_matrix(source_df, edge_types)
+    flows = sankey_flows(sentiments, truth, edge_counts(edges_df), edge_types, algorithms)
+    return flows.drop(columns='article')
+
+def sankey_ranking(sankey_df):
+    # Edge types by total false positives, in the order top_sankey picks them
+    fp_totals = sankey_df.groupby('edge_type')['fp_count'].sum()
+    return list(fp_totals.nlargest(len(fp_totals)).index)
+
+def top_sankey(sankey_df, top=5):
+    top_edges = sankey_df.groupby('edge_type')['fp_count'].sum().nlargest(top).index
+    return sankey_df[sankey_df['edge_type'].isin(top_edges)]
+
+def top_sankey_tables(sankey_df):
+    # The top_sankey result for every N, the last one holds every edge type
+    ranking = sankey_ranking(sankey_df)
+    return [sankey_df[sankey_df['edge_type'].isin(ranking[0:top])] for top in range(len(ranking) + 1)]
+
+def top_sankey_records(sankey_df):
+    # Records of every top_sankey_tables result, converted once and shared
+    ranking = sankey_ranking(sankey_df)
+    records = sankey_df.to_dict(orient="records")
+    rank = sankey_df['edge_type'].map({edge_type: i for i, edge_type in enumerate(ranking)}).fillna(len(ranking)).to_numpy()
+    return [[record for record, r in zip(records, rank) if r < top] for top in range(len(ranking) + 1)]
+
+
+# Step 9: Calculate FP rates with NaN handling
+def compute_fp_rates(conf_df):
+    return (conf_df['FP'] / (conf_df['TP'] + conf_df['FP'])).fillna(0)
@@ -0,0 +1,325 @@
+import logging
+import os
+import signal
+import threading
+import time
+
+import pandas as pd
+
+import artifact_store
+import artifacts
+import bias_detection
+import bias_store
+import doc_terms
+import ingest
+import pipeline
+import subgraph
+import text_index
+
+# Incremental updates of the published artifacts. refresh() compares the
+# articles, bias files and graph files with the ones the current snapshot was
+# computed from, rescans only the articles that changed, and recomputes the
+# confusion counts and Sankey flows of the affected articles only: those that
+# changed, and those whose publication gained or lost edges. Confusion totals
+# are updated with per-article deltas, the doc-term counts and the text index
+# only count and index the changed articles. Articles stay in the order of a
+# full build (ingest.list_articles). All new values are then swapped in at
+# once with artifacts.publish().
+# It runs from POST /refresh, or on every change when VAST_WATCH=1. In the
+# prefork server (serve.py) the workers don't refresh themselves: they ask
+# the parent, which refreshes and replaces them all (request_refresh).
+algorithms = ('ShadGPT', 'BassLine')
+
+logger = logging.getLogger('vast.refresh')
+
+# Set by serve.py in the parent before the workers are forked
+supervisor_pid = None
+generation = 0
+
+# State keyed by article file
+per_article = ('articles_content', 'article_scans', 'article_postings', 'article_stats', 'truth_records', 'sentiments')
+
+_state = None
+_baseline = None
+_lock = threading.Lock()
+
+
+def bias_stats():
+    folder = bias_store.bias_base_path
+    if not os.path.isdir(folder):
+        return {}
+    return {
+        entry.name[:-len('.json')]: artifact_store.file_stat(entry.path)
+        for entry in os.scandir(folder) if entry.name.endswith('.json')
+    }
+
+def graph_inputs():
+    # What the filtered graph (and the subgraphs) are computed from
+    return {'graph': artifact_store.file_stat(bias_detection.data_path), 'bias': bias_stats()}
+
+def record_baseline():
+    # Called before the artifacts are first built, so anything that changes
+    # afterwards is picked up by the next refresh (at worst twice)
+    global _baseline
+    _baseline = graph_inputs()
+
+
+# Per-article pipeline state
+def truth_frame(truth_records, files):
+    return pd.DataFrame([
+        {'source': file, 'filename': file, 'edge_types': truth_records[file]}
+        for file in files if file in truth_records
+    ])
+
+def initial_state():
+    # Everything computed in full from the ingested articles and current edges
+    ingested = artifacts.get('ingest')
+    article_scans = dict(ingested['article_scans'])
+    state = {
+        'articles_content': dict(ingested['articles_content']),
+        'article_scans': article_scans,
+        'article_postings': dict(ingested['article_postings']),
+        'article_stats': dict(ingested['article_stats']),
+        'truth_records': {record['source']: record['edge_types'] for record in ingested['source_truth']},
+        'sentiments': pipeline.article_sentiments(article_scans),
+        'timings': ingested['timings'],
+        'doc_terms': artifacts.get('doc_terms'),
+        'text_index': artifacts.get('text_index')
+    }
+    load_edges(state, pipeline.load_graph_store())
+    compute_all(state)
+    return state
+
+def copy_state(state):
+    # Refreshes work on a copy, the published values are never modified and a
+    # failed refresh leaves the previous state in place
+    state = dict(state)
+    for key in per_article:
+        state[key] = dict(state[key])
+    state['article_conf'] = {algorithm: dict(frames) for algorithm, frames in state['article_conf'].items()}
+    state['totals'] = {algorithm: dict(totals) for algorithm, totals in state['totals'].items()}
+    return state
+
+def load_edges(state, store):
+    state['graph_stat'] = artifact_store.file_stat(pipeline.graph_path)
+    state['store'] = store
+    state['edge_types'] = store.edge_types
+    state['edge_counts'] = pipeline.edge_counts(store.edges_frame())
+    state['publication_counts'] = pipeline.publication_counts(store.edges_frame(), store.edge_types)
+
+def compute_all(state):
+    files = list(state['sentiments'])
+    truth = pipeline.truth_matrix(truth_frame(state['truth_records'], files), state['edge_types'])
+    state['article_conf'] = pipeline.article_confusion(truth, state['publication_counts'], algorithms)
+    state['totals'] = {
+        algorithm: {metric: frame.to_numpy('int64').sum(axis=0) for metric, frame in frames.items()}
+        for algorithm, frames in state['article_conf'].items()
+    }
+    state['flows'] = pipeline.sankey_flows(state['sentiments'], truth, state['edge_counts'], state['edge_types'], algorithms)
+
+def apply_deltas(state, affected):
+    # Replace the confusion rows and Sankey flows of the affected articles
+    files = [file for file in state['sentiments'] if file in affected]
+    truth = pipeline.truth_matrix(truth_frame(state['truth_records'], files), state['edge_types'])
+    article_conf = pipeline.article_confusion(truth, state['publication_counts'], algorithms)
+    for algorithm, frames in article_conf.items():
+        for metric, rows in frames.items():
+            previous = state['article_conf'][algorithm][metric]
+            removed = previous[previous.index.isin(affected)]
+            totals = state['totals'][algorithm]
+            totals[metric] = totals[metric] - removed.to_numpy('int64').sum(axis=0) + rows.to_numpy('int64').sum(axis=0)
+            state['article_conf'][algorithm][metric] = pd.concat([previous[~previous.index.isin(affected)], rows])
+
+    flows = pipeline.sankey_flows({file: state['sentiments'][file] for file in files}, truth, state['edge_counts'], state['edge_types'], algorithms)
+    flows = pd.concat([state['flows'][~state['flows']['article'].isin(affected)], flows], ignore_index=True)
+    # Keep the flows in article order
+    position = {file: i for i, file in enumerate(state['sentiments'])}
+    order = flows['article'].map(position).to_numpy().argsort(kind='stable')
+    state['flows'] = flows.iloc[order].reset_index(drop=True)
+
+def affected_by_edges(files, previous_counts, counts):
+    # Articles matched with a (publication or file name) whose edge counts changed
+    previous_counts = previous_counts.to_dict()
+    counts = counts.to_dict()
+    sources = {key[1] for key in previous_counts.keys() | counts.keys() if previous_counts.get(key) != counts.get(key)}
+    publications = pipeline.article_publication(pd.Series(files, dtype=object))
+    return {file for file, publication in zip(files, publications) if file in sources or publication in sources}
+
+def pipeline_values(state):
+    edge_types = state['edge_types']
+    confusion = tuple(pipeline.confusion_frame(state['totals'][algorithm], edge_types) for algorithm in algorithms)
+    sankey_df = state['flows'].drop(columns='article')
+    articles = list(state['sentiments'])
+    doc_term_counts = state['doc_terms']
+    postings = state['text_index']
+    return {
+        'graph_store': state['store'],
+        'ingest': {
+            'articles_content': state['articles_content'],
+            'article_scans': state['article_scans'],
+            'article_postings': state['article_postings'],
+            'source_truth': truth_frame(state['truth_records'], articles).to_dict(orient='records'),
+            'article_stats': state['article_stats'],
+            'timings': state['timings']
+        },
+        'article_scans': state['article_scans'],
+        'ground_truth': truth_frame(state['truth_records'], articles),
+        'sentiments': state['sentiments'],
+        'confusion': confusion,
+        'fp_rates': tuple(pipeline.compute_fp_rates(conf_df) for conf_df in confusion),
+        'sankey': sankey_df,
+        'sankey_top': pipeline.top_sankey_records(sankey_df),
+        'doc_terms': doc_term_counts,
+        'term_columns': doc_terms.term_columns(doc_term_counts[1]),
+        'publication_counts': state['publication_counts'],
+        'text_index': postings,
+        'text_lookup': text_index.lookup_table(postings)
+    }
+
+def refresh_pipeline(state, summary):
+    # Returns True when the pipeline artifacts have to be published
+    current = {file: artifact_store.file_stat(os.path.join(pipeline.articles_folder, file)) for file in ingest.list_articles()}
+    changed = [file for file, stat in current.items() if state['article_stats'].get(file) != stat]
+    removed = [file for file in state['article_stats'] if file not in current]
+    affected = set(changed) | set(removed)
+
+    for file in removed:
+        for key in per_article:
+            state[key].pop(file, None)
+    if changed:
+        scanned = ingest.ingest_articles(files=changed)
+        state['articles_content'].update(scanned['articles_content'])
+        state['article_scans'].update(scanned['article_scans'])
+        state['article_postings'].update(scanned['article_postings'])
+        state['article_stats'].update(scanned['article_stats'])
+        state['timings'] = scanned['timings']
+        for file in changed:
+            state['truth_records'].pop(file, None)
+        state['truth_records'].update({record['source']: record['edge_types'] for record in scanned['source_truth']})
+        state['sentiments'].update(pipeline.article_sentiments(scanned['article_scans']))
+    if affected:
+        # New articles were added last, a full build lists them in folder order
+        for key in per_article:
+            state[key] = {file: state[key][file] for file in current if file in state[key]}
+        state['doc_terms'] = doc_terms.update_doc_terms(state['doc_terms'], state['articles_content'], state['article_scans'], affected)
+        state['text_index'] = text_index.update_text_index(state['text_index'], state['article_postings'], affected)
+
+    full = False
+    graph_changed = artifact_store.file_stat(pipeline.graph_path) != state['graph_stat']
+    if graph_changed:
+        previous_counts = state['edge_counts']
+        previous_types = state['edge_types']
+        load_edges(state, pipeline.load_graph_store())
+        # New edge types change every row of the output
+        full = state['edge_types'] != previous_types
+        affected |= affected_by_edges(list(state['sentiments']), previous_counts, state['edge_counts'])
+
+    summary.update({'articles_changed': len(changed), 'articles_removed': len(removed), 'edges_changed': graph_changed})
+    if full:
+        compute_all(state)
+        summary['affected_articles'] = len(state['sentiments'])
+    elif affected:
+        apply_deltas(state, affected)
+        summary['affected_articles'] = len(affected)
+    else:
+        summary['affected_articles'] = 0
+    return full or bool(affected) or graph_changed
+
+def refresh_graph(previous, current, summary):
+    # Returns the new filtered graph, or None when it is unchanged
+    changed_bias = [
+        articleid for articleid in previous['bias'].keys() | current['bias'].keys()
+        if previous['bias'].get(articleid) != current['bias'].get(articleid)
+    ]
+    graph_changed = previous['graph'] != current['graph']
+    summary.update({'bias_changed': len(changed_bias), 'graph_changed': graph_changed})
+    for articleid in changed_bias:
+        bias_store.invalidate(articleid)
+    if not changed_bias and not graph_changed:
+        return None
+    subgraph.evict()
+    # A graph that was never built will be built from the new files anyway
+    if 'graph' not in artifacts.artifacts:
+        return None
+    if graph_changed:
+        return artifacts.builders['graph']()
+    graph = artifacts.artifacts['graph']
+    links = bias_detection.refresh_link_biases(graph['links'], changed_bias)
+    return {'nodes': graph['nodes'], 'links': links, 'graph': {'nodes': graph['nodes'], 'links': links}}
+
+def refresh():
+    global _state, _baseline
+    with _lock:
+        start = time.perf_counter()
+        summary = {}
+        first = _state is None
+        state = copy_state(_state or initial_state())
+        values = {}
+        if refresh_pipeline(state, summary) or first:
+            values.update(pipeline_values(state))
+        inputs = graph_inputs()
+        graph = refresh_graph(_baseline or inputs, inputs, summary)
+        if graph is not None:
+            values['graph'] = graph
+            bias_detection.graph = graph
+        # The bias rollups cover the whole graph, an unbuilt one is built from
+        # the new files anyway
+        if (summary['bias_changed'] or summary['graph_changed']) and 'bias_summary' in artifacts.artifacts:
+            values['bias_summary'] = artifacts.builders['bias_summary']()
+        if values:
+            artifacts.publish(values)
+        _state = state
+        _baseline = inputs
+        summary['published'] = sorted(values)
+        summary['seconds'] = time.perf_counter() - start
+        return summary
+
+
+def request_refresh():
+    # The refresh summary, or in a prefork worker the request sent to the
+    # parent; this worker is replaced once the parent has refreshed
+    if supervisor_pid is None:
+        return refresh()
+    os.kill(supervisor_pid, signal.SIGHUP)
+    return {'scheduled': True, 'generation': generation}
+
+def process_info():
+    # How refreshes reach this process, for /ready
+    if supervisor_pid is None:
+        return {'mode': 'single', 'pid': os.getpid(), 'refresh': 'this process'}
+    return {
+        'mode': 'prefork', 'pid': os.getpid(), 'generation': generation,
+        'refresh': 'the parent process refreshes, then replaces every worker'
+    }
+
+
+# File watcher
+def watched_paths():
+    paths = [
+        pipeline.articles_folder, os.path.dirname(pipeline.graph_path),
+        bias_store.bias_base_path, os.path.dirname(bias_detection.data_path)
+    ]
+    return [path for path in dict.fromkeys(os.path.normpath(path) for path in paths) if os.path.isdir(path)]
+
+def refresh_and_report(changes):
+    try:
+        summary = refresh()
+        logger.info("Refreshed after %d file changes: %s", len(changes), summary)
+    except Exception:
+        logger.exception("Refresh after %d file changes failed", len(changes))
+
+def watch(stop_event=None, on_change=None):
+    # watchfiles is installed with uvicorn[standard]. on_change() replaces
+    # the refresh of this process, see serve.py.
+    from watchfiles import watch as watch_changes
+    relevant = lambda change, path: path.endswith(('.txt', '.json'))
+    for changes in watch_changes(*watched_paths(), watch_filter=relevant, recursive=False, stop_event=stop_event):
+        if on_change is not None:
+            on_change()
+        else:
+            refresh_and_report(changes)
+
+def start_watcher(stop_event=None, on_change=None):
+    thread = threading.Thread(target=watch, args=(stop_event, on_change), name='refresh-watcher', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import orjson
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Read-only endpoints serve bodies that are encoded once per data version.
+# Each body is kept with its gzip (and brotli, when the module is installed)
+# compressed copies and an ETag, so a request costs a dict lookup: 304 when
+# the client's copy is current, otherwise the stored bytes in the best
+# encoding the client accepts. An entry is reused while the endpoint's data
+# is the very same object; artifacts and subgraphs are never modified in
+# place, so a new object means new data.
+response_cache_size = int(os.environ.get('VAST_RESPONSE_CACHE_SIZE', '64'))
+# max-age sent in Cache-Control, clients revalidate with the ETag after that
+response_max_age = int(os.environ.get('VAST_RESPONSE_MAX_AGE', '0'))
+# Bodies smaller than this are not worth compressing
+compress_min_size = 1024
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+counters = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evictions': 0}
+
+
+def encode(content):
+    # Like FastAPI's JSON responses, but NaN is written as null instead of
+    # failing and numpy scalars are accepted
+    return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+class EncodedResponse:
+    """A body with its compressed copies and ETag."""
+
+    def __init__(self, value, body, media_type='application/json'):
+        self.value = value
+        self.media_type = media_type
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.bodies = {'identity': body}
+        self.etags = {'identity': f'"{digest}"'}
+        if len(body) >= compress_min_size:
+            self.bodies['gzip'] = gzip.compress(body, compresslevel=6, mtime=0)
+            self.etags['gzip'] = f'"{digest}-gzip"'
+            if brotli is not None:
+                self.bodies['br'] = brotli.compress(body)
+                self.etags['br'] = f'"{digest}-br"'
+
+    def select_encoding(self, accept_encoding):
+        accepted = set()
+        for part in accept_encoding.split(','):
+            name, *params = part.split(';')
+            quality = 1.0
+            for param in params:
+                param = param.strip()
+                if param.startswith('q='):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        pass
+            if quality > 0:
+                accepted.add(name.strip().lower())
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and (encoding in accepted or '*' in accepted):
+                return encoding
+        return 'identity'
+
+    def not_modified(self, if_none_match):
+        # Any representation of the same body is current
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or not tags.isdisjoint(self.etags.values())
+
+    def respond(self, request):
+        encoding = self.select_encoding(request.headers.get('accept-encoding', ''))
+        headers = {
+            'ETag': self.etags[encoding],
+            'Cache-Control': f'public, max-age={response_max_age}, must-revalidate',
+            # The graph endpoints also choose between JSON and Arrow by Accept
+            'Vary': 'Accept, Accept-Encoding'
+        }
+        if self.not_modified(request.headers.get('if-none-match', '')):
+            with _lock:
+                counters['not_modified'] += 1
+            return Response(status_code=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.bodies[encoding], media_type=self.media_type, headers=headers)
+
+
+def cached_response(request, key, value, build, encoder=encode, media_type='application/json'):
+    # key names the endpoint, its parameters and format, value is the data it
+    # serves, build(value) turns that into the content and encoder into bytes
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry.value is value:
+            counters['hits'] += 1
+            _cache.move_to_end(key)
+        else:
+            entry = None
+            counters['misses'] += 1
+    if entry is None:
+        # Encoded outside the lock so a large body doesn't hold up other requests
+        entry = EncodedResponse(value, encoder(build(value)), media_type)
+        with _lock:
+            _cache[key] = entry
+            _cache.move_to_end(key)
+            while len(_cache) > response_cache_size:
+                _cache.popitem(last=False)
+                counters['evictions'] += 1
+    return entry.respond(request)
+
+def stats():
+    with _lock:
+        return {'size': len(_cache), 'capacity': response_cache_size, **counters}
+
+def json_response(content):
+    # For bodies that aren't worth keeping, like pages of a cursor
+    return Response(encode(content), media_type='application/json')
+
+def wants_ndjson(request, format=None):
+    return format == 'ndjson' or 'application/x-ndjson' in request.headers.get('accept', '')
+
+def ndjson_response(records):
+    # One JSON document per line, written as the records are produced
+    lines = (encode(record) + b'\n' for record in records)
+    return StreamingResponse(lines, media_type='application/x-ndjson')
@@ -0,0 +1,185 @@
+import argparse
+import contextlib
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+sys.path.append(os.path.abspath("./api/"))
+
+# Production entry point. The parent process builds every artifact once,
+# writing the graph store snapshot and the artifact cache on the way, primes
+# the default responses, then forks the workers. The workers start warm and
+# share the parent's memory copy-on-write; gc.freeze() keeps the collector
+# from touching (and so copying) the objects built before the fork, and the
+# graph store columns read from the memory-mapped snapshot are shared through
+# the page cache in any case. The parent only supervises: a worker that dies
+# is replaced by a fresh fork, SIGINT/SIGTERM stop every worker.
+#
+# Refreshes happen in the parent, so all workers serve the same data. POST
+# /refresh (and the background bias extraction) in a worker sends SIGHUP to
+# the parent, and with VAST_WATCH=1 the parent watches the input files
+# itself. The parent then runs refresh.refresh() and, when anything was
+# republished, primes the responses again and replaces every worker with a
+# fork of the new state: a new generation. The previous workers finish their
+# requests and exit. /ready reports the generation of the worker answering.
+# Caches, counters and /metrics stay per worker.
+# Run from the repository root: python api/serve.py --workers 4 --port 8000
+primed_paths = ('/confusion', '/fp_rates', '/sankey', '/graph', '/nodes', '/links')
+# Seconds between checks for exited workers and refresh requests
+poll_interval = 0.2
+
+
+@contextlib.contextmanager
+def no_background_extraction():
+    # Missing biases are extracted by the workers, never by the parent: its
+    # thread would not survive the fork
+    import bias_extraction
+    background_extraction = bias_extraction.background_extraction
+    bias_extraction.background_extraction = False
+    try:
+        yield
+    finally:
+        bias_extraction.background_extraction = background_extraction
+
+def prime(app):
+    from fastapi.testclient import TestClient
+    client = TestClient(app)
+    for path in primed_paths:
+        client.get(path)
+
+def prepare():
+    # Everything the workers would otherwise build at boot
+    os.environ.setdefault('VAST_WARM_UP', '0')
+    import artifacts
+    import index
+    import refresh
+
+    with no_background_extraction():
+        refresh.record_baseline()
+        artifacts.warm_up()
+        prime(index.app)
+    index.print_startup_report()
+    return index.app
+
+def listen(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(app, sock, log_level):
+    import uvicorn
+    config = uvicorn.Config(app, log_level=log_level, lifespan='off')
+    uvicorn.Server(config).run(sockets=[sock])
+
+def spawn(app, sock, log_level):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        code = 0
+        try:
+            run_worker(app, sock, log_level)
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+def stop_workers(pids):
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+def refresh_generation(app):
+    # Refresh in the parent, True when the workers have to be replaced
+    import refresh
+    gc.unfreeze()
+    try:
+        with no_background_extraction():
+            summary = refresh.refresh()
+            print(f"Refreshed: {summary}", flush=True)
+            if summary['published']:
+                prime(app)
+    except Exception:
+        refresh.logger.exception("Refresh failed")
+        return False
+    if not summary['published']:
+        return False
+    refresh.generation += 1
+    return True
+
+def serve(host='0.0.0.0', port=8000, workers=1, log_level='warning'):
+    import refresh
+
+    app = prepare()
+    sock = listen(host, port)
+    # Workers and the watcher ask for refreshes with SIGHUP
+    refresh.supervisor_pid = os.getpid()
+    if os.environ.get("VAST_WATCH", "0") == "1":
+        refresh.start_watcher(on_change=lambda: os.kill(refresh.supervisor_pid, signal.SIGHUP))
+    refresh_requested = False
+    def request(signum, frame):
+        nonlocal refresh_requested
+        refresh_requested = True
+    signal.signal(signal.SIGHUP, request)
+    # Objects created so far are never collected, so the workers' collectors
+    # leave their pages alone
+    gc.freeze()
+    children = {spawn(app, sock, log_level) for _ in range(workers)}
+    retiring = set()
+    print(f"Serving on {host}:{port} with {workers} workers: {sorted(children)}", flush=True)
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        stop_workers(children | retiring)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children or retiring:
+        if refresh_requested and not stopping:
+            # Requests arriving during the refresh lead to another one
+            refresh_requested = False
+            replace = refresh_generation(app)
+            gc.freeze()
+            if replace:
+                previous = children
+                children = {spawn(app, sock, log_level) for _ in range(workers)}
+                retiring |= previous
+                stop_workers(previous)
+                print(f"Generation {refresh.generation}: workers {sorted(children)}", flush=True)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(poll_interval)
+            continue
+        if pid in retiring:
+            retiring.discard(pid)
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, starting a new one", flush=True)
+            time.sleep(0.5)
+            children.add(spawn(app, sock, log_level))
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API with prefork workers sharing one warm snapshot")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('VAST_WORKERS', '0')) or os.cpu_count() or 1)
+    parser.add_argument('--log-level', default='warning')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.log_level)
@@ -0,0 +1,212 @@
+import base64
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import bias_detection
+import graph_store
+import metrics
+
+# Subgraphs of the knowledge graph selected by query parameters. Results are
+# kept in an LRU keyed by the normalized parameters, so repeated requests for
+# the same slice don't recompute the filtering and bias enrichment. Pages and
+# streams keep only the positions of the selected rows, in a second LRU.
+subgraph_cache_size = int(os.environ.get('VAST_SUBGRAPH_CACHE_SIZE', '32'))
+
+# Rows per chunk when streaming, and per page when no page_size is given
+stream_chunk_size = int(os.environ.get('VAST_STREAM_CHUNK_SIZE', '1000'))
+default_page_size = int(os.environ.get('VAST_PAGE_SIZE', '1000'))
+
+_cache = OrderedDict()
+_selections = OrderedDict()
+_lock = threading.Lock()
+counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def normalize_params(limit=100, node_types=None, edge_types=None, algorithms=None, publications=None, seed=None, hops=1):
+    # Order and duplicates of list parameters don't change the result
+    def normalize_list(values):
+        return tuple(sorted(set(values))) if values else ()
+    return (
+        ('limit', limit if limit and limit > 0 else None),
+        ('node_types', normalize_list(node_types)),
+        ('edge_types', normalize_list(edge_types)),
+        ('algorithms', normalize_list(algorithms)),
+        ('publications', normalize_list(publications)),
+        ('seed', seed or None),
+        ('hops', max(hops, 0) if seed else None)
+    )
+
+def filter_links(links_df, edge_types=(), algorithms=(), publications=()):
+    mask = pd.Series(True, index=links_df.index)
+    if edge_types:
+        mask &= links_df['type'].isin(edge_types)
+    if algorithms:
+        mask &= links_df['_algorithm'].isin(algorithms)
+    if publications:
+        mask &= links_df['_raw_source'].isin(publications)
+    return links_df[mask]
+
+def neighborhood(links_df, seed, hops):
+    # Nodes within `hops` links of the seed, ignoring link direction
+    reached = {seed}
+    frontier = {seed}
+    for _ in range(hops):
+        outgoing = links_df.loc[links_df['source'].isin(frontier), 'target']
+        incoming = links_df.loc[links_df['target'].isin(frontier), 'source']
+        frontier = set(outgoing).union(incoming) - reached
+        if not frontier:
+            break
+        reached |= frontier
+    return reached
+
+def select_nodes(params):
+    # The node frame picked by the parameters, and the links of the selected
+    # edge types, algorithms and publications
+    options = dict(params)
+    store = bias_detection.get_store()
+    nodes = store.nodes
+    links_df = filter_links(
+        store.links_frame(),
+        options['edge_types'], options['algorithms'], options['publications']
+    )
+
+    if options['seed']:
+        reached = neighborhood(links_df, options['seed'], options['hops'])
+        nodes = nodes[nodes['id'].isin(reached)]
+    if options['node_types']:
+        node_types = nodes['type'] if 'type' in nodes else pd.Series(None, index=nodes.index, dtype=object)
+        nodes = nodes[node_types.isin(options['node_types']) | (nodes['id'] == options['seed'])]
+    if options['limit']:
+        nodes = nodes.iloc[0:options['limit']]
+    return nodes, links_df
+
+@metrics.stage('filter_links')
+def select_links(params):
+    # The selected nodes and the links between them, before bias enrichment.
+    # Both frames keep the position of each row in the store as index.
+    nodes, links_df = select_nodes(params)
+    node_ids = list(nodes['id'])
+    links_df = links_df.copy()
+    links_df['filtered_source'] = bias_detection.endpoint_filter(links_df['source'], node_ids)
+    links_df['filtered_target'] = bias_detection.endpoint_filter(links_df['target'], node_ids)
+    return nodes, links_df[(links_df['filtered_source']) & (links_df['filtered_target'])]
+
+@metrics.stage('bias_enrichment')
+def enrich_links(link_df):
+    link_df = bias_detection.add_source_data_to_links(link_df.copy())
+    return bias_detection.clean_links(link_df)
+
+def build_subgraph(params):
+    nodes, link_df = select_links(params)
+    return {'nodes': graph_store.node_records(nodes), 'links': enrich_links(link_df).to_dict(orient='records')}
+
+def get_subgraph(params):
+    with _lock:
+        if params in _cache:
+            counters['hits'] += 1
+            _cache.move_to_end(params)
+            return _cache[params]
+        counters['misses'] += 1
+    # Built outside the lock so a slow subgraph doesn't block cached ones
+    subgraph = build_subgraph(params)
+    with _lock:
+        _cache[params] = subgraph
+        _cache.move_to_end(params)
+        while len(_cache) > subgraph_cache_size:
+            _cache.popitem(last=False)
+            counters['evictions'] += 1
+    return subgraph
+
+def evict(params=None):
+    # Drop one cached subgraph and its selections, or all of them
+    with _lock:
+        if params is None:
+            evicted = len(_cache) + len(_selections)
+            _cache.clear()
+            _selections.clear()
+        else:
+            evicted = 1 if _cache.pop(params, None) is not None else 0
+            for kind in ('nodes', 'links'):
+                evicted += 1 if _selections.pop((kind, params), None) is not None else 0
+        counters['evictions'] += evicted
+    return evicted
+
+def stats():
+    with _lock:
+        return {'size': len(_cache), 'selections': len(_selections), 'capacity': subgraph_cache_size, **counters}
+
+
+# Pagination and streaming. Rows are produced a chunk at a time straight
+# from the store, so only one chunk of records (and their biases) is
+# materialized however large the selection is. A cursor is the position in
+# the store of the last row returned; it stays valid while links are added.
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(str(int(position)).encode('ascii')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    # Raises ValueError for a cursor that wasn't produced by encode_cursor
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        position = int(base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii'))
+    except ValueError as e:
+        # UnicodeError and binascii.Error are ValueErrors too
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+    # The decoder skips characters outside the alphabet, only an exact
+    # encoding is a cursor
+    if position < 0 or encode_cursor(position) != cursor:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return position
+
+def build_selection(store, kind, params):
+    frame = select_links(params)[1] if kind == 'links' else select_nodes(params)[0]
+    return {'store': store, 'positions': frame.index.to_numpy('int64')}
+
+def get_selection(kind, params):
+    # Positions in the store of the selected 'nodes' or 'links', ascending
+    store = bias_detection.get_store()
+    key = (kind, params)
+    with _lock:
+        entry = _selections.get(key)
+        if entry is not None and entry['store'] is store:
+            _selections.move_to_end(key)
+            return entry['positions']
+    entry = build_selection(store, kind, params)
+    with _lock:
+        _selections[key] = entry
+        _selections.move_to_end(key)
+        while len(_selections) > subgraph_cache_size:
+            _selections.popitem(last=False)
+    return entry['positions']
+
+def selected_rows(kind, positions):
+    # The rows of select_links or select_nodes at the given positions
+    store = bias_detection.get_store()
+    if kind == 'nodes':
+        return store.nodes.iloc[positions]
+    links = store.link_rows(positions)
+    # Every selected link has both endpoints among the selected nodes
+    links['filtered_source'] = True
+    links['filtered_target'] = True
+    return links
+
+def iter_records(kind, params, after=None, limit=None):
+    # (position, record) of the selected 'nodes' or 'links' after a position.
+    # Only the positions of the selection are kept, the rows of one chunk are
+    # read from the store at a time.
+    positions = get_selection(kind, params)
+    first = 0 if after is None else int(np.searchsorted(positions, after, side='right'))
+    positions = positions[first:] if limit is None else positions[first:first + limit]
+    for start in range(0, len(positions), stream_chunk_size):
+        chunk = selected_rows(kind, positions[start:start + stream_chunk_size])
+        records = enrich_links(chunk).to_dict(orient='records') if kind == 'links' else graph_store.node_records(chunk)
+        yield from zip(chunk.index, records)
+
+def page(kind, params, after=None, page_size=None):
+    page_size = page_size or default_page_size
+    rows = list(iter_records(kind, params, after, page_size + 1))
+    next_cursor = encode_cursor(rows[page_size - 1][0]) if len(rows) > page_size else None
+    return {'items': [record for _, record in rows[0:page_size]], 'next_cursor': next_cursor}
@@ -0,0 +1,192 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import doc_terms
+import pipeline
+
+# Inverted index of the articles: term -> article -> offsets, for showing the
+# passages behind a ground truth count (/evidence) and for full text search
+# (/search). The offsets of every article are collected while it is ingested
+# (article_postings), in the same pass as the keyword scan, and merged here
+# into one postings frame sorted by (term, article, start) that is persisted
+# with the other artifacts. A term's postings are then a slice found by
+# binary search. Like doc_terms.py, the first terms are the pipeline
+# keywords with the offsets of the keyword scan, so evidence adds up to the
+# ground truth counts; the others are the words of the articles, with their
+# position in the article for phrase queries.
+snippet_width = int(os.environ.get('VAST_SNIPPET_WIDTH', '80'))
+
+
+def article_postings(text, keyword_matches):
+    # Compact offsets of one article: keyword numbers and starts, its distinct
+    # words, then the word number and start of every word in order
+    keyword_numbers = {kw: i for i, kw in enumerate(pipeline.keyword_scanner().keywords)}
+    words = {}
+    word_ids = []
+    word_starts = []
+    for match in doc_terms.token_pattern.finditer(text.lower()):
+        word_ids.append(words.setdefault(match.group(), len(words)))
+        word_starts.append(match.start())
+    return (
+        np.array([keyword_numbers[kw] for kw, _ in keyword_matches], dtype=np.int32),
+        np.array([start for _, start in keyword_matches], dtype=np.int32),
+        list(words),
+        np.array(word_ids, dtype=np.int32),
+        np.array(word_starts, dtype=np.int32)
+    )
+
+def postings_columns(files, postings_by_article, keywords, words, articles):
+    # Postings of the given articles, numbered articles[i]; new words are
+    # added to words
+    columns = {'term': [], 'article': [], 'start': [], 'position': []}
+    for article, file in zip(articles, files):
+        keyword_ids, keyword_starts, article_words, word_ids, word_starts = postings_by_article[file]
+        # Word numbers of the article to global term numbers
+        terms = np.array([len(keywords) + words.setdefault(word, len(words)) for word in article_words], dtype=np.int32)
+        columns['term'] += [keyword_ids, terms[word_ids]]
+        columns['start'] += [keyword_starts, word_starts]
+        columns['position'] += [np.full(len(keyword_ids), -1, dtype=np.int32), np.arange(len(word_ids), dtype=np.int32)]
+        columns['article'].append(np.full(len(keyword_ids) + len(word_ids), article, dtype=np.int32))
+    return pd.DataFrame({
+        name: np.concatenate(arrays) if arrays else np.array([], dtype=np.int32) for name, arrays in columns.items()
+    })
+
+def sort_postings(postings):
+    order = np.lexsort((postings['start'].to_numpy(), postings['article'].to_numpy(), postings['term'].to_numpy()))
+    return postings.iloc[order].reset_index(drop=True)
+
+def build_text_index(postings_by_article):
+    # (postings, index), index holds the files and terms the postings refer to
+    keywords = pipeline.keyword_scanner().keywords
+    files = list(postings_by_article)
+    words = {}
+    postings = postings_columns(files, postings_by_article, keywords, words, range(len(files)))
+    return sort_postings(postings), {'files': files, 'keywords': keywords, 'words': list(words)}
+
+def update_text_index(text_index, postings_by_article, changed):
+    # build_text_index after the changed articles were rescanned (or removed
+    # from postings_by_article), reading only their offsets. The postings of
+    # the other articles are renumbered and kept; like doc_terms.py, new
+    # words get new term numbers and words that no longer occur keep theirs.
+    postings, index = text_index
+    files = list(postings_by_article)
+    words = {word: i for i, word in enumerate(index['words'])}
+    article_numbers = {file: i for i, file in enumerate(files)}
+    # Old article number -> new one, -1 for the rescanned and removed ones
+    renumber = np.array([
+        -1 if file in changed else article_numbers.get(file, -1) for file in index['files']
+    ], dtype=np.int32)
+    kept = postings.assign(article=renumber[postings['article'].to_numpy()])
+    kept = kept[kept['article'].to_numpy() >= 0]
+    previous = set(index['files'])
+    rescanned = [file for file in files if file in changed or file not in previous]
+    new = postings_columns(rescanned, postings_by_article, index['keywords'], words, [article_numbers[file] for file in rescanned])
+    postings = sort_postings(pd.concat([kept, new], ignore_index=True))
+    return postings, {'files': files, 'keywords': index['keywords'], 'words': list(words)}
+
+def lookup_table(text_index):
+    # The index as arrays and dicts, ready for queries
+    postings, index = text_index
+    offset = len(index['keywords'])
+    files = pd.Series(index['files'], dtype=object)
+    return {
+        'files': files.to_numpy(object),
+        'publications': pipeline.article_publication(files).to_numpy(object),
+        'keywords': {kw: i for i, kw in enumerate(index['keywords'])},
+        'words': {word: offset + i for i, word in enumerate(index['words'])},
+        'lengths': np.array([len(term) for term in index['keywords'] + index['words']], dtype=np.int32),
+        **{name: postings[name].to_numpy(np.int32) for name in ('term', 'article', 'start', 'position')}
+    }
+
+
+# Queries
+def term_postings(lookup, term):
+    # Rows of the postings of one term number
+    first, last = np.searchsorted(lookup['term'], [term, term + 1])
+    return slice(int(first), int(last))
+
+def word_keys(lookup, rows):
+    # (article, position) of word postings as one sortable number, the
+    # postings of a word are sorted by it
+    return lookup['article'][rows].astype(np.int64) << 32 | lookup['position'][rows].astype(np.int64)
+
+def phrase_hits(lookup, query):
+    # (article, start, end) of every occurrence of the words of the query in
+    # a row, or None when the query has no words
+    terms = [lookup['words'].get(word) for word in doc_terms.normalize_term(query).split()]
+    if not terms:
+        return None
+    if None in terms:
+        empty = np.array([], dtype=np.int32)
+        return empty, empty, empty
+    rows = term_postings(lookup, terms[0])
+    article, start = lookup['article'][rows], lookup['start'][rows]
+    keys = word_keys(lookup, rows)
+    for i, term in enumerate(terms[1:], 1):
+        keep = np.isin(keys + i, word_keys(lookup, term_postings(lookup, term)))
+        article, start, keys = article[keep], start[keep], keys[keep]
+    # The phrase ends with its last word
+    last = term_postings(lookup, terms[-1])
+    last_start = lookup['start'][last][np.searchsorted(word_keys(lookup, last), keys + len(terms) - 1)]
+    return article, start, last_start + lookup['lengths'][terms[-1]]
+
+def keyword_hits(lookup, keywords):
+    # (article, start, end) of every match of the given pipeline keywords
+    terms = [lookup['keywords'][kw] for kw in dict.fromkeys(keywords) if kw in lookup['keywords']]
+    ranges = [term_postings(lookup, term) for term in terms]
+    rows = np.concatenate([np.arange(r.start, r.stop) for r in ranges] + [np.array([], dtype=np.int64)])
+    start = lookup['start'][rows]
+    return lookup['article'][rows], start, start + lookup['lengths'][lookup['term'][rows]]
+
+def read_text(file, folder=pipeline.articles_folder):
+    with open(os.path.join(folder, file), 'r', encoding='utf-8') as f:
+        text = f.read()
+    # Offsets are those of the lowercased text, which only differs in length
+    # from the text for a few characters
+    lowered = text.lower()
+    return text if len(lowered) == len(text) else lowered
+
+def snippet(text, start, end, width=None):
+    width = snippet_width if width is None else width
+    first = max(0, start - width)
+    last = min(len(text), end + width)
+    return {'text': text[first:last], 'start': start, 'end': end, 'match': [start - first, end - first]}
+
+def article_results(lookup, article, start, end, limit, snippets, width=None):
+    # Articles with the most hits first, each with its first few snippets
+    order = np.lexsort((start, article))
+    article, start, end = article[order], start[order], end[order]
+    articles, first, counts = np.unique(article, return_index=True, return_counts=True)
+    ranked = np.lexsort((articles, -counts))[:limit]
+    results = []
+    for i in ranked:
+        file = lookup['files'][articles[i]]
+        hits = slice(first[i], first[i] + min(counts[i], snippets))
+        text = read_text(file) if snippets else ''
+        results.append({
+            'article': file,
+            'publication': lookup['publications'][articles[i]],
+            'hits': int(counts[i]),
+            'snippets': [snippet(text, int(s), int(e), width) for s, e in zip(start[hits], end[hits])]
+        })
+    return {'total_hits': int(len(article)), 'total_articles': int(len(articles)), 'articles': results}
+
+def search(lookup, query, limit=20, snippets=3):
+    # Articles containing the words of the query in a row, ignoring case and
+    # punctuation
+    hits = phrase_hits(lookup, query)
+    if hits is None:
+        raise ValueError("The query has no words")
+    return {'query': query, **article_results(lookup, *hits, limit, snippets)}
+
+def evidence(lookup, edge_type, source=None, limit=20, snippets=3):
+    # The keyword matches behind the ground truth counts of an edge type, in
+    # the articles compared with a source: those whose publication or file
+    # name is the source, or every article without one
+    article, start, end = keyword_hits(lookup, pipeline.edge_keywords[edge_type])
+    if source is not None:
+        keep = (lookup['publications'][article] == source) | (lookup['files'][article] == source)
+        article, start, end = article[keep], start[keep], end[keep]
+    return {'edge_type': edge_type, 'source': source, **article_results(lookup, article, start, end, limit, snippets)}
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+sys.path.append(os.path.abspath("./api/"))
+import bias_detection
+
+# Times get_filtered_links against the original row-wise filter for a growing
+# number of nodes, up to the whole graph.
+# Run from the repository root: python benchmarks/bench_filtered_links.py
+
+
+def legacy_filtered_links(num_nodes):
+    links_df = bias_detection.get_store().links_frame().astype({'source': object, 'target': object})
+    node_ids = bias_detection.get_node_ids(bias_detection.get_node_data(num_nodes))
+    links_df['filtered_source'] = links_df.apply(lambda x: any(x['source'] in y for y in node_ids), axis=1)
+    links_df['filtered_target'] = links_df.apply(lambda x: any(x['target'] in y for y in node_ids), axis=1)
+    return links_df[(links_df['filtered_source']) & (links_df['filtered_target'])]
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def node_counts(total):
+    counts = []
+    num_nodes = 100
+    while num_nodes < total:
+        counts.append(num_nodes)
+        num_nodes *= 4
+    return counts + [total]
+
+
+if __name__ == "__main__":
+    total = len(bias_detection.get_store().nodes)
+    skip_legacy = '--skip-legacy' in sys.argv
+    print(f"{'nodes':>8} {'links':>8} {'legacy s':>10} {'substring s':>12} {'exact s':>10}")
+    for num_nodes in node_counts(total):
+        bias_detection.link_match = 'substring'
+        substring_links, substring_seconds = timed(bias_detection.get_filtered_links, num_nodes)
+        bias_detection.link_match = 'exact'
+        _, exact_seconds = timed(bias_detection.get_filtered_links, num_nodes)
+        legacy_seconds = float('nan')
+        if not skip_legacy:
+            legacy_links, legacy_seconds = timed(legacy_filtered_links, num_nodes)
+            assert legacy_links.index.equals(substring_links.index)
+        print(f"{num_nodes:>8} {len(substring_links):>8} {legacy_seconds:>10.3f} {substring_seconds:>12.3f} {exact_seconds:>10.3f}")
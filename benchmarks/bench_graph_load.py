@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.abspath("./api/"))
+
+# Times loading the knowledge graph into a GraphStore three ways, each in its
+# own interpreter: json.load of the whole document, the streaming reader, and
+# the memory-mapped binary snapshot. Each load is timed, then repeated under
+# tracemalloc for its peak allocation (mapped snapshot pages aren't counted).
+# --scale N benchmarks a graph made of N renamed copies of every node and link.
+# Run from the repository root: python benchmarks/bench_graph_load.py --scale 10
+
+
+def load_json(path):
+    import graph_store
+    with open(path, 'r') as file:
+        return graph_store.GraphStore.from_graph_data(json.load(file))
+
+def load_streaming(path):
+    import graph_store
+    return graph_store.read_graph_file(path)
+
+def load_snapshot(path):
+    import graph_store
+    return graph_store.read_snapshot(os.path.join(os.path.dirname(path), 'snapshot'))
+
+loaders = {'json.load': load_json, 'streaming': load_streaming, 'snapshot': load_snapshot}
+
+def measure(name, path):
+    import graph_store
+    start = time.perf_counter()
+    store = loaders[name](path)
+    seconds = time.perf_counter() - start
+    links = len(store.links)
+    del store
+    tracemalloc.start()
+    loaders[name](path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak': peak, 'links': links}
+
+def write_scaled(path, scale, out_path):
+    # Copies with renamed node ids, so the graph grows instead of repeating edges
+    with open(path, 'r') as file:
+        graph_data = json.load(file)
+    nodes = []
+    links = []
+    for copy in range(scale):
+        suffix = f'#{copy}' if copy else ''
+        nodes.extend({**node, 'id': f"{node['id']}{suffix}"} for node in graph_data['nodes'])
+        links.extend({**link, 'source': f"{link['source']}{suffix}", 'target': f"{link['target']}{suffix}"} for link in graph_data['links'])
+    with open(out_path, 'w') as file:
+        json.dump({**graph_data, 'nodes': nodes, 'links': links}, file)
+
+def mb(size):
+    return f"{size / 2 ** 20:.1f} MB"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--measure':
+        print(json.dumps(measure(sys.argv[2], sys.argv[3])))
+        sys.exit()
+
+    import graph_store
+    parser = argparse.ArgumentParser(description="Benchmark loading mc1.json")
+    parser.add_argument('path', nargs='?', default=graph_store.graph_path)
+    parser.add_argument('--scale', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'mc1.json')
+        write_scaled(args.path, args.scale, path)
+        graph_store.write_snapshot(graph_store.read_graph_file(path), os.path.join(folder, 'snapshot'))
+
+        print(f"Graph file: {args.path} x {args.scale} ({mb(os.path.getsize(path))})")
+        print(f"{'loader':<12} {'links':>10} {'seconds':>10} {'peak':>12}")
+        for name in loaders:
+            output = subprocess.run([sys.executable, __file__, '--measure', name, path], capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:<12} {result['links']:>10} {result['seconds']:>10.3f} {mb(result['peak']):>12}")
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+# Times every pipeline stage and endpoint against synthetic datasets of
+# growing size (see generate_dataset.py), and records the peak memory
+# allocated by each. Every dataset is benchmarked in its own interpreter
+# started in the dataset folder, so the API reads it through its usual
+# relative paths, with the on-disk artifact cache disabled. Timings and
+# memory come from two separate runs, since tracemalloc slows the code down.
+# "first" is the first call in the process: for stages it includes filling
+# module caches (the bias store, the graph store), for endpoints building the
+# artifacts. Peak memory is measured on that first call.
+# The LLM client is replaced by a stub, so articles without a bias file are
+# extracted offline with a fixed latency per request, by the bias_extraction
+# stage rather than in the background.
+# Run from the repository root: python benchmarks/bench_suite.py --scales 1 10
+api_folder = os.path.abspath("./api/")
+generator = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generate_dataset.py')
+stub_latency = 0.01
+num_nodes = 100
+
+
+class StubCompletions:
+    async def create(self, messages, model):
+        await asyncio.sleep(stub_latency)
+        bias = {'Positive Bias': [messages[0]['content'][-40:]]}
+        message = types.SimpleNamespace(content=json.dumps(bias))
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+class StubGroq:
+    """Stands in for groq.AsyncGroq."""
+
+    def __init__(self, **kwargs):
+        self.chat = types.SimpleNamespace(completions=StubCompletions())
+
+
+def stage_benchmarks():
+    import bias_detection
+    import bias_extraction
+    import graph_store
+    import ingest
+    import pandas as pd
+    import pipeline
+
+    def load_graph(ctx):
+        ctx['store'] = graph_store.read_graph_file(pipeline.graph_path)
+
+    def ingest_articles(ctx):
+        ctx['scans'] = ingest.ingest_articles()['article_scans']
+
+    def ground_truth(ctx):
+        ctx['truth'] = pd.DataFrame(pipeline.ground_truth_records(ctx['scans']))
+
+    def confusion(ctx):
+        pipeline.compute_confusion(ctx['truth'], ctx['store'].edges_frame(), ctx['store'].edge_types)
+
+    def sentiment(ctx):
+        ctx['sentiments'] = pipeline.article_sentiments(ctx['scans'])
+
+    def sankey(ctx):
+        pipeline.build_sankey(ctx['sentiments'], ctx['truth'], ctx['store'].edges_frame(), ctx['store'].edge_types)
+
+    def filter_links(ctx):
+        ctx['filtered'] = bias_detection.get_filtered_links(num_nodes)
+
+    def extract_biases(ctx):
+        bias_extraction.run_extraction(ctx['filtered']['_articleid'])
+
+    def bias_enrichment(ctx):
+        bias_detection.clean_links(bias_detection.add_source_data_to_links(ctx['filtered'].copy()))
+
+    return [
+        ('load_graph', load_graph), ('ingest_articles', ingest_articles), ('ground_truth', ground_truth),
+        ('confusion', confusion), ('sentiment', sentiment), ('sankey', sankey),
+        ('filter_links', filter_links), ('bias_extraction', extract_biases), ('bias_enrichment', bias_enrichment)
+    ]
+
+def endpoint_benchmarks():
+    from fastapi.testclient import TestClient
+    import index
+    client = TestClient(index.app)
+
+    def request(path):
+        def run(ctx):
+            response = client.get(path)
+            response.raise_for_status()
+            response.read()
+        return path, run
+
+    return [request(path) for path in (
+        '/confusion', '/fp_rates', '/sankey', '/sankey?top=0', '/graph', '/nodes', '/links',
+        '/links?type=Event.Aid&limit=0', '/links?format=ndjson&limit=0', '/graph?limit=0'
+    )]
+
+def run_benchmarks(dataset, repeat, memory):
+    # Runs in the child interpreter, returns {name: result}
+    os.chdir(dataset)
+    os.environ['VAST_CACHE_DIR'] = ''
+    os.environ['VAST_WARM_UP'] = '0'
+    os.environ['VAST_BIAS_RATE_LIMIT'] = '0'
+    os.environ['VAST_BIAS_BACKGROUND'] = '0'
+    sys.path.insert(0, api_folder)
+    import bias_extraction
+    bias_extraction.AsyncGroq = StubGroq
+
+    results = {}
+    ctx = {}
+    for kind, benchmarks in (('stage', stage_benchmarks), ('endpoint', endpoint_benchmarks)):
+        for name, run in benchmarks():
+            if memory:
+                tracemalloc.start()
+                run(ctx)
+                results[name] = {'kind': kind, 'peak': tracemalloc.get_traced_memory()[1]}
+                tracemalloc.stop()
+                continue
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run(ctx)
+                seconds.append(time.perf_counter() - start)
+            results[name] = {
+                'kind': kind, 'first': seconds[0],
+                'median': statistics.median(seconds[1:] or seconds), 'min': min(seconds[1:] or seconds)
+            }
+    return results
+
+def benchmark_dataset(dataset, repeat):
+    results = {}
+    for mode in (['--repeat', str(repeat)], ['--memory']):
+        output = subprocess.run([sys.executable, __file__, '--run', dataset, *mode], capture_output=True, text=True, check=True).stdout
+        for name, result in json.loads(output.strip().splitlines()[-1]).items():
+            results.setdefault(name, {}).update(result)
+    return results
+
+def mb(size):
+    return f"{size / 2 ** 20:.1f} MB"
+
+def print_results(scale, summary, results):
+    print(f"\nScale {scale}x: {summary['nodes']} nodes, {summary['links']} links, {summary['articles']} articles")
+    print(f"{'benchmark':<36} {'first s':>9} {'median s':>9} {'min s':>9} {'peak':>10}")
+    for name, result in results.items():
+        print(f"{name:<36} {result['first']:>9.4f} {result['median']:>9.4f} {result['min']:>9.4f} {mb(result['peak']):>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages and endpoints on synthetic datasets")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--missing-bias', type=float, default=0.05, help="fraction of articles extracted by the stub LLM")
+    parser.add_argument('--data-dir', help="keep the generated datasets here and reuse them on later runs")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--memory', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_benchmarks(args.run, args.repeat, args.memory)))
+        sys.exit()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in args.scales:
+            dataset = os.path.join(args.data_dir or tmp, f'scale-{scale}')
+            summary_path = os.path.join(dataset, 'dataset.json')
+            if not os.path.isfile(summary_path):
+                output = subprocess.run(
+                    [sys.executable, generator, dataset, '--scale', str(scale), '--missing-bias', str(args.missing_bias)],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                with open(summary_path, 'w') as file:
+                    file.write(output.strip().splitlines()[-1])
+            with open(summary_path, 'r') as file:
+                summary = json.load(file)
+            results = benchmark_dataset(dataset, args.repeat)
+            print_results(scale, summary, results)
+            report[scale] = {'dataset': summary, 'results': results}
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
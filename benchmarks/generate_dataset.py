@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+sys.path.append(os.path.abspath("./api/"))
+import bias_detection
+import pipeline
+
+# Writes a synthetic VAST dataset laid out like the repository, so the API can
+# be run against it from that folder:
+#   OUT/api/mc1.json       (the graph every module reads, graph_store.graph_path)
+#   OUT/api/articles/      (read by the evaluation pipeline)
+#   OUT/data/articles/     (the same articles, read by the bias extraction)
+#   OUT/data/bias/         (one bias JSON per article)
+#   OUT/api/prompt.txt
+# --scale 1 is about the size of the sample (340 articles, 6000 links); every
+# count grows linearly with the scale. Links keep the real schema (type,
+# _algorithm, _raw_source, _articleid, _date_added, key), article names follow
+# <entity>__<n>__<m>__<publication>, and article texts mention the keywords
+# of some edge types so the ground truth, confusion and Sankey steps have work
+# to do. Output is reproducible for a given --seed.
+# Run from the repository root: python benchmarks/generate_dataset.py OUT --scale 10
+base_articles = 340
+base_companies = 110
+base_people = 200
+base_links = 6000
+
+publications = ['Haacklee Herald', 'Lomark Daily', 'The News Buoy']
+algorithms = ['ShadGPT', 'BassLine']
+company_types = ['Entity.Organization.Company', 'Entity.Organization.FishingCompany']
+surnames = [
+    'Alvarez', 'Bell', 'Cervantes', 'Davis', 'Espinoza', 'Forbes', 'Garcia', 'Hall', 'Ingram', 'Jensen',
+    'Klein', 'Lopez', 'Mendez', 'Nelson', 'Olsen', 'Patel', 'Quinn', 'Reynolds', 'Santos', 'Turner',
+    'Underwood', 'Vargas', 'Wilcox', 'Xu', 'Young', 'Zimmerman'
+]
+company_suffixes = ['PLC', 'LLC', 'Ltd', 'Group', 'Inc', 'and Sons']
+first_names = ['Ana', 'Ben', 'Carla', 'Dmitri', 'Elena', 'Femi', 'Greta', 'Hugo', 'Ines', 'Jonas', 'Kai', 'Lena']
+filler = [
+    'Officials declined to comment further.', 'The harbor was busy throughout the week.',
+    'Local residents followed the story closely.', 'More details are expected in the coming days.',
+    'The company has operated in the region for many years.'
+]
+
+
+def unique_names(count, make, rng):
+    names = {}
+    while len(names) < count:
+        name = make(rng)
+        if name in names:
+            name = f'{name} {len(names)}'
+        names[name] = None
+    return list(names)
+
+def make_company(rng):
+    return f'{rng.choice(surnames)}-{rng.choice(surnames)} {rng.choice(company_suffixes)}'
+
+def make_person(rng):
+    return f'{rng.choice(first_names)} {rng.choice(surnames)}'
+
+def article_text(entity, edge_types, rng):
+    sentences = []
+    for edge_type in edge_types:
+        keywords = rng.sample(pipeline.edge_keywords[edge_type], 2)
+        sentences.append(f'{entity} was linked to {keywords[0]} and {keywords[1]} according to sources.')
+    for words in (pipeline.pos_words, pipeline.neg_words, pipeline.neutral_words):
+        for word in rng.sample(words, rng.randint(0, 2)):
+            sentences.append(f'Observers called it a {word} development.')
+    sentences.extend(rng.sample(filler, 2))
+    rng.shuffle(sentences)
+    return sentences
+
+def article_bias(sentences, rng):
+    return {
+        bias: rng.sample(sentences, rng.randint(1, min(3, len(sentences))))
+        for bias in rng.sample(bias_detection.bias_types, rng.randint(1, 5))
+    }
+
+def generate(out, scale=1, seed=0, missing_bias=0.0):
+    rng = random.Random(seed)
+    companies = unique_names(base_companies * scale, make_company, rng)
+    people = unique_names(base_people * scale, make_person, rng)
+    nodes = [{'type': rng.choice(company_types), 'id': company} for company in companies]
+    nodes += [{'type': 'Entity.Person', 'id': person} for person in people]
+    node_ids = companies + people
+    edge_types = list(pipeline.edge_keywords)
+
+    for folder in ('api/articles', 'data/bias'):
+        os.makedirs(os.path.join(out, folder), exist_ok=True)
+    shutil.copy('./api/prompt.txt', os.path.join(out, 'api/prompt.txt'))
+
+    links = []
+    keys = {}
+    links_per_article = base_links / base_articles
+    for n in range(base_articles * scale):
+        entity = companies[n % len(companies)]
+        publication = rng.choice(publications)
+        articleid = f'{entity}__{n // len(companies)}__{n % 7}__{publication}'
+        mentioned = rng.sample(edge_types, rng.randint(1, 3))
+        sentences = article_text(entity, mentioned, rng)
+        with open(os.path.join(out, 'api/articles', articleid + '.txt'), 'w', encoding='utf-8') as file:
+            file.write(' '.join(sentences))
+        if rng.random() >= missing_bias:
+            with open(os.path.join(out, 'data/bias', articleid + '.json'), 'w') as file:
+                json.dump(article_bias(sentences, rng), file)
+
+        # Most extracted edges match a type the article mentions
+        for _ in range(int(links_per_article) + (rng.random() < links_per_article % 1)):
+            source = entity if rng.random() < 0.7 else rng.choice(node_ids)
+            target = rng.choice(node_ids)
+            key = keys.get((source, target), 0)
+            keys[(source, target)] = key + 1
+            links.append({
+                'type': rng.choice(mentioned) if rng.random() < 0.7 else rng.choice(edge_types),
+                '_raw_source': publication,
+                '_algorithm': rng.choice(algorithms),
+                '_articleid': articleid,
+                '_date_added': f'2035-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                'source': source,
+                'target': target,
+                'key': key
+            })
+
+    graph_path = os.path.join(out, 'api/mc1.json')
+    with open(graph_path, 'w') as file:
+        json.dump({'directed': True, 'multigraph': True, 'graph': {}, 'nodes': nodes, 'links': links}, file)
+    # The bias extraction reads the articles from data/
+    shutil.rmtree(os.path.join(out, 'data/articles'), ignore_errors=True)
+    shutil.copytree(os.path.join(out, 'api/articles'), os.path.join(out, 'data/articles'))
+    return {'nodes': len(nodes), 'links': len(links), 'articles': base_articles * scale}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic VAST dataset")
+    parser.add_argument('out')
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--missing-bias', type=float, default=0.0, help="fraction of articles written without a bias file")
+    args = parser.parse_args()
+    print(json.dumps(generate(args.out, args.scale, args.seed, args.missing_bias)))
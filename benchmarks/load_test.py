@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+# Load test of the production server (api/serve.py) with 1, 2, 4 and 8
+# workers. For each worker count the server is started, and once it answers
+# /ready, `--concurrency` clients request the endpoints below round robin
+# for `--duration` seconds. Reports throughput, p50/p99 latency overall and
+# per endpoint, the time to boot, and the memory of the server processes:
+# RSS summed over processes counts shared pages once per process, PSS splits
+# them between the processes sharing them.
+# Run from the repository root: python benchmarks/load_test.py --workers 1 2 4 8
+paths = [
+    '/confusion', '/fp_rates', '/sankey', '/sankey?top=0', '/graph', '/nodes', '/links',
+    '/graph?format=arrow', '/links?type=Event.Aid&limit=200', '/nodes?page_size=50', '/ready'
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def process_tree(pid):
+    # The server and its workers
+    pids = [pid]
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat', 'r') as file:
+                    if int(file.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return pids
+
+def memory(pids):
+    # Summed RSS and PSS in bytes, from /proc/<pid>/smaps_rollup
+    totals = {'rss': 0, 'pss': 0}
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup', 'r') as file:
+                for line in file:
+                    name, value = line.split(':', 1) if ':' in line else ('', '')
+                    if name in ('Rss', 'Pss'):
+                        totals[name.lower()] += int(value.split()[0]) * 1024
+        except OSError:
+            pass
+    return totals
+
+def wait_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(base_url + '/ready', timeout=5).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    return False
+
+async def drive(base_url, concurrency, duration):
+    latencies = {path: [] for path in paths}
+    errors = 0
+    requests = itertools.cycle(paths)
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                path = next(requests)
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path, headers={'Accept-Encoding': 'gzip'})
+                    await response.aread()
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies[path].append(time.perf_counter() - start)
+                else:
+                    errors += 1
+        start = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - start
+    return latencies, errors, elapsed
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1] if len(values) > 1 else values[0]
+
+def run(workers, concurrency, duration, boot_timeout):
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    start = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, 'api/serve.py', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_ready(base_url, boot_timeout):
+            raise RuntimeError(f"Server with {workers} workers wasn't ready after {boot_timeout}s")
+        boot_seconds = time.monotonic() - start
+        latencies, errors, elapsed = asyncio.run(drive(base_url, concurrency, duration))
+        usage = memory(process_tree(server.pid))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    everything = [latency for values in latencies.values() for latency in values]
+    return {
+        'workers': workers,
+        'boot_seconds': boot_seconds,
+        'requests': len(everything),
+        'errors': errors,
+        'throughput': len(everything) / elapsed,
+        'p50': percentile(everything, 50),
+        'p99': percentile(everything, 99),
+        'endpoints': {path: {'p50': percentile(values, 50), 'p99': percentile(values, 99), 'requests': len(values)} for path, values in latencies.items()},
+        **usage
+    }
+
+def mb(size):
+    return f"{size / 2 ** 20:.0f} MB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test api/serve.py with different numbers of workers")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds of load per worker count")
+    parser.add_argument('--boot-timeout', type=float, default=600.0)
+    parser.add_argument('--endpoints', action='store_true', help="also print latencies per endpoint")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'workers':>7} {'boot s':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'RSS':>9} {'PSS':>9}")
+    for workers in args.workers:
+        result = run(workers, args.concurrency, args.duration, args.boot_timeout)
+        results.append(result)
+        print(
+            f"{workers:>7} {result['boot_seconds']:>8.1f} {result['throughput']:>8.1f} {result['p50'] * 1000:>8.1f} "
+            f"{result['p99'] * 1000:>8.1f} {result['errors']:>7} {mb(result['rss']):>9} {mb(result['pss']):>9}"
+        )
+        if args.endpoints:
+            for path, stats in result['endpoints'].items():
+                print(f"    {path:<36} {stats['requests']:>7} {stats['p50'] * 1000:>8.1f} {stats['p99'] * 1000:>8.1f}")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Compares the resident memory of the previous graph representation with the
+# shared graph store the API holds now. The previous one is rebuilt as the
+# modules used to hold it: bias_detection's parse of the file with its node
+# and link lists, a second parse turned into a NetworkX graph, the edge dicts
+# and DataFrame built from it and the per-algorithm copies. The shared one is
+# loaded the way the API loads it, by the evaluation pipeline, the bias
+# enrichment and the artifacts, and the report checks that they all hold the
+# same store. Each representation is measured in a fresh interpreter started
+# in the dataset folder (the repository, or one written by
+# generate_dataset.py) with the artifact cache disabled, so the graph file is
+# parsed rather than mapped: resident memory before and after loading, with
+# the libraries imported beforehand.
+# Run from the repository root: python benchmarks/memory_report.py [dataset]
+api_folder = os.path.abspath("./api/")
+
+
+def build_legacy(path):
+    import networkx as nx
+    import pandas as pd
+
+    # bias_detection
+    with open(path) as file:
+        data = json.load(file)
+    nodes = list(data['nodes'])
+    links = list(data['links'])
+    # index.py
+    with open(path) as file:
+        graph_data = json.load(file)
+    G = nx.node_link_graph(graph_data, directed=True, multigraph=True, edges="links")
+    node_dicts = [{'id': n, **G.nodes[n]} for n in G.nodes()]
+    edges = [{'source': u, 'target': v, 'key': k, **d} for u, v, k, d in G.edges(keys=True, data=True)]
+    edges_df = pd.DataFrame(edges)
+    shadgpt_edges = edges_df[edges_df['_algorithm'] == 'ShadGPT'].copy()
+    bassline_edges = edges_df[edges_df['_algorithm'] == 'BassLine'].copy()
+    return {}, (data, nodes, links, graph_data, G, node_dicts, edges, edges_df, shadgpt_edges, bassline_edges)
+
+def build_shared(path):
+    import artifacts
+    import bias_detection
+    import graph_store
+    import pipeline
+
+    # Every way the API gets at the graph
+    loaded = {
+        'pipeline': pipeline.load_graph_store(),
+        'bias_detection': bias_detection.get_store(),
+        'artifacts': artifacts.get('graph_store')
+    }
+    held = graph_store.held_stores()
+    report = {
+        'stores_held': len(held),
+        'shared': len({id(store) for store in loaded.values()}) == 1,
+        'stores': [
+            {'nodes': store.number_of_nodes(), 'links': store.number_of_edges(), 'breakdown': store.memory_usage()}
+            for store in held.values()
+        ]
+    }
+    return report, loaded
+
+representations = {'legacy': build_legacy, 'shared': build_shared}
+
+def measure(name, dataset):
+    # Runs in the child interpreter
+    os.chdir(dataset)
+    os.environ['VAST_CACHE_DIR'] = ''
+    os.environ['VAST_WARM_UP'] = '0'
+    os.environ['VAST_BIAS_BACKGROUND'] = '0'
+    sys.path.insert(0, api_folder)
+    import networkx
+    import pandas
+    import graph_store
+    import index
+    import metrics
+
+    before = metrics.resident_bytes()
+    report, retained = representations[name](graph_store.graph_path)
+    after = metrics.resident_bytes()
+    return {
+        **report,
+        'graph_path': graph_store.graph_path,
+        'file_size': os.path.getsize(graph_store.graph_path),
+        'resident_before': before,
+        'resident_after': after
+    }
+
+def mb(size):
+    return f"{size / 2 ** 20:.1f} MB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the memory of the previous graph representation with the shared store")
+    parser.add_argument('dataset', nargs='?', default='.', help="folder with api/mc1.json, by default the repository")
+    parser.add_argument('--run', choices=list(representations), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        print(json.dumps(measure(args.run, args.dataset)))
+        sys.exit()
+
+    reports = {}
+    for name in representations:
+        output = subprocess.run(
+            [sys.executable, __file__, '--run', name, os.path.abspath(args.dataset)], capture_output=True, text=True, check=True
+        ).stdout
+        reports[name] = json.loads(output.strip().splitlines()[-1])
+    shared = reports['shared']
+    print(f"Graph file: {shared['graph_path']} in {args.dataset} ({mb(shared['file_size'])})")
+    print(f"{'representation':<16} {'before':>12} {'after':>12} {'resident':>12}")
+    for name, report in reports.items():
+        resident = report['resident_after'] - report['resident_before']
+        print(f"{name:<16} {mb(report['resident_before']):>12} {mb(report['resident_after']):>12} {mb(resident):>12}")
+    legacy_size = reports['legacy']['resident_after'] - reports['legacy']['resident_before']
+    shared_size = shared['resident_after'] - shared['resident_before']
+    print(f"Resident memory reduced {legacy_size / max(shared_size, 1):.1f}x")
+    print(f"Stores held: {shared['stores_held']}, shared by every module: {shared['shared']}")
+    for i, store in enumerate(shared['stores']):
+        print(f"Store {i}: {store['nodes']} nodes, {store['links']} links, {mb(sum(store['breakdown'].values()))}")
+        for part, size in store['breakdown'].items():
+            print(f"  {part:<14} {mb(size):>12}")
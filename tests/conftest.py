@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The api modules import each other by name and read their data from paths
+# relative to the repository root, like when the server is started there
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'api'))
+os.chdir(root)
+os.environ.setdefault('VAST_CACHE_DIR', tempfile.mkdtemp(prefix='vast-cache-'))
+os.environ.setdefault('VAST_WARM_UP', '0')
@@ -0,0 +1,43 @@
+import json
+import threading
+
+import artifact_store
+
+# The manifest is shared by every thread building artifacts
+
+
+def test_manifest_is_written_while_fingerprints_are_added(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact_store, 'cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.setattr(artifact_store, '_manifest', None)
+    (tmp_path / 'cache').mkdir()
+    files = []
+    for i in range(2000):
+        path = tmp_path / f'file{i}.txt'
+        path.write_text(str(i))
+        files.append(str(path))
+
+    errors = []
+    done = threading.Event()
+    def fingerprint():
+        try:
+            for path in files:
+                artifact_store.file_fingerprint(path)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+    def write():
+        try:
+            while not done.is_set():
+                artifact_store.write_manifest()
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=fingerprint), threading.Thread(target=write)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    artifact_store.write_manifest()
+    with open(artifact_store.manifest_path()) as file:
+        assert len(json.load(file)['files']) == len(files)
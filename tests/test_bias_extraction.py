@@ -0,0 +1,169 @@
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import bias_detection
+import bias_extraction
+import bias_store
+import metrics
+
+# The extraction job against a local stub of the Groq chat completions API.
+# Every article's text names it, so the stub knows which article a request
+# is for, and answers with the scripted responses of that article in turn.
+
+
+class StubServer:
+    """Chat completions server answering from a script per article."""
+
+    def __init__(self):
+        self.script = {}
+        self.requests = []
+        self.contents = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                articleid = re.search(r'ARTICLE <(.*?)>', body['messages'][0]['content']).group(1)
+                stub.requests.append(articleid)
+                stub.contents[articleid] = body['messages'][0]['content']
+                responses = stub.script.get(articleid) or []
+                status, content = responses.pop(0) if len(responses) > 1 else (responses or [(200, {'Positive Bias': [articleid]})])[0]
+                if status == 200:
+                    if not isinstance(content, str):
+                        content = json.dumps(content)
+                    payload = {
+                        'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': bias_extraction.bias_model,
+                        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}]
+                    }
+                else:
+                    payload = {'error': {'message': content, 'type': 'stub'}}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    server = StubServer()
+    server.thread.start()
+    articles = tmp_path / 'articles'
+    bias = tmp_path / 'bias'
+    articles.mkdir()
+    bias.mkdir()
+    for articleid in ('a', 'b', 'c'):
+        (articles / f'{articleid}.txt').write_text(f'ARTICLE <{articleid}>')
+    monkeypatch.setenv('GROQ_BASE_URL', server.url)
+    monkeypatch.setenv('GROQ_API_KEY', 'stub')
+    monkeypatch.setattr(bias_detection, 'articles_base_path', f'{articles}/')
+    monkeypatch.setattr(bias_store, 'bias_base_path', f'{bias}/')
+    monkeypatch.setattr(bias_extraction, 'extraction_backoff', 0.001)
+    monkeypatch.setattr(bias_extraction, '_failed', {})
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+def run(article_ids, retries=3):
+    return bias_extraction.run_extraction(article_ids, concurrency=2, rate_limit=0, retries=retries)
+
+def stored(articleid):
+    with open(bias_extraction.bias_path(articleid), 'r') as file:
+        return json.load(file)
+
+
+def test_repeated_articles_are_requested_once(stub):
+    stats = run(['a', 'b', 'a', None, '', 'a', 'b'])
+    assert sorted(stub.requests) == ['a', 'b']
+    assert stats['written'] == 2 and not stats['failed']
+    assert stored('a') == {'Positive Bias': ['a']}
+
+def test_articles_are_sent_as_ingested(stub):
+    path = os.path.join(bias_detection.articles_base_path, 'a.txt')
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('ARTICLE <a>\nSecond line  \nThird line')
+    run(['a'])
+    assert stub.contents['a'].endswith('\nARTICLE <a>\nSecond line  \nThird line')
+
+def test_retries_rate_limits_server_errors_and_malformed_json(stub):
+    stub.script = {
+        'a': [(429, 'slow down'), (200, {'Negative Bias': ['a']})],
+        'b': [(500, 'boom'), (503, 'unavailable'), (200, {'Negative Bias': ['b']})],
+        'c': [(200, 'not json {'), (200, {'Negative Bias': ['c']})]
+    }
+    stats = run(['a', 'b', 'c'])
+    assert stats['retries'] == 4 and stats['written'] == 3 and not stats['failed']
+    assert stub.requests.count('b') == 3
+    assert stored('b') == {'Negative Bias': ['b']}
+
+def failures():
+    return metrics.counters.get(('vast_bias_extraction_failures_total', ()), 0)
+
+def test_failures_are_reported_and_leave_no_file(stub, caplog):
+    stub.script = {'a': [(500, 'boom')]}
+    before = failures()
+    with caplog.at_level('WARNING', logger='vast.bias_extraction'):
+        stats = run(['a', 'b'], retries=2)
+    assert stub.requests.count('a') == 3
+    assert list(stats['failed']) == ['a']
+    assert failures() == before + 1
+    assert 'Bias extraction failed for a' in caplog.text
+    assert not os.path.exists(bias_extraction.bias_path('a'))
+    assert os.listdir(bias_store.bias_base_path) == ['b.json']
+
+def test_resume_skips_existing_outputs(stub):
+    bias_extraction.write_bias('a', {'Halo Effect': ['kept']})
+    stats = run(['a', 'b', 'c'])
+    assert sorted(stub.requests) == ['b', 'c']
+    assert stats['pending'] == 2
+    assert stored('a') == {'Halo Effect': ['kept']}
+
+def test_write_is_atomic(stub):
+    bias_extraction.write_bias('a', {'Halo Effect': ['first']})
+    with pytest.raises(TypeError):
+        bias_extraction.write_bias('a', {'Halo Effect': [object()]})
+    # The previous file is untouched and no temporary file is left behind
+    assert stored('a') == {'Halo Effect': ['first']}
+    assert os.listdir(bias_store.bias_base_path) == ['a.json']
+
+def test_background_job_remembers_failures(stub, monkeypatch):
+    monkeypatch.setattr(bias_extraction, 'background_extraction', True)
+    monkeypatch.setattr(bias_extraction, 'extraction_rate_limit', 0)
+    monkeypatch.setattr(bias_extraction, 'extraction_retries', 1)
+    written = []
+    monkeypatch.setattr(bias_extraction, 'listeners', [lambda: written.append(True)])
+    stub.script = {'a': [(500, 'boom')]}
+    assert bias_extraction.schedule(['a', 'b', 'a']) == 2
+    assert bias_extraction.wait(10)
+    assert written and os.path.exists(bias_extraction.bias_path('b'))
+    # The failed article is not requested again by later requests
+    assert bias_extraction.schedule(['a', 'b']) == 0
+    assert stub.requests.count('a') == 2
+
+def test_forked_child_can_start_its_own_job(monkeypatch):
+    # The parent's thread and lock state don't carry over to a forked worker
+    monkeypatch.setattr(bias_extraction, '_worker', threading.Thread(target=lambda: None))
+    monkeypatch.setattr(bias_extraction, '_queue', {'a': None})
+    with bias_extraction._queue_lock:
+        pid = os.fork()
+        if pid == 0:
+            ok = bias_extraction._worker is None and not bias_extraction._queue and bias_extraction._queue_lock.acquire(timeout=1)
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+import bias_store
+
+# The LRU over the bias files and the consolidated JSONL file, with a
+# capacity smaller than the number of articles
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    folder = tmp_path / 'bias'
+    folder.mkdir()
+    for i in range(10):
+        (folder / f'article{i}.json').write_text(json.dumps({'Positive Bias': [f'passage {i}']}))
+    monkeypatch.setattr(bias_store, 'bias_base_path', f'{folder}/')
+    monkeypatch.setattr(bias_store, 'consolidated_path', str(tmp_path / 'bias.jsonl'))
+    monkeypatch.setattr(bias_store, 'bias_cache_size', 3)
+    bias_store.invalidate()
+    yield folder
+    bias_store.invalidate()
+
+def consolidated_only(folder):
+    bias_store.consolidate()
+    for name in os.listdir(folder):
+        os.remove(folder / name)
+
+
+def test_bulk_load_stops_at_capacity(store):
+    consolidated_only(store)
+    assert bias_store.bulk_load() == 3
+    assert bias_store.stats()['size'] == 3
+    assert bias_store.stats()['indexed'] == 10
+
+def test_evicted_entries_are_read_from_the_consolidated_file(store):
+    consolidated_only(store)
+    for _ in range(2):
+        for i in range(10):
+            assert bias_store.get_bias(f'article{i}') == {'Positive Bias': [f'passage {i}']}
+    assert bias_store.stats()['evictions'] > 0
+    assert bias_store.get_bias('missing') is False
+    assert len(bias_store.all_biases()) == 10
+
+def test_newer_files_take_precedence(store):
+    bias_store.consolidate()
+    path = store / 'article7.json'
+    path.write_text(json.dumps({'Halo Effect': ['newer']}))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, os.stat(bias_store.consolidated_path).st_mtime_ns + 10 ** 9))
+    bias_store.invalidate()
+    assert bias_store.get_bias('article7') == {'Halo Effect': ['newer']}
+    assert bias_store.all_biases()['article7'] == {'Halo Effect': ['newer']}
+    assert bias_store.get_bias('article2') == {'Positive Bias': ['passage 2']}
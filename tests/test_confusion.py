@@ -0,0 +1,103 @@
+import os
+
+import pandas as pd
+import pytest
+
+import pipeline
+
+# The vectorized confusion counts against the original per-article loop of
+# api/index.py, kept here as the reference
+
+
+def reference_confusion(source_df, edges_df, algorithm):
+    edge_types = edges_df['type'].unique()
+    algorithm_edges = edges_df[edges_df['_algorithm'] == algorithm].copy()
+    confusion = {et: {'TP': 0, 'FP': 0, 'FN': 0} for et in edge_types}
+    for _, row in source_df.iterrows():
+        source = row['source']
+        source_part = source.split('__')[-1].replace('.txt', '')
+        truth_edges = row['edge_types']
+        source_edges = algorithm_edges[algorithm_edges['_raw_source'] == source_part]['type'].value_counts()
+        for et in edge_types:
+            truth_count = truth_edges.get(et, 0)
+            count = source_edges.get(et, 0)
+            confusion[et]['TP'] += min(truth_count, count)
+            confusion[et]['FP'] += max(0, count - truth_count)
+            confusion[et]['FN'] += max(0, truth_count - count)
+    conf_df = pd.DataFrame(confusion).T.fillna(0)
+    conf_df.index = conf_df.index.map(pipeline.edge_type_descriptions)
+    return conf_df
+
+def reference_fp_rates(conf_df):
+    return (conf_df['FP'] / (conf_df['TP'] + conf_df['FP'])).fillna(0)
+
+def assert_same(source_df, edges_df, algorithms):
+    confusion = pipeline.confusion_by_algorithm(source_df, edges_df, algorithms)
+    for algorithm in algorithms:
+        expected = reference_confusion(source_df, edges_df, algorithm)
+        assert confusion[algorithm].to_dict() == expected[['TP', 'FP', 'FN']].to_dict()
+        assert pipeline.compute_fp_rates(confusion[algorithm]).to_dict() == reference_fp_rates(expected).to_dict()
+
+def article(file, **counts):
+    return {'source': file, 'filename': file, 'edge_types': counts}
+
+def edge(algorithm, raw_source, edge_type):
+    return {'source': 'a', 'target': 'b', '_algorithm': algorithm, '_raw_source': raw_source, 'type': edge_type}
+
+
+@pytest.fixture
+def edges_df():
+    return pd.DataFrame([
+        edge('ShadGPT', 'Lomark Daily', 'Event.Aid'),
+        edge('ShadGPT', 'Lomark Daily', 'Event.Aid'),
+        edge('ShadGPT', 'Lomark Daily', 'Event.Invest'),
+        edge('ShadGPT', 'The News Buoy', 'Event.Fishing'),
+        edge('BassLine', 'Lomark Daily', 'Event.Aid'),
+        edge('BassLine', 'Haacklee Herald', 'Event.Fishing'),
+        # Exactly the ground truth, no false positive or negative
+        edge('Exact', 'Lomark Daily', 'Event.Aid'),
+        edge('Exact', 'The News Buoy', 'Event.Fishing'),
+        edge('Exact', 'The News Buoy', 'Event.Fishing'),
+    ])
+
+def test_no_keyword_hits(edges_df):
+    source_df = pd.DataFrame([], columns=['source', 'filename', 'edge_types'])
+    assert_same(source_df, edges_df, ['ShadGPT', 'BassLine', 'Exact'])
+
+def test_all_hits(edges_df):
+    source_df = pd.DataFrame([
+        article('A__0__0__Lomark Daily.txt', **{'Event.Aid': 2, 'Event.Invest': 1}),
+        article('B__0__0__The News Buoy.txt', **{'Event.Fishing': 1}),
+    ])
+    confusion = pipeline.confusion_by_algorithm(source_df, edges_df, ['ShadGPT'])['ShadGPT']
+    assert confusion['FP'].sum() == 0 and confusion['FN'].sum() == 0
+    assert_same(source_df, edges_df, ['ShadGPT', 'BassLine', 'Exact'])
+
+def test_mixed_counts(edges_df):
+    source_df = pd.DataFrame([
+        article('A__0__0__Lomark Daily.txt', **{'Event.Aid': 1}),
+        article('A__0__1__Lomark Daily.txt', **{'Event.Aid': 1, 'Event.Fishing': 3}),
+        article('B__0__0__The News Buoy.txt', **{'Event.Fishing': 2, 'Event.Criticize': 4}),
+        article('C__0__0__Haacklee Herald.txt', **{'Event.Invest': 1}),
+    ])
+    confusion = pipeline.confusion_by_algorithm(source_df, edges_df, ['Exact'])['Exact']
+    assert confusion.loc[pipeline.edge_type_descriptions['Event.Fishing'], 'FP'] == 0
+    assert_same(source_df, edges_df, ['ShadGPT', 'BassLine', 'Exact', 'Missing'])
+
+@pytest.mark.skipif(not os.path.exists(pipeline.graph_path), reason="no sample graph")
+def test_sample_graph():
+    store = pipeline.load_graph_store()
+    edges_df = store.edges_frame().astype({'_algorithm': object, '_raw_source': object, 'type': object})
+    texts = {}
+    for file in sorted(os.listdir(pipeline.articles_folder)):
+        if file.endswith('.txt'):
+            with open(os.path.join(pipeline.articles_folder, file), 'r', encoding='utf-8') as f:
+                texts[file] = f.read().lower()
+    source_df = pd.DataFrame([
+        article(file, **counts) for file, counts in (
+            (file, {et: sum(text.count(kw) for kw in kws) for et, kws in pipeline.edge_keywords.items()})
+            for file, text in texts.items()
+        ) if any(counts.values())
+    ])
+    source_df['edge_types'] = source_df['edge_types'].map(lambda counts: {et: c for et, c in counts.items() if c})
+    assert_same(source_df, edges_df, ['ShadGPT', 'BassLine'])
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import index
+import pipeline
+
+# POST /evaluate: the current table gives the published numbers, every
+# keyword of a request is matched the same way, unknown edge types are
+# rejected
+
+pytestmark = pytest.mark.skipif(not os.path.exists(pipeline.graph_path), reason="no sample graph")
+
+client = TestClient(index.app)
+
+
+def evaluate(edge_keywords, **body):
+    return client.post('/evaluate', json={'edge_keywords': edge_keywords, **body})
+
+def test_current_table_gives_the_published_numbers():
+    response = evaluate(pipeline.edge_keywords)
+    assert response.status_code == 200
+    published = client.get('/confusion').json()
+    assert {key: response.json()[key] for key in published} == published
+    assert response.json()['unknown_keywords'] == []
+
+def test_unknown_edge_types_are_rejected():
+    response = evaluate({'Event.Aid': ['aid'], 'Event.Nonsense': ['aid']}, match='word')
+    assert response.status_code == 422
+    assert 'Event.Nonsense' in response.json()['detail']
+
+def test_scan_mode_only_takes_scanned_keywords():
+    response = evaluate({'Event.Aid': ['aid', 'zzqx relief']})
+    assert response.status_code == 422
+    assert 'zzqx relief' in response.json()['detail']
+    assert evaluate({'Event.Aid': ['aid']}, match='bogus').status_code == 422
+
+def ground_truth(result, edge_type):
+    # Keyword count of the edge type over the articles, TP + FN
+    confusion, edge = result['shadgpt_confusion'], pipeline.edge_type_descriptions[edge_type]
+    return confusion['TP'][edge] + confusion['FN'][edge]
+
+def test_word_mode_matches_whole_words_only():
+    # The scan counts 'fish' inside 'fishing', whole word matching does not
+    scan = evaluate({'Event.Fishing': ['fish']}).json()
+    word = evaluate({'Event.Fishing': ['fish']}, match='word').json()
+    both = evaluate({'Event.Fishing': ['fish', 'fishing']}, match='word').json()
+    assert ground_truth(scan, 'Event.Fishing') > ground_truth(word, 'Event.Fishing')
+    assert ground_truth(both, 'Event.Fishing') > ground_truth(word, 'Event.Fishing')
+    assert evaluate({'Event.Fishing': ['zzqx']}, match='word').json()['unknown_keywords'] == ['zzqx']
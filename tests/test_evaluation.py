@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+import evaluation
+import pipeline
+
+# The long format report of the evaluation library
+
+pytestmark = pytest.mark.skipif(not os.path.exists(pipeline.graph_path), reason="no sample graph")
+
+
+def test_report_has_one_row_per_flow():
+    results = evaluation.evaluate_snapshot(evaluation.load_corpus(), pipeline.graph_path)
+    report = evaluation.report_frame('sample', results)
+    sankey = report[report['table'] == 'sankey']
+    keys = ['snapshot', 'algorithm', 'sentiment', 'edge_type']
+    assert not sankey.duplicated(keys).any()
+    flows = results['sankey']
+    assert len(sankey) == len(flows.drop_duplicates(['algorithm', 'sentiment', 'edge_type']))
+    for column, total in (('total', 'total_count'), ('tp', 'tp_count'), ('fp', 'fp_count')):
+        assert sankey[column].sum() == flows[total].sum()
+    assert (sankey['fp_rate'] == sankey['fp'] / sankey['total']).all()
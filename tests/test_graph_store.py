@@ -0,0 +1,51 @@
+import json
+
+import bias_detection
+import graph_store
+import pipeline
+
+# Every module shares one store of the graph
+
+
+def write_graph(path, links):
+    graph = {
+        'directed': True, 'multigraph': True, 'graph': {},
+        'nodes': [{'id': 'a', 'type': 'Entity.Organization'}, {'id': 'b', 'type': 'Entity.Person'}],
+        'links': [
+            {'source': 'a', 'target': 'b', 'type': 'Event.Aid', '_algorithm': 'ShadGPT', '_raw_source': 'Lomark Daily', '_articleid': f'x{i}'}
+            for i in range(links)
+        ]
+    }
+    path.write_text(json.dumps(graph))
+
+def test_pipeline_and_bias_detection_share_the_store():
+    assert pipeline.graph_path == bias_detection.data_path == graph_store.graph_path
+
+def test_files_with_the_same_content_share_one_store(tmp_path):
+    write_graph(tmp_path / 'one.json', 3)
+    write_graph(tmp_path / 'two.json', 3)
+    store = graph_store.load_store(str(tmp_path / 'one.json'))
+    assert graph_store.load_store(str(tmp_path / 'two.json')) is store
+    assert store.number_of_edges() == 3
+
+def test_changed_files_drop_their_previous_store(tmp_path):
+    path = tmp_path / 'graph.json'
+    write_graph(path, 2)
+    previous = graph_store.load_store(str(path))
+    write_graph(path, 4)
+    store = graph_store.load_store(str(path))
+    assert store is not previous and store.number_of_edges() == 4
+    assert all(held is not previous for held in graph_store.held_stores().values())
+
+def test_unreadable_snapshots_are_logged(tmp_path, caplog):
+    path = str(tmp_path / 'graph.json')
+    write_graph(path=tmp_path / 'graph.json', links=2)
+    fingerprint = graph_store.artifact_store.file_fingerprint(path)
+    graph_store.open_store(path, fingerprint)
+    folder = graph_store.snapshot_path(path, fingerprint)
+    with open(f'{folder}/meta.json', 'w') as file:
+        file.write('not json {')
+    with caplog.at_level('WARNING', logger='vast.graph_store'):
+        store = graph_store.open_store(path, fingerprint)
+    assert store.number_of_edges() == 2
+    assert 'Ignoring graph snapshot' in caplog.text
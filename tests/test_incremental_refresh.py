@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import pipeline
+
+# A refresh after articles were changed, added and removed publishes the same
+# responses as a full build over the new files. Both run in their own
+# interpreter in a copy of the sample dataset, without the artifact cache.
+
+pytestmark = pytest.mark.skipif(not os.path.exists(pipeline.graph_path), reason="no sample graph")
+
+api_folder = os.path.abspath('./api/')
+
+responses = '''
+import json
+import os
+import sys
+sys.path.insert(0, {api_folder!r})
+from fastapi.testclient import TestClient
+import doc_terms
+import index
+import refresh
+import text_index
+
+def snapshot(client):
+    return {{
+        'sankey': client.get('/sankey', params={{'top': 100}}).json(),
+        'confusion': client.get('/confusion').json(),
+        'evaluate': client.post('/evaluate', json={{'edge_keywords': {{'Event.Aid': ['aid', 'zzqx fishing']}}, 'match': 'word'}}).json(),
+        'search': client.get('/search', params={{'q': 'zzqx fishing'}}).json(),
+        'evidence': client.get('/evidence', params={{'edge_type': 'Event.Aid', 'limit': 1000}}).json()
+    }}
+
+client = TestClient(index.app)
+if sys.argv[1] == 'refresh':
+    refresh.record_baseline()
+    snapshot(client)
+    refresh.refresh()
+    folder = './api/articles'
+    files = sorted(os.listdir(folder))
+    with open(os.path.join(folder, files[0]), 'a', encoding='utf-8') as f:
+        f.write(' zzqx fishing aid relief')
+    os.remove(os.path.join(folder, files[1]))
+    with open(os.path.join(folder, files[2]), encoding='utf-8') as f:
+        text = f.read()
+    publication = files[2].split('__')[-1]
+    with open(os.path.join(folder, '0000 New Company__0__0__' + publication), 'w', encoding='utf-8') as f:
+        f.write(text + ' zzqx fishing')
+    with open(os.path.join(folder, 'zzzz New Company__0__0__' + publication), 'w', encoding='utf-8') as f:
+        f.write('aid aid zzqx fishing')
+    # Only the changed articles are counted and indexed
+    def full_build(*args):
+        raise AssertionError("rebuilt over the whole corpus")
+    doc_terms.build_doc_terms = text_index.build_text_index = full_build
+    summary = refresh.refresh()
+    assert summary['articles_changed'] == 3 and summary['articles_removed'] == 1, summary
+print(json.dumps(snapshot(client)))
+'''
+
+
+def run(dataset, mode):
+    env = {**os.environ, 'VAST_CACHE_DIR': '', 'VAST_WARM_UP': '0', 'VAST_BIAS_BACKGROUND': '0'}
+    output = subprocess.run(
+        [sys.executable, '-c', responses.format(api_folder=api_folder), mode],
+        cwd=dataset, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def test_refresh_matches_a_full_build(tmp_path):
+    dataset = tmp_path / 'dataset'
+    shutil.copytree('./api/articles', dataset / 'api' / 'articles')
+    shutil.copy(pipeline.graph_path, dataset / 'api' / 'mc1.json')
+    refreshed = run(dataset, 'refresh')
+    full = run(dataset, 'full')
+    assert refreshed['search']['total_hits'] > 0
+    for name in full:
+        assert refreshed[name] == full[name], name
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import index
+import layout
+import pipeline
+import subgraph
+
+# Node positions are computed from the node selection alone, the paged and
+# streamed /nodes never build the enriched subgraph
+
+pytestmark = pytest.mark.skipif(not os.path.exists(pipeline.graph_path), reason="no sample graph")
+
+filters = [
+    subgraph.normalize_params(100),
+    subgraph.normalize_params(50, edge_types=['Event.Aid']),
+    subgraph.normalize_params(0, algorithms=['BassLine'], node_types=['Entity.Organization.Company'])
+]
+
+
+@pytest.mark.parametrize('params', filters)
+def test_positions_match_the_layout_of_the_enriched_subgraph(params):
+    graph = subgraph.build_subgraph(params)
+    node_ids = [node['id'] for node in graph['nodes']]
+    pos = layout.compute_layout(len(node_ids), *layout.edge_arrays(node_ids, graph['links'])).round(2)
+    expected = {node_id: (float(x), float(y)) for node_id, (x, y) in zip(node_ids, pos)}
+    assert layout.get_positions(params) == expected
+
+@pytest.mark.parametrize('query', [
+    {'format': 'ndjson', 'page_size': 5},
+    {'format': 'ndjson', 'type': 'Event.Aid'},
+    {'page_size': 5},
+    {'page_size': 5, 'limit': 0}
+])
+def test_pages_and_streams_skip_the_enriched_subgraph(query, monkeypatch):
+    def enriched_subgraph(params):
+        raise AssertionError("the enriched subgraph was built")
+    monkeypatch.setattr(subgraph, 'build_subgraph', enriched_subgraph)
+    monkeypatch.setattr(index, 'load_subgraph', enriched_subgraph)
+    layout.evict()
+    subgraph.evict()
+    client = TestClient(index.app)
+    for path in ('/nodes', '/links'):
+        response = client.get(path, params=query)
+        assert response.status_code == 200
+    nodes = client.get('/nodes', params=query)
+    if query.get('format') == 'ndjson':
+        assert all('"x":' in line for line in nodes.text.splitlines())
+    else:
+        assert all('x' in node for node in nodes.json()['items'])
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import bias_detection
+import graph_store
+import index
+import pipeline
+import subgraph
+
+# Cursors of /links and /nodes, and the pages they lead to
+
+
+def test_cursors_round_trip():
+    for position in (0, 7, 999, 123456789):
+        assert subgraph.decode_cursor(subgraph.encode_cursor(position)) == position
+
+@pytest.mark.parametrize('cursor', ['@@@', '', '====', 'not a cursor', 'LTE', 'MTA$', 'é'])
+def test_invalid_cursors(cursor):
+    with pytest.raises(ValueError, match=r"^Invalid cursor "):
+        subgraph.decode_cursor(cursor)
+
+@pytest.mark.parametrize('path', ['/links', '/nodes'])
+def test_invalid_cursors_are_bad_requests(path):
+    client = TestClient(index.app)
+    response = client.get(path, params={'cursor': '@@@'})
+    assert response.status_code == 400
+    assert response.json() == {'detail': "Invalid cursor '@@@'"}
+
+def reference_records(kind, params):
+    # Every selected record, built from the whole selection at once
+    nodes, links_df = subgraph.select_links(params)
+    if kind == 'links':
+        return list(zip(links_df.index, subgraph.enrich_links(links_df).to_dict(orient='records')))
+    return list(zip(nodes.index, graph_store.node_records(nodes)))
+
+@pytest.mark.skipif(not os.path.exists(pipeline.graph_path), reason="no sample graph")
+@pytest.mark.parametrize('kind', ['links', 'nodes'])
+@pytest.mark.parametrize('params', [
+    subgraph.normalize_params(100),
+    subgraph.normalize_params(0, edge_types=['Event.Aid'], algorithms=['BassLine'])
+])
+def test_pages_read_only_their_rows(kind, params, monkeypatch):
+    expected = reference_records(kind, params)
+    subgraph.evict()
+    rows, cursor = [], None
+    while True:
+        result = subgraph.page(kind, params, None if cursor is None else subgraph.decode_cursor(cursor), page_size=7)
+        rows += result['items']
+        cursor = result['next_cursor']
+        if cursor is None:
+            break
+        # After the first page the selection is cached, and no page builds
+        # the frame of every link
+        def whole_frame(*args):
+            raise AssertionError("the whole link frame was built")
+        monkeypatch.setattr(subgraph, 'select_links', whole_frame)
+        monkeypatch.setattr(bias_detection.get_store(), 'links_frame', whole_frame)
+    assert rows == [record for _, record in expected]
@@ -0,0 +1,37 @@
+import os
+import signal
+
+import pytest
+from fastapi.testclient import TestClient
+
+import index
+import pipeline
+import refresh
+
+# Under serve.py a worker never refreshes itself: POST /refresh asks the
+# parent, which refreshes and replaces every worker
+
+pytestmark = pytest.mark.skipif(not os.path.exists(pipeline.graph_path), reason="no sample graph")
+
+
+def test_prefork_worker_asks_the_parent(monkeypatch):
+    signals = []
+    monkeypatch.setattr(refresh, 'supervisor_pid', 4321)
+    monkeypatch.setattr(refresh, 'generation', 3)
+    monkeypatch.setattr(os, 'kill', lambda pid, signum: signals.append((pid, signum)))
+    monkeypatch.setattr(refresh, 'refresh', lambda: pytest.fail("the worker refreshed itself"))
+    client = TestClient(index.app)
+
+    response = client.post('/refresh')
+    assert response.status_code == 202
+    assert response.json() == {'scheduled': True, 'generation': 3}
+    assert signals == [(4321, signal.SIGHUP)]
+    process = client.get('/ready').json()['process']
+    assert process['mode'] == 'prefork' and process['generation'] == 3
+
+def test_single_process_refreshes_itself(monkeypatch):
+    monkeypatch.setattr(refresh, 'refresh', lambda: {'published': []})
+    client = TestClient(index.app)
+    response = client.post('/refresh')
+    assert response.status_code == 200 and response.json() == {'published': []}
+    assert client.get('/ready').json()['process']['mode'] == 'single'